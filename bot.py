@@ -2,10 +2,16 @@
 Main Bot File for MX-BOT
 Instagram Download Telegram Bot - Complete Version
 """
+import io
 import os
+import re
 import json
+import time
 import logging
 import asyncio
+import functools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
@@ -18,7 +24,8 @@ from telegram.ext import (
     ContextTypes
 )
 from telegram.constants import ParseMode, ChatAction
-from telegram.error import TelegramError
+from telegram.error import BadRequest, TelegramError
+from telegram.request import HTTPXRequest
 
 from config import config
 from database import db
@@ -28,11 +35,12 @@ from utils import (
     generate_verification_code,
     extract_instagram_url,
     extract_media_url,
-    is_instagram_url,
-    is_ytdlp_supported_url,
+    INSTAGRAM_LINK_RE,
+    MEDIA_LINK_RE,
     is_valid_instagram_username,
     format_number,
     format_duration,
+    format_file_size,
     get_timestamp,
     rate_limiter,
     setup_logging
@@ -50,35 +58,291 @@ logger = logging.getLogger(__name__)
  WAITING_SESSION_FILE, WAITING_CHANNEL_ID, WAITING_USER_SEARCH,
  WAITING_MESSAGE_TO_USER, WAITING_IG_USERNAME, WAITING_IG_PASSWORD) = range(9)
 
+# Callback query patterns, compiled once at import
+PAT_ADD_ACCOUNT = re.compile(r"^add_account$")
+PAT_ADMIN_BROADCAST = re.compile(r"^admin_broadcast$")
+PAT_UPLOAD_SESSION = re.compile(r"^upload_session$")
+PAT_ADD_CHANNEL_LOCK = re.compile(r"^add_channel_lock$")
+PAT_ADMIN_SEARCH_USER = re.compile(r"^admin_search_user$")
+PAT_SEND_TO_USER = re.compile(r"^send_to_user:")
+PAT_ADD_ADMIN_IG_ACCOUNT = re.compile(r"^add_admin_ig_account$")
+PAT_CHECK_VERIFICATION = re.compile(r"^check_verification:")
+PAT_CHECK_MEMBERSHIP = re.compile(r"^check_membership$")
+PAT_CHECK_SESSION_STATUS = re.compile(r"^check_session_status$")
+PAT_RELOGIN_SESSION = re.compile(r"^relogin_session$")
+PAT_QUALITY_SELECTION = re.compile(r"^dl:")
+
+# Per-user membership results are reused for this many seconds
+MEMBERSHIP_CACHE_TTL = 60
+
+# Admin user lists show this many users per page
+USERS_PAGE_SIZE = 10
+
+# Worker threads for the remaining blocking calls run via asyncio.to_thread
+# (yt-dlp and instagrapi calls use the pools in downloader/instagram_handler)
+BLOCKING_IO_WORKERS = 8
+
+# Keep-alive connection pools for Bot API calls; getUpdates only needs one
+BOT_API_POOL_SIZE = 64
+BOT_API_POOL_TIMEOUT = 10
+# Seconds Telegram may hold a getUpdates request open when there is nothing new
+POLLING_TIMEOUT = 30
+# Only the update types the registered handlers consume
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+# Download progress edits the status message at most this often (Telegram
+# rate-limits message edits)
+DOWNLOAD_PROGRESS_INTERVAL = 2.0
+
+# Telegram shows a chat action for ~5s, so don't resend it sooner than this
+CHAT_ACTION_INTERVAL = 4.0
+
+# How long the bot's Instagram username is reused before re-reading it
+BOT_IG_USERNAME_TTL = 300
+
+# Known users only get their username/first name re-saved this often
+USER_REFRESH_INTERVAL = 3600
+
+# Quality buttons stop working after this many seconds, and only the buttons
+# of a user's last few links are kept
+DOWNLOAD_URL_TTL = 300
+DOWNLOAD_URLS_PER_USER = 5
+
+# Instagram username lookups: give up after this long, and remember misses
+IG_LOOKUP_TIMEOUT = 8
+IG_NOT_FOUND_TTL = 300
+
+# Background DM scan for pending verification codes; button presses only
+# trigger an extra scan if the last one is older than DM_SCAN_MIN_INTERVAL
+DM_SCAN_INTERVAL = 20
+DM_SCAN_MIN_INTERVAL = 10
+FOUND_CODE_TTL = 1800
+
+SESSION_MANAGEMENT_TEXT = """🔑 <b>مدیریت نشست‌های اینستاگرام</b>
+
+📊 <b>وضعیت فعلی:</b>
+👤 نام کاربری: @{username}
+🔹 وضعیت: {status}
+
+<b>گزینه‌ها:</b>
+• بررسی وضعیت - وضعیت اتصال را بررسی کنید
+• ورود مجدد - با نام کاربری و رمز عبور تلاش کنید
+• آپلود نشست - فایل سشن JSON را آپلود کنید"""
+
+# Broadcasts are sent concurrently in batches, paced to Telegram's ~30 msg/s limit
+BROADCAST_CONCURRENCY = 25
+BROADCAST_BATCH_SIZE = 100
+BROADCAST_RATE_LIMIT = 30
+BROADCAST_PROGRESS_INTERVAL = 1.0
+
+
+def _format_accounts_text(accounts) -> str:
+    """One status line per Instagram account"""
+    return "".join(
+        f"{'✅' if acc['is_verified'] else '⏳'} @{acc['instagram_username']}\n"
+        for acc in accounts
+    )
+
+
+def admin_only(handler):
+    """Reject non-admin users before running an admin handler"""
+    @functools.wraps(handler)
+    async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if update.effective_user.id not in self._admin_ids:
+            query = update.callback_query
+            if query:
+                try:
+                    await query.answer()
+                except BadRequest:
+                    pass  # Already answered by the dispatching callback
+                await query.message.edit_text(messages.ACCESS_DENIED)
+            else:
+                await update.message.reply_text(messages.ACCESS_DENIED)
+            return ConversationHandler.END
+        return await handler(self, update, context)
+    return wrapper
+
 
 class MXBot:
     def __init__(self):
         self.app = None
         self.bot_username = None
         self.instagram_initialized = False
+        self._admin_ids = self._load_admin_ids()
+        self._membership_cache = {}  # (user_id, channel_id) -> (is_member, expires_at)
+        self._last_action_ts = {}  # chat_id -> monotonic time of last chat action
+        self._bot_ig_username = None
+        self._bot_ig_username_ts = 0
+        self._known_users = {}  # user_id -> monotonic time of last add_user
+        self._ig_not_found = {}  # lowercased IG username -> negative cache expiry
+        self._found_codes = {}  # verification code seen in DMs -> expiry
+        self._last_dm_scan = float('-inf')
+        self._dm_scan_lock = asyncio.Lock()
+        self._dm_scanner_task = None
+
+        # Main menu button text -> handler, registered as exact-text filters
+        self._menu_buttons = {
+            "📥 دانلود": self._download_button,
+            "📱 حساب‌های من": self.accounts_menu,
+            "📊 آمار": self.stats_command,
+            "❓ راهنما": self.help_command,
+            "👨‍💼 پنل مدیریت": self.admin_panel,
+        }
+
+        # button_callback dispatch: exact callback data, then "prefix:" handlers
+        # which receive the text after the colon as an extra argument
+        self._callback_exact = {
+            "back_to_menu": self._back_to_menu,
+            "list_accounts": self._list_accounts,
+            "admin_panel": self.admin_stats_detailed,
+            "admin_stats": self.admin_stats_detailed,
+            "admin_channel_lock": self.admin_channel_lock,
+            "admin_users": self.admin_users,
+            "admin_banned_users": self.admin_banned_users,
+            "admin_instagram_accounts": self.admin_instagram_accounts,
+            "admin_settings": self.admin_settings,
+            "admin_sessions": self.admin_sessions_callback,
+            "cancel_action": self._cancel_action,
+        }
+        self._callback_prefix = {
+            "view_account": self._view_account,
+            "delete_account": self._delete_account,
+            "confirm_delete": self._confirm_delete,
+            "view_channel": self.view_channel,
+            "enable_channel": functools.partial(self.toggle_channel, action="enable"),
+            "disable_channel": functools.partial(self.toggle_channel, action="disable"),
+            "delete_channel": functools.partial(self.toggle_channel, action="delete"),
+            "admin_users_list": self.admin_users_list,
+            "view_user": self.view_user,
+            "ban_user": functools.partial(self.set_user_ban, banned=True),
+            "unban_user": functools.partial(self.set_user_ban, banned=False),
+        }
+
+    @staticmethod
+    def _load_admin_ids() -> frozenset:
+        """Build the set of admin user IDs from config"""
+        admin_id = config.snapshot.admin_id
+        if admin_id is None:
+            return frozenset()
+        if isinstance(admin_id, int):
+            return frozenset({admin_id})
+        return frozenset(admin_id)
+
+    def _remember_user(self, user):
+        """Save user to database unless it was saved recently"""
+        now = time.monotonic()
+        last_saved = self._known_users.get(user.id)
+        if last_saved is not None and now - last_saved < USER_REFRESH_INTERVAL:
+            return
+
+        db.add_user(user.id, user.username, user.first_name)
+        self._known_users[user.id] = now
+
+    def _activate_admin_session(self, username: str, client):
+        """Use a freshly logged-in client and store it as the primary admin account"""
+        instagram_handler.client = client
+        self.instagram_initialized = True
 
-    async def check_channel_membership(self, user_id: int, context: ContextTypes.DEFAULT_TYPE) -> bool:
+        session_file = str(session_manager.get_session_file(username))
+        db.add_admin_instagram_account(username, session_file, is_primary=True)
+        self._bot_ig_username = None
+
+    def _get_bot_ig_username(self) -> str:
+        """Get Instagram username users send verification codes to"""
+        if (self._bot_ig_username is None
+                or time.monotonic() - self._bot_ig_username_ts >= BOT_IG_USERNAME_TTL):
+            admin_accounts = db.get_admin_instagram_accounts()
+            if admin_accounts:
+                self._bot_ig_username = admin_accounts[0]['username']
+            else:
+                self._bot_ig_username = config.snapshot.instagram_username or "ربات"
+            self._bot_ig_username_ts = time.monotonic()
+        return self._bot_ig_username
+
+    async def _send_chat_action(self, context: ContextTypes.DEFAULT_TYPE, chat_id: int, action: str):
+        """Send chat action unless one is still showing in this chat"""
+        now = time.monotonic()
+        if now - self._last_action_ts.get(chat_id, float('-inf')) < CHAT_ACTION_INTERVAL:
+            return
+
+        if len(self._last_action_ts) > 10000:
+            self._last_action_ts = {
+                cid: ts for cid, ts in self._last_action_ts.items()
+                if now - ts < CHAT_ACTION_INTERVAL
+            }
+        self._last_action_ts[chat_id] = now
+
+        await context.bot.send_chat_action(chat_id=chat_id, action=action)
+
+    def _invalidate_membership_cache(self, user_id: int):
+        """Forget cached membership results for user"""
+        for key in [key for key in self._membership_cache if key[0] == user_id]:
+            del self._membership_cache[key]
+
+    async def _get_user_record(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Get current user's row with flags, fetched at most once per update"""
+        cached = context.user_data.get('_user_row')
+        if cached and cached[0] == update.update_id:
+            return cached[1]
+
+        record = db.fetch_profile(update.effective_user.id)
+        context.user_data['_user_row'] = (update.update_id, record)
+        return record
+
+    async def check_channel_membership(self, user_id: int, context: ContextTypes.DEFAULT_TYPE,
+                                       channels=None) -> bool:
         """Check if user is member of all required channels"""
-        channels = db.get_locked_channels()
+        if channels is None:
+            channels = db.get_locked_channels()
 
         if not channels:
             return True  # No channel lock
 
-        for channel in channels:
-            if not channel.get('is_active'):
-                continue
+        channel_ids = [ch.get('channel_id') for ch in channels if ch.get('is_active')]
 
-            channel_id = channel.get('channel_id')
-            try:
-                member = await context.bot.get_chat_member(chat_id=channel_id, user_id=user_id)
-                if member.status in ['left', 'kicked']:
+        # Serve recent results from cache, only ask Telegram about the rest
+        now = time.monotonic()
+        to_check = []
+        for channel_id in channel_ids:
+            cached = self._membership_cache.get((user_id, channel_id))
+            if cached and cached[1] > now:
+                if not cached[0]:
                     return False
-            except TelegramError as e:
-                logger.error(f"Error checking membership for {channel_id}: {e}")
+            else:
+                to_check.append(channel_id)
+
+        if not to_check:
+            return True
+
+        # Query all channels concurrently instead of one after another
+        results = await asyncio.gather(
+            *(context.bot.get_chat_member(chat_id=channel_id, user_id=user_id)
+              for channel_id in to_check),
+            return_exceptions=True
+        )
+
+        if len(self._membership_cache) > 10000:
+            # Drop expired entries so the cache stays bounded
+            self._membership_cache = {
+                key: value for key, value in self._membership_cache.items() if value[1] > now
+            }
+
+        expires_at = time.monotonic() + MEMBERSHIP_CACHE_TTL
+        is_member = True
+        for channel_id, member in zip(to_check, results):
+            if isinstance(member, TelegramError):
+                logger.error(f"Error checking membership for {channel_id}: {member}")
                 # If we can't check, assume they're not a member
-                return False
+                is_member = False
+                continue
+            if isinstance(member, BaseException):
+                raise member
+            joined = member.status not in ['left', 'kicked']
+            self._membership_cache[(user_id, channel_id)] = (joined, expires_at)
+            if not joined:
+                is_member = False
 
-        return True
+        return is_member
 
     async def check_membership_middleware(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
         """Middleware to check channel membership before processing"""
@@ -87,23 +351,23 @@ class MXBot:
             return False
 
         # Admin is exempt from channel lock
-        if user.id == config.admin_id:
+        if user.id in self._admin_ids:
             return True
 
         # Check if user is banned
-        if db.is_user_banned(user.id):
+        record = await self._get_user_record(update, context)
+        if record and record.is_banned == 1:
             if update.message:
                 await update.message.reply_text(messages.USER_BANNED_MESSAGE)
             return False
 
         # Check channel membership
-        if not await self.check_channel_membership(user.id, context):
-            channels = db.get_locked_channels()
-            channels_text = ""
-            for ch in channels:
-                if ch.get('is_active'):
-                    title = ch.get('channel_title') or ch.get('channel_username') or "کانال"
-                    channels_text += f"• {title}\n"
+        channels = db.get_locked_channels()
+        if not await self.check_channel_membership(user.id, context, channels):
+            channels_text = "".join(
+                f"• {ch.get('channel_title') or ch.get('channel_username') or 'کانال'}\n"
+                for ch in channels if ch.get('is_active')
+            )
 
             text = messages.CHANNEL_LOCK_REQUIRED.format(channels=channels_text)
 
@@ -128,13 +392,13 @@ class MXBot:
         user = update.effective_user
 
         # Add user to database
-        db.add_user(user.id, user.username, user.first_name)
+        self._remember_user(user)
 
         # Check membership
         if not await self.check_membership_middleware(update, context):
             return
 
-        is_admin = user.id == config.admin_id
+        is_admin = user.id in self._admin_ids
 
         await update.message.reply_text(
             messages.WELCOME,
@@ -157,20 +421,18 @@ class MXBot:
         if not await self.check_membership_middleware(update, context):
             return
 
-        user_id = update.effective_user.id
-        user = db.get_user(user_id)
-        accounts = db.get_user_instagram_accounts(user_id)
+        user = await self._get_user_record(update, context)
 
         if not user:
             await update.message.reply_text(messages.ERROR_OCCURRED)
             return
 
-        premium_status = "👑 وضعیت: کاربر ویژه" if user.get('is_premium') else ""
+        premium_status = "👑 وضعیت: کاربر ویژه" if user.is_premium else ""
 
         stats_text = messages.YOUR_STATS.format(
-            downloads=user['download_count'],
-            accounts=len([acc for acc in accounts if acc['is_verified']]),
-            join_date=user['created_at'][:10],
+            downloads=user.download_count,
+            accounts=user.verified_count,
+            join_date=user.created_at[:10],
             premium_status=premium_status
         )
 
@@ -190,10 +452,7 @@ class MXBot:
                 reply_markup=keyboards.account_management()
             )
         else:
-            accounts_text = ""
-            for acc in accounts:
-                status = "✅" if acc['is_verified'] else "⏳"
-                accounts_text += f"{status} @{acc['instagram_username']}\n"
+            accounts_text = _format_accounts_text(accounts)
 
             text = messages.ACCOUNTS_LIST.format(accounts=accounts_text)
             await update.message.reply_text(
@@ -205,7 +464,7 @@ class MXBot:
     async def add_account_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Start adding Instagram account"""
         query = update.callback_query
-        await query.answer()
+        await query.answer(cache_time=3)
 
         await query.message.edit_text(
             messages.ENTER_INSTAGRAM_USERNAME,
@@ -228,8 +487,33 @@ class MXBot:
 
         # Check if account exists on Instagram
         if self.instagram_initialized:
-            user_info = instagram_handler.get_user_info(username)
-            if not user_info:
+            lookup_key = username.lower()
+            not_found_until = self._ig_not_found.get(lookup_key)
+            if not_found_until is not None and not_found_until > time.monotonic():
+                user_info = None
+            else:
+                try:
+                    user_info = await asyncio.wait_for(
+                        instagram_handler.get_user_info_async(username),
+                        timeout=IG_LOOKUP_TIMEOUT
+                    )
+                except asyncio.TimeoutError:
+                    # Don't hold the user up when Instagram is stalled
+                    logger.warning(f"Instagram lookup for {username} timed out")
+                    user_info = {}
+
+                if user_info is None:
+                    now = time.monotonic()
+                    if len(self._ig_not_found) > 10000:
+                        # Drop expired entries so the cache stays bounded
+                        self._ig_not_found = {
+                            name: until for name, until in self._ig_not_found.items() if until > now
+                        }
+                    self._ig_not_found[lookup_key] = now + IG_NOT_FOUND_TTL
+                else:
+                    self._ig_not_found.pop(lookup_key, None)
+
+            if user_info is None:
                 await update.message.reply_text(
                     "❌ این نام کاربری در اینستاگرام یافت نشد! لطفاً نام کاربری صحیح را وارد کنید."
                 )
@@ -239,18 +523,11 @@ class MXBot:
         code = generate_verification_code()
         expires_at = datetime.now() + timedelta(minutes=30)
 
-        # Save to database
-        verification_id = db.create_verification(user_id, username, code, expires_at)
+        # Save verification and the account it tracks together
+        verification_id = db.create_verification_with_account(user_id, username, code, expires_at)
 
-        # Also add to instagram_accounts for tracking
-        db.add_instagram_account(user_id, username, code, expires_at)
-
-        # Get admin Instagram accounts for verification
-        admin_accounts = db.get_admin_instagram_accounts()
-        if admin_accounts:
-            bot_ig_username = admin_accounts[0]['username']
-        else:
-            bot_ig_username = config.instagram_username or "ربات"
+        # Instagram account users should send the code to
+        bot_ig_username = self._get_bot_ig_username()
 
         # Send verification instructions
         text = messages.VERIFICATION_CODE_SENT.format(
@@ -270,22 +547,24 @@ class MXBot:
     async def check_verification(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Check if verification code was sent"""
         query = update.callback_query
-        await query.answer("در حال بررسی...")
+        await query.answer("در حال بررسی...", cache_time=10)
 
         # Extract verification ID
-        verification_id = int(query.data.split(':')[1])
+        verification_id = int(query.data.partition(':')[2])
         verification = db.get_verification(verification_id)
 
         if not verification:
             await query.message.edit_text("❌ کد تایید منقضی شده است!")
             return
 
-        # Check Instagram DMs for the code
-        await query.message.edit_text(messages.VERIFICATION_PENDING)
-
-        code_found = False
-        if self.instagram_initialized:
-            code_found = instagram_handler.check_direct_message(verification['verification_code'])
+        # Show the pending status while Instagram DMs are checked for the code
+        code = verification['verification_code']
+        pending = query.message.edit_text(messages.VERIFICATION_PENDING)
+        if self.instagram_initialized and code not in self._found_codes:
+            await asyncio.gather(pending, self._scan_dm_codes(), return_exceptions=True)
+        else:
+            await pending
+        code_found = self._found_codes.pop(code, None) is not None
 
         if code_found:
             # Mark account as verified
@@ -308,8 +587,7 @@ class MXBot:
                 parse_mode=ParseMode.HTML
             )
         else:
-            admin_accounts = db.get_admin_instagram_accounts()
-            bot_ig_username = admin_accounts[0]['username'] if admin_accounts else config.instagram_username or "ربات"
+            bot_ig_username = self._get_bot_ig_username()
 
             fail_text = messages.VERIFICATION_FAILED.format(
                 bot_username=bot_ig_username
@@ -326,27 +604,35 @@ class MXBot:
         query = update.callback_query
         user_id = update.effective_user.id
 
+        # User says they just joined, so don't trust cached results
+        self._invalidate_membership_cache(user_id)
+
         if await self.check_channel_membership(user_id, context):
-            await query.answer("✅ عضویت تایید شد!")
-            await query.message.edit_text(messages.MEMBERSHIP_VERIFIED)
-
-            # Show main menu
-            is_admin = user_id == config.admin_id
-            await query.message.reply_text(
-                messages.WELCOME,
-                reply_markup=keyboards.main_menu(is_admin),
-                parse_mode=ParseMode.HTML
+            # Answer, confirm and show the main menu in parallel
+            is_admin = user_id in self._admin_ids
+            results = await asyncio.gather(
+                query.answer("✅ عضویت تایید شد!"),
+                query.message.edit_text(messages.MEMBERSHIP_VERIFIED),
+                query.message.reply_text(
+                    messages.WELCOME,
+                    reply_markup=keyboards.main_menu(is_admin),
+                    parse_mode=ParseMode.HTML
+                ),
+                return_exceptions=True
             )
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error(f"Membership confirmation failed: {result}")
         else:
             await query.answer("❌ هنوز عضو نشده‌اید!", show_alert=True)
 
-    async def ytdlp_download_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def ytdlp_download_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                                     url: str = None):
         """Handle download requests for yt-dlp supported URLs"""
         user_id = update.effective_user.id
 
         # Add user to database if not exists
-        user = update.effective_user
-        db.add_user(user_id, user.username, user.first_name)
+        self._remember_user(update.effective_user)
 
         # Check membership
         if not await self.check_membership_middleware(update, context):
@@ -360,26 +646,32 @@ class MXBot:
             )
             return
 
-        text = update.message.text
-        url = extract_media_url(text)
+        if url is None:
+            url = extract_media_url(update.message.text)
 
         if not url:
             await update.message.reply_text(messages.INVALID_LINK)
             return
 
-        # Store URL in context for later use
-        context.user_data['download_url'] = url
+        # Store URL in context under the key the quality buttons carry, valid
+        # for a few minutes like SETEX; only the newest few are kept per user
+        urls = context.user_data.setdefault('download_urls', OrderedDict())
+        key = keyboards.url_key(url)
+        urls[key] = (url, time.monotonic() + DOWNLOAD_URL_TTL)
+        urls.move_to_end(key)
+        while len(urls) > DOWNLOAD_URLS_PER_USER:
+            urls.popitem(last=False)
 
         # Get video info first
-        status_msg = await update.message.reply_text(messages.FETCHING_INFO)
-
-        try:
-            await context.bot.send_chat_action(
-                chat_id=update.effective_chat.id,
-                action=ChatAction.TYPING
+        status_msg, _ = await asyncio.gather(
+            update.message.reply_text(messages.FETCHING_INFO),
+            self._send_chat_action(
+                context, update.effective_chat.id, ChatAction.TYPING
             )
+        )
 
-            info = downloader.get_video_info(url)
+        try:
+            info = await downloader.get_video_info_async(url)
 
             if info:
                 # Format duration
@@ -411,7 +703,7 @@ class MXBot:
     async def handle_quality_selection(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle quality selection callback"""
         query = update.callback_query
-        await query.answer()
+        await query.answer(cache_time=3)
 
         data = query.data
 
@@ -421,9 +713,11 @@ class MXBot:
 
         if data.startswith("dl:"):
             parts = data.split(":", 2)
-            if len(parts) >= 2:
-                quality = parts[1]
-                url = context.user_data.get('download_url')
+            if len(parts) == 3:
+                quality, key = parts[1], parts[2]
+                url, expires_at = context.user_data.get('download_urls', {}).get(key, (None, 0))
+                if url and expires_at <= time.monotonic():
+                    url = None
 
                 if not url:
                     await query.message.edit_text("❌ خطا: لینک یافت نشد. لطفاً دوباره لینک را ارسال کنید.")
@@ -432,63 +726,96 @@ class MXBot:
                 await query.message.edit_text(messages.DOWNLOADING)
                 await self._perform_download(update, context, query.message, url, quality)
 
+    async def _show_download_progress(self, status_msg, queue: asyncio.Queue):
+        """Edit the status message with yt-dlp progress pushed onto queue"""
+        last_text = None
+        while True:
+            progress = await queue.get()
+            # Only the newest of the updates since the last edit is shown
+            while not queue.empty():
+                progress = queue.get_nowait()
+
+            total = progress.total_bytes
+            text = messages.DOWNLOAD_PROGRESS.format(
+                percent=f"{progress.downloaded_bytes * 100 // total}%" if total else "",
+                downloaded=format_file_size(progress.downloaded_bytes),
+                total=format_file_size(total) if total else "نامشخص",
+                speed=f"{format_file_size(progress.speed)}/s" if progress.speed else "نامشخص"
+            )
+            if text != last_text:
+                try:
+                    await status_msg.edit_text(text)
+                    last_text = text
+                except TelegramError as e:
+                    logger.warning(f"Could not update download progress: {e}")
+            await asyncio.sleep(DOWNLOAD_PROGRESS_INTERVAL)
+
     async def _perform_download(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
                                status_msg, url: str, quality: str):
         """Perform the actual download"""
         user_id = update.effective_user.id
 
         try:
-            await context.bot.send_chat_action(
-                chat_id=update.effective_chat.id,
-                action=ChatAction.UPLOAD_DOCUMENT
+            await self._send_chat_action(
+                context, update.effective_chat.id, ChatAction.UPLOAD_DOCUMENT
             )
 
             logger.info(f"Downloading with yt-dlp: {url} (quality: {quality})")
-            result = downloader.download_with_quality(url, quality)
+            progress = asyncio.Queue()
+            progress_task = asyncio.create_task(self._show_download_progress(status_msg, progress))
+            try:
+                result = await downloader.download_with_ytdlp_async(
+                    url, quality=quality, progress_queue=progress
+                )
+            finally:
+                progress_task.cancel()
+                await asyncio.gather(progress_task, return_exceptions=True)
 
             if result:
-                await status_msg.edit_text(messages.UPLOADING)
+                try:
+                    await status_msg.edit_text(messages.UPLOADING)
 
-                file_size = downloader.get_file_size(result['filepath'])
+                    file_size = await downloader.get_file_size_async(result['filepath'])
 
-                # Check file size (50MB limit)
-                if file_size > 50 * 1024 * 1024:
-                    await update.effective_message.reply_text(messages.FILE_TOO_LARGE)
-                    downloader.cleanup_file(result['filepath'])
-                    await status_msg.delete()
-                    return
+                    # Check file size (50MB limit)
+                    if file_size > 50 * 1024 * 1024:
+                        await update.effective_message.reply_text(messages.FILE_TOO_LARGE)
+                        await status_msg.delete()
+                        return
 
-                # Prepare caption with full info
-                duration_str = format_duration(result.get('duration', 0)) if result.get('duration') else "نامشخص"
-                views_str = format_number(result.get('view_count', 0)) if result.get('view_count') else "نامشخص"
-                likes_str = format_number(result.get('like_count', 0)) if result.get('like_count') else "نامشخص"
-
-                if result.get('is_audio'):
-                    caption = messages.AUDIO_DOWNLOAD_SUCCESS.format(
-                        title=result.get('title', 'Unknown'),
-                        uploader=result.get('uploader', 'Unknown'),
-                        duration=duration_str,
-                        url=result.get('webpage_url', url)
-                    )
-                else:
-                    caption = messages.DOWNLOAD_SUCCESS_YTDLP.format(
-                        title=result.get('title', 'Unknown'),
-                        uploader=result.get('uploader', 'Unknown'),
-                        duration=duration_str,
-                        views=views_str,
-                        likes=likes_str,
-                        upload_date=result.get('upload_date', 'نامشخص'),
-                        video_id=result.get('video_id', ''),
-                        url=result.get('webpage_url', url)
-                    )
+                    # Prepare caption with full info
+                    duration_str = format_duration(result.get('duration', 0)) if result.get('duration') else "نامشخص"
+                    views_str = format_number(result.get('view_count', 0)) if result.get('view_count') else "نامشخص"
+                    likes_str = format_number(result.get('like_count', 0)) if result.get('like_count') else "نامشخص"
+
+                    if result.get('is_audio'):
+                        caption = messages.AUDIO_DOWNLOAD_SUCCESS.format(
+                            title=result.get('title', 'Unknown'),
+                            uploader=result.get('uploader', 'Unknown'),
+                            duration=duration_str,
+                            url=result.get('webpage_url', url)
+                        )
+                    else:
+                        caption = messages.DOWNLOAD_SUCCESS_YTDLP.format(
+                            title=result.get('title', 'Unknown'),
+                            uploader=result.get('uploader', 'Unknown'),
+                            duration=duration_str,
+                            views=views_str,
+                            likes=likes_str,
+                            upload_date=result.get('upload_date', 'نامشخص'),
+                            video_id=result.get('video_id', ''),
+                            url=result.get('webpage_url', url)
+                        )
 
-                # Determine file type
-                ext = os.path.splitext(result['filepath'])[1].lower()
+                    # Determine file type
+                    ext = os.path.splitext(result['filepath'])[1].lower()
 
-                with open(result['filepath'], 'rb') as f:
+                    data = await downloader.read_file_async(result['filepath'])
+                    filename = os.path.basename(result['filepath'])
                     if ext in ['.mp3', '.m4a', '.wav', '.ogg', '.opus'] or result.get('is_audio'):
                         await update.effective_message.reply_audio(
-                            audio=f,
+                            audio=data,
+                            filename=filename,
                             caption=caption,
                             title=result.get('title', 'Unknown'),
                             performer=result.get('uploader', 'Unknown'),
@@ -496,24 +823,25 @@ class MXBot:
                         )
                     elif ext in ['.mp4', '.webm', '.mkv', '.mov']:
                         await update.effective_message.reply_video(
-                            video=f,
+                            video=data,
+                            filename=filename,
                             caption=caption,
                             parse_mode=ParseMode.HTML
                         )
                     else:
                         await update.effective_message.reply_document(
-                            document=f,
+                            document=data,
+                            filename=filename,
                             caption=caption,
                             parse_mode=ParseMode.HTML
                         )
 
-                # Cleanup
-                downloader.cleanup_file(result['filepath'])
-                await status_msg.delete()
+                    await status_msg.delete()
 
-                # Record download
-                db.add_download(user_id, 'ytdlp', url)
-                db.increment_download_count(user_id)
+                    # Record download
+                    db.record_downloads(user_id, [{'media_type': 'ytdlp', 'media_url': url}])
+                finally:
+                    await downloader.release_file_async(result['filepath'])
             else:
                 await status_msg.edit_text(
                     messages.DOWNLOAD_FAILED.format(error="دانلود ناموفق. لینک را بررسی کنید.")
@@ -525,7 +853,8 @@ class MXBot:
                 messages.DOWNLOAD_FAILED.format(error=str(e))
             )
 
-    async def download_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def download_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                               url: str = None):
         """Handle download requests for Instagram URLs"""
         user_id = update.effective_user.id
 
@@ -534,7 +863,8 @@ class MXBot:
             return
 
         # Check if user has verified account
-        if not db.has_verified_account(user_id):
+        record = await self._get_user_record(update, context)
+        if not record or not record.verified_count:
             await update.message.reply_text(messages.NO_VERIFIED_ACCOUNT, parse_mode=ParseMode.HTML)
             return
 
@@ -546,46 +876,49 @@ class MXBot:
             )
             return
 
-        text = update.message.text
-        url = extract_instagram_url(text)
+        if url is None:
+            url = extract_instagram_url(update.message.text)
 
         if not url:
             await update.message.reply_text(messages.INVALID_LINK)
             return
 
         # Send downloading message
-        status_msg = await update.message.reply_text(messages.DOWNLOADING)
-
-        try:
-            await context.bot.send_chat_action(
-                chat_id=update.effective_chat.id,
-                action=ChatAction.TYPING
+        status_msg, _ = await asyncio.gather(
+            update.message.reply_text(messages.DOWNLOADING),
+            self._send_chat_action(
+                context, update.effective_chat.id, ChatAction.TYPING
             )
+        )
 
+        try:
             # Get media info
             media_info = None
             if self.instagram_initialized:
-                media_info = instagram_handler.get_media_info(url)
+                media_info = await instagram_handler.get_media_info_async(url)
 
             if not media_info:
                 # Try yt-dlp as fallback
                 logger.info("Instagram download failed, trying yt-dlp")
-                result = downloader.download_with_ytdlp(url)
+                result = await downloader.download_with_ytdlp_async(url)
 
                 if result:
-                    await status_msg.edit_text(messages.UPLOADING)
+                    try:
+                        await status_msg.edit_text(messages.UPLOADING)
 
-                    with open(result['filepath'], 'rb') as f:
+                        data = await downloader.read_file_async(result['filepath'])
+                        filename = os.path.basename(result['filepath'])
                         await update.message.reply_document(
-                            document=f,
+                            document=data,
+                            filename=filename,
                             caption=f"📥 {result['title']}\n👤 {result['uploader']}"
                         )
 
-                    downloader.cleanup_file(result['filepath'])
-                    await status_msg.delete()
+                        await status_msg.delete()
 
-                    db.add_download(user_id, 'ytdlp', url)
-                    db.increment_download_count(user_id)
+                        db.record_downloads(user_id, [{'media_type': 'ytdlp', 'media_url': url}])
+                    finally:
+                        await downloader.release_file_async(result['filepath'])
                     return
                 else:
                     await status_msg.edit_text(
@@ -596,7 +929,9 @@ class MXBot:
             # Download with Instagram
             await status_msg.edit_text(messages.PROCESSING)
 
-            downloaded_files = instagram_handler.download_media(url, config.download_dir)
+            downloaded_files = await instagram_handler.download_media_async(
+                url, config.snapshot.download_dir
+            )
 
             if not downloaded_files:
                 await status_msg.edit_text(
@@ -616,46 +951,55 @@ class MXBot:
             )
 
             # Send files
+            sent_files = []
             for file_path in downloaded_files:
-                if not os.path.exists(file_path):
+                # A missing file reports size 0, so one stat covers both checks
+                file_size = await downloader.get_file_size_async(file_path)
+                if not file_size:
                     continue
 
-                file_size = downloader.get_file_size(file_path)
-
                 if file_size > 50 * 1024 * 1024:
                     await update.message.reply_text(messages.FILE_TOO_LARGE)
-                    downloader.cleanup_file(file_path)
+                    await downloader.cleanup_file_async(file_path)
                     continue
 
                 ext = os.path.splitext(file_path)[1].lower()
 
-                with open(file_path, 'rb') as f:
-                    if ext in ['.jpg', '.jpeg', '.png']:
-                        await update.message.reply_photo(
-                            photo=f,
-                            caption=caption,
-                            parse_mode=ParseMode.HTML
-                        )
-                    elif ext in ['.mp4', '.mov']:
-                        await update.message.reply_video(
-                            video=f,
-                            caption=caption,
-                            parse_mode=ParseMode.HTML
-                        )
-                    else:
-                        await update.message.reply_document(
-                            document=f,
-                            caption=caption,
-                            parse_mode=ParseMode.HTML
-                        )
+                data = await downloader.read_file_async(file_path)
+                filename = os.path.basename(file_path)
+                if ext in ['.jpg', '.jpeg', '.png']:
+                    await update.message.reply_photo(
+                        photo=data,
+                        filename=filename,
+                        caption=caption,
+                        parse_mode=ParseMode.HTML
+                    )
+                elif ext in ['.mp4', '.mov']:
+                    await update.message.reply_video(
+                        video=data,
+                        filename=filename,
+                        caption=caption,
+                        parse_mode=ParseMode.HTML
+                    )
+                else:
+                    await update.message.reply_document(
+                        document=data,
+                        filename=filename,
+                        caption=caption,
+                        parse_mode=ParseMode.HTML
+                    )
 
-                downloader.cleanup_file(file_path)
+                await downloader.cleanup_file_async(file_path)
 
-                db.add_download(user_id, media_info['media_type'], url,
-                              media_info['user']['username'], file_size)
+                sent_files.append({
+                    'media_type': media_info['media_type'],
+                    'media_url': url,
+                    'instagram_username': media_info['user']['username'],
+                    'file_size': file_size,
+                })
 
             await status_msg.delete()
-            db.increment_download_count(user_id)
+            db.record_downloads(user_id, sent_files)
 
         except Exception as e:
             logger.error(f"Download error: {e}")
@@ -667,7 +1011,7 @@ class MXBot:
         """Admin panel"""
         user_id = update.effective_user.id
 
-        if user_id != config.admin_id:
+        if user_id not in self._admin_ids:
             await update.message.reply_text("❌ شما دسترسی به پنل مدیریت ندارید!")
             return
 
@@ -693,36 +1037,29 @@ class MXBot:
     async def admin_stats_detailed(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show detailed admin statistics"""
         query = update.callback_query
-        await query.answer()
+        await query.answer(cache_time=3)
 
         # Get detailed stats
-        total_users = db.get_total_users()
-        today_users = db.get_today_users()
-        banned_users = db.get_banned_users_count()
-        total_downloads = db.get_total_downloads()
-        today_downloads = db.get_today_downloads()
-        verified_accounts = db.get_total_verified_accounts()
-        active_sessions = db.get_total_active_sessions()
+        stats = db.get_stats_summary()
         channels = db.get_locked_channels()
 
         # Downloads by type
-        downloads_by_type = db.get_downloads_by_type()
-        type_text = ""
-        for media_type, count in downloads_by_type.items():
-            type_text += f"   • {media_type}: {count}\n"
+        type_text = "".join(
+            f"   • {media_type}: {count}\n" for media_type, count in stats['downloads_by_type'].items()
+        )
 
         if not type_text:
             type_text = "   • هیچ دانلودی ثبت نشده\n"
 
         text = messages.ADMIN_STATS_DETAILED.format(
-            total_users=total_users,
-            today_users=today_users,
-            banned_users=banned_users,
-            total_downloads=total_downloads,
-            today_downloads=today_downloads,
+            total_users=stats['total_users'],
+            today_users=stats['today_users'],
+            banned_users=stats['banned_users'],
+            total_downloads=stats['total_downloads'],
+            today_downloads=stats['today_downloads'],
             downloads_by_type=type_text,
-            verified_accounts=verified_accounts,
-            active_sessions=active_sessions,
+            verified_accounts=stats['verified_accounts'],
+            active_sessions=stats['active_sessions'],
             channel_count=len(channels)
         )
 
@@ -735,7 +1072,7 @@ class MXBot:
     async def admin_channel_lock(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Channel lock management"""
         query = update.callback_query
-        await query.answer()
+        await query.answer(cache_time=3)
 
         channels = db.get_locked_channels()
         status = messages.CHANNEL_LOCK_ENABLED if channels else messages.CHANNEL_LOCK_DISABLED
@@ -751,7 +1088,7 @@ class MXBot:
     async def add_channel_lock_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Start adding channel to lock list"""
         query = update.callback_query
-        await query.answer()
+        await query.answer(cache_time=3)
 
         await query.message.edit_text(
             messages.ENTER_CHANNEL_ID,
@@ -766,7 +1103,7 @@ class MXBot:
         text = update.message.text.strip()
         user_id = update.effective_user.id
 
-        if user_id != config.admin_id:
+        if user_id not in self._admin_ids:
             return ConversationHandler.END
 
         # Parse channel identifier
@@ -809,19 +1146,12 @@ class MXBot:
 
         return ConversationHandler.END
 
-    async def view_channel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def view_channel(self, update: Update, context: ContextTypes.DEFAULT_TYPE, channel_id: str):
         """View channel details"""
         query = update.callback_query
         await query.answer()
 
-        channel_id = query.data.split(':')[1]
-        channels = db.get_locked_channels()
-
-        channel = None
-        for ch in channels:
-            if ch['channel_id'] == channel_id:
-                channel = ch
-                break
+        channel = db.get_channel(channel_id)
 
         if not channel:
             await query.message.edit_text("❌ کانال یافت نشد!")
@@ -843,21 +1173,19 @@ class MXBot:
             parse_mode=ParseMode.HTML
         )
 
-    async def toggle_channel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Enable/disable channel"""
+    async def toggle_channel(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                             channel_id: str, action: str):
+        """Enable/disable/delete channel"""
         query = update.callback_query
         await query.answer()
 
-        data = query.data
-        channel_id = data.split(':')[1]
-
-        if data.startswith('enable_channel:'):
+        if action == 'enable':
             db.toggle_channel_lock(channel_id, True)
             await query.answer("✅ کانال فعال شد!")
-        elif data.startswith('disable_channel:'):
+        elif action == 'disable':
             db.toggle_channel_lock(channel_id, False)
             await query.answer("❌ کانال غیرفعال شد!")
-        elif data.startswith('delete_channel:'):
+        elif action == 'delete':
             db.remove_channel_lock(channel_id)
             await query.answer("🗑 کانال حذف شد!")
 
@@ -875,17 +1203,23 @@ class MXBot:
             parse_mode=ParseMode.HTML
         )
 
-    async def admin_users_list(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def admin_users_list(self, update: Update, context: ContextTypes.DEFAULT_TYPE, page: str = '0'):
         """Show paginated users list"""
         query = update.callback_query
         await query.answer()
 
-        page = int(query.data.split(':')[1]) if ':' in query.data else 0
-        users = db.get_all_users()
+        page = int(page or 0)
+        users = db.get_users_page(page * USERS_PAGE_SIZE, USERS_PAGE_SIZE)
+
+        # Count once when the list is opened and reuse it while paging
+        total = context.user_data.get('users_total')
+        if page == 0 or total is None:
+            total = db.get_total_users()
+            context.user_data['users_total'] = total
 
         await query.message.edit_text(
-            f"👥 <b>لیست کاربران</b> (صفحه {page + 1})\n\nتعداد کل: {len(users)}",
-            reply_markup=keyboards.users_list(users, page),
+            f"👥 <b>لیست کاربران</b> (صفحه {page + 1})\n\nتعداد کل: {total}",
+            reply_markup=keyboards.users_list(users, page, USERS_PAGE_SIZE, total),
             parse_mode=ParseMode.HTML
         )
 
@@ -907,34 +1241,43 @@ class MXBot:
 
         users = db.search_users(query_text)
 
+        # Replies are sent in the background so the conversation ends right away;
+        # application.create_task keeps a reference and reports errors
         if not users:
-            await update.message.reply_text(
-                messages.USER_NOT_FOUND,
-                reply_markup=keyboards.back_button("admin_users")
+            context.application.create_task(
+                update.message.reply_text(
+                    messages.USER_NOT_FOUND,
+                    reply_markup=keyboards.back_button("admin_users")
+                ),
+                update=update
             )
             return ConversationHandler.END
 
+        # Keep the rows so picking a result doesn't query the same user again
+        context.user_data['user_cache'] = {u['user_id']: u for u in users}
+
         if len(users) == 1:
             # Show single user
             user = users[0]
             context.user_data['target_user_id'] = user['user_id']
-            await self._show_user_info(update.message, user)
+            reply = self._show_user_info(update.message, user)
         else:
             # Show list
-            await update.message.reply_text(
+            reply = update.message.reply_text(
                 f"🔍 {len(users)} کاربر یافت شد:",
                 reply_markup=keyboards.users_list(users, 0)
             )
+        context.application.create_task(reply, update=update)
 
         return ConversationHandler.END
 
-    async def view_user(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def view_user(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: str):
         """View user details"""
         query = update.callback_query
         await query.answer()
 
-        user_id = int(query.data.split(':')[1])
-        user = db.get_user(user_id)
+        user_id = int(user_id)
+        user = context.user_data.get('user_cache', {}).pop(user_id, None) or db.get_user(user_id)
 
         if not user:
             await query.message.edit_text(messages.USER_NOT_FOUND)
@@ -963,42 +1306,31 @@ class MXBot:
         else:
             await message.reply_text(text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
 
-    async def ban_user(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Ban user"""
-        query = update.callback_query
-        await query.answer()
-
-        user_id = int(query.data.split(':')[1])
-        db.ban_user(user_id)
-
-        await query.answer(messages.USER_BANNED.format(user_id=user_id), show_alert=True)
-
-        # Refresh user info
-        user = db.get_user(user_id)
-        if user:
-            await self._show_user_info(query.message, user, edit=True)
-
-    async def unban_user(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Unban user"""
+    async def set_user_ban(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                           user_id: str, banned: bool):
+        """Ban or unban user"""
         query = update.callback_query
         await query.answer()
 
-        user_id = int(query.data.split(':')[1])
-        db.unban_user(user_id)
-
-        await query.answer(messages.USER_UNBANNED.format(user_id=user_id), show_alert=True)
+        user_id = int(user_id)
+        alert = messages.USER_BANNED if banned else messages.USER_UNBANNED
+        alert_task = asyncio.create_task(
+            query.answer(alert.format(user_id=user_id), show_alert=True)
+        )
+        db.set_ban(user_id, banned)
 
-        # Refresh user info
+        # Refresh user info while the alert is being sent
         user = db.get_user(user_id)
         if user:
             await self._show_user_info(query.message, user, edit=True)
+        await asyncio.gather(alert_task, return_exceptions=True)
 
     async def admin_banned_users(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show banned users"""
         query = update.callback_query
         await query.answer()
 
-        users = [u for u in db.get_all_users() if u.get('is_banned')]
+        users = db.get_banned_users()
 
         await query.message.edit_text(
             f"🚫 <b>کاربران مسدود شده</b>\n\nتعداد: {len(users)}",
@@ -1011,7 +1343,7 @@ class MXBot:
         query = update.callback_query
         await query.answer()
 
-        user_id = int(query.data.split(':')[1])
+        user_id = int(query.data.partition(':')[2])
         context.user_data['target_user_id'] = user_id
 
         await query.message.edit_text(
@@ -1105,25 +1437,17 @@ class MXBot:
             await update.message.reply_text("❌ خطا: نام کاربری یافت نشد!")
             return ConversationHandler.END
 
-        # Delete password message for security
-        try:
-            await update.message.delete()
-        except:
-            pass
+        # Delete password message for security, overlapping with the login
+        delete_task = asyncio.create_task(update.message.delete())
 
         status_msg = await update.effective_chat.send_message("⏳ در حال ورود به اینستاگرام...")
 
         # Try to login
-        success, message, client = session_manager.login(username, password)
+        success, message, client = await asyncio.to_thread(session_manager.login, username, password)
+        await asyncio.gather(delete_task, return_exceptions=True)
 
         if success:
-            # Save to database
-            session_file = str(session_manager.get_session_file(username))
-            db.add_admin_instagram_account(username, session_file, is_primary=True)
-
-            # Update Instagram handler
-            instagram_handler.client = client
-            self.instagram_initialized = True
+            self._activate_admin_session(username, client)
 
             await status_msg.edit_text(
                 messages.IG_LOGIN_SUCCESS.format(username=username),
@@ -1155,32 +1479,62 @@ class MXBot:
         """Send broadcast message"""
         broadcast_text = update.message.text
 
-        users = db.get_all_users()
         sent_count = 0
-        total = len(users)
+        total = db.get_total_users()
 
         status_msg = await update.message.reply_text(
             messages.BROADCAST_PROGRESS.format(sent=0, total=total)
         )
 
-        for i, user in enumerate(users):
-            try:
-                await context.bot.send_message(
-                    chat_id=user['user_id'],
-                    text=broadcast_text,
-                    parse_mode=ParseMode.HTML
-                )
-                sent_count += 1
-
-                # Update progress every 10 users
-                if (i + 1) % 10 == 0:
-                    await status_msg.edit_text(
-                        messages.BROADCAST_PROGRESS.format(sent=sent_count, total=total)
+        semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+        done = asyncio.Event()
+
+        async def send_one(user_id: int):
+            nonlocal sent_count
+            async with semaphore:
+                try:
+                    await context.bot.send_message(
+                        chat_id=user_id,
+                        text=broadcast_text,
+                        parse_mode=ParseMode.HTML
                     )
+                    sent_count += 1
+                except Exception as e:
+                    logger.error(f"Failed to send to {user_id}: {e}")
+
+        async def update_progress():
+            # Edit the status at most once per interval, and only if it changed
+            shown = 0
+            while not done.is_set():
+                try:
+                    await asyncio.wait_for(done.wait(), BROADCAST_PROGRESS_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                if not done.is_set() and sent_count != shown:
+                    shown = sent_count
+                    try:
+                        await status_msg.edit_text(
+                            messages.BROADCAST_PROGRESS.format(sent=shown, total=total)
+                        )
+                    except TelegramError:
+                        pass
 
-                await asyncio.sleep(0.05)  # Rate limiting
-            except Exception as e:
-                logger.error(f"Failed to send to {user['user_id']}: {e}")
+        progress_task = asyncio.create_task(update_progress())
+        loop = asyncio.get_running_loop()
+        try:
+            # Only one batch of user IDs is held in memory at a time
+            for batch in db.iter_user_ids(BROADCAST_BATCH_SIZE):
+                batch_started = loop.time()
+                await asyncio.gather(*(send_one(user_id) for user_id in batch))
+
+                # Stay under Telegram's global limit of ~30 messages per second
+                min_duration = len(batch) / BROADCAST_RATE_LIMIT
+                elapsed = loop.time() - batch_started
+                if elapsed < min_duration:
+                    await asyncio.sleep(min_duration - elapsed)
+        finally:
+            done.set()
+            await progress_task
 
         await status_msg.edit_text(
             messages.BROADCAST_SENT.format(count=sent_count)
@@ -1205,138 +1559,102 @@ class MXBot:
         await query.answer()
 
         data = query.data
+        handler = self._callback_exact.get(data)
+        if handler is not None:
+            await handler(update, context)
+            return
 
-        if data == "back_to_menu":
-            user_id = update.effective_user.id
-            is_admin = user_id == config.admin_id
-
-            await query.message.edit_text(
-                messages.MAIN_MENU,
-                reply_markup=keyboards.main_menu(is_admin)
-            )
-
-        elif data == "list_accounts":
-            user_id = update.effective_user.id
-            accounts = db.get_user_instagram_accounts(user_id)
-
-            if not accounts:
-                await query.message.edit_text(
-                    messages.NO_ACCOUNTS,
-                    reply_markup=keyboards.account_management()
-                )
-            else:
-                accounts_text = ""
-                for acc in accounts:
-                    status = "✅" if acc['is_verified'] else "⏳"
-                    accounts_text += f"{status} @{acc['instagram_username']}\n"
-
-                text = messages.ACCOUNTS_LIST.format(accounts=accounts_text)
-                await query.message.edit_text(
-                    text,
-                    reply_markup=keyboards.accounts_list(accounts),
-                    parse_mode=ParseMode.HTML
-                )
+        # "prefix:argument" callbacks get the argument parsed once here
+        prefix, sep, arg = data.partition(':')
+        handler = self._callback_prefix.get(prefix) if sep else None
+        if handler is not None:
+            await handler(update, context, arg)
 
-        elif data.startswith("view_account:"):
-            account_id = int(data.split(':')[1])
-            account = db.get_instagram_account(account_id)
+    async def _back_to_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Return to main menu"""
+        is_admin = update.effective_user.id in self._admin_ids
 
-            if account:
-                status = "✅ تایید شده" if account['is_verified'] else "⏳ در انتظار تایید"
-                text = f"📱 حساب: @{account['instagram_username']}\n🔹 وضعیت: {status}"
+        await update.callback_query.message.edit_text(
+            messages.MAIN_MENU,
+            reply_markup=keyboards.main_menu(is_admin)
+        )
 
-                await query.message.edit_text(
-                    text,
-                    reply_markup=keyboards.account_actions(account_id)
-                )
+    async def _list_accounts(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show user's Instagram accounts"""
+        query = update.callback_query
+        user_id = update.effective_user.id
+        accounts = db.get_user_instagram_accounts(user_id)
 
-        elif data.startswith("delete_account:"):
-            account_id = int(data.split(':')[1])
+        if not accounts:
             await query.message.edit_text(
-                "⚠️ آیا مطمئن هستید که می‌خواهید این حساب را حذف کنید?",
-                reply_markup=keyboards.confirm_delete(account_id)
+                messages.NO_ACCOUNTS,
+                reply_markup=keyboards.account_management()
             )
+        else:
+            accounts_text = _format_accounts_text(accounts)
 
-        elif data.startswith("confirm_delete:"):
-            account_id = int(data.split(':')[1])
-            db.delete_instagram_account(account_id)
-
+            text = messages.ACCOUNTS_LIST.format(accounts=accounts_text)
             await query.message.edit_text(
-                messages.ACCOUNT_DELETED,
-                reply_markup=keyboards.back_button("list_accounts")
+                text,
+                reply_markup=keyboards.accounts_list(accounts),
+                parse_mode=ParseMode.HTML
             )
 
-        elif data == "admin_panel":
-            await self.admin_stats_detailed(update, context)
-
-        elif data == "admin_stats":
-            await self.admin_stats_detailed(update, context)
-
-        elif data == "admin_channel_lock":
-            await self.admin_channel_lock(update, context)
-
-        elif data == "admin_users":
-            await self.admin_users(update, context)
-
-        elif data == "admin_banned_users":
-            await self.admin_banned_users(update, context)
-
-        elif data == "admin_instagram_accounts":
-            await self.admin_instagram_accounts(update, context)
-
-        elif data == "admin_settings":
-            await self.admin_settings(update, context)
-
-        elif data == "admin_sessions":
-            await self.admin_sessions_callback(update, context)
-
-        elif data.startswith("view_channel:"):
-            await self.view_channel(update, context)
+    async def _view_account(self, update: Update, context: ContextTypes.DEFAULT_TYPE, account_id: str):
+        """Show Instagram account details"""
+        query = update.callback_query
+        account_id = int(account_id)
+        account = db.get_instagram_account(account_id)
 
-        elif data.startswith(("enable_channel:", "disable_channel:", "delete_channel:")):
-            await self.toggle_channel(update, context)
+        if account:
+            status = "✅ تایید شده" if account['is_verified'] else "⏳ در انتظار تایید"
+            text = f"📱 حساب: @{account['instagram_username']}\n🔹 وضعیت: {status}"
 
-        elif data.startswith("admin_users_list:"):
-            await self.admin_users_list(update, context)
+            await query.message.edit_text(
+                text,
+                reply_markup=keyboards.account_actions(account_id)
+            )
 
-        elif data.startswith("view_user:"):
-            await self.view_user(update, context)
+    async def _delete_account(self, update: Update, context: ContextTypes.DEFAULT_TYPE, account_id: str):
+        """Ask for Instagram account deletion confirmation"""
+        query = update.callback_query
+        account_id = int(account_id)
+        await query.message.edit_text(
+            "⚠️ آیا مطمئن هستید که می‌خواهید این حساب را حذف کنید?",
+            reply_markup=keyboards.confirm_delete(account_id)
+        )
 
-        elif data.startswith("ban_user:"):
-            await self.ban_user(update, context)
+    async def _confirm_delete(self, update: Update, context: ContextTypes.DEFAULT_TYPE, account_id: str):
+        """Delete Instagram account"""
+        query = update.callback_query
+        account_id = int(account_id)
+        db.delete_instagram_account(account_id)
 
-        elif data.startswith("unban_user:"):
-            await self.unban_user(update, context)
+        await query.message.edit_text(
+            messages.ACCOUNT_DELETED,
+            reply_markup=keyboards.back_button("list_accounts")
+        )
 
-        elif data == "cancel_action":
-            await query.message.edit_text("❌ عملیات لغو شد.")
+    async def _cancel_action(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Cancel inline action"""
+        await update.callback_query.message.edit_text("❌ عملیات لغو شد.")
 
+    @admin_only
     async def admin_sessions_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Session management callback"""
         query = update.callback_query
-        user_id = update.effective_user.id
 
-        if user_id != config.admin_id:
-            await query.message.edit_text("❌ شما دسترسی به این بخش ندارید!")
-            return
-
-        status = session_manager.get_session_status()
+        status = await asyncio.to_thread(session_manager.get_session_status)
 
         if status['active']:
             status_text = "✅ فعال و معتبر"
         else:
             status_text = "❌ غیرفعال"
 
-        text = f"""🔑 <b>مدیریت نشست‌های اینستاگرام</b>
-
-📊 <b>وضعیت فعلی:</b>
-👤 نام کاربری: @{status['username'] or config.instagram_username or 'تنظیم نشده'}
-🔹 وضعیت: {status_text}
-
-<b>گزینه‌ها:</b>
-• بررسی وضعیت - وضعیت اتصال را بررسی کنید
-• ورود مجدد - با نام کاربری و رمز عبور تلاش کنید
-• آپلود نشست - فایل سشن JSON را آپلود کنید"""
+        text = SESSION_MANAGEMENT_TEXT.format(
+            username=status['username'] or config.snapshot.instagram_username or 'تنظیم نشده',
+            status=status_text
+        )
 
         instagram_error = context.application.bot_data.get('instagram_error')
         if instagram_error:
@@ -1348,17 +1666,12 @@ class MXBot:
             parse_mode=ParseMode.HTML
         )
 
+    @admin_only
     async def upload_session_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Start session file upload"""
         query = update.callback_query
         await query.answer()
 
-        user_id = update.effective_user.id
-
-        if user_id != config.admin_id:
-            await query.message.edit_text("❌ شما دسترسی به این بخش ندارید!")
-            return ConversationHandler.END
-
         await query.message.edit_text(
             messages.UPLOAD_SESSION_PROMPT,
             reply_markup=keyboards.back_button("admin_sessions"),
@@ -1367,14 +1680,9 @@ class MXBot:
 
         return WAITING_SESSION_FILE
 
+    @admin_only
     async def receive_session_file(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Receive session file from user"""
-        user_id = update.effective_user.id
-
-        if user_id != config.admin_id:
-            await update.message.reply_text("❌ شما دسترسی به این بخش ندارید!")
-            return ConversationHandler.END
-
         document = update.message.document
 
         if document.file_name and not document.file_name.endswith('.json'):
@@ -1388,12 +1696,14 @@ class MXBot:
             status_msg = await update.message.reply_text("⏳ در حال دریافت فایل...")
 
             file = await context.bot.get_file(document.file_id)
-            file_data = await file.download_as_bytearray()
-
-            extracted_username = session_manager.get_username_from_session_file(bytes(file_data))
-            username = extracted_username or config.instagram_username
+            buffer = io.BytesIO()
+            await file.download_to_memory(out=buffer)
+            file_data = buffer.getvalue()
 
-            success, message, _ = session_manager.upload_session_file(username, bytes(file_data))
+            # Stored under the username found in the file, else the configured one
+            success, message, username = await asyncio.to_thread(
+                session_manager.upload_session_file, config.snapshot.instagram_username, file_data
+            )
 
             if not success:
                 await status_msg.edit_text(
@@ -1411,18 +1721,15 @@ class MXBot:
                 parse_mode=ParseMode.HTML
             )
 
-            valid_success, valid_message, client = session_manager.load_and_validate_session(username)
+            valid_success, valid_message, client = await asyncio.to_thread(
+                session_manager.load_and_validate_session, username
+            )
 
             if valid_success:
-                instagram_handler.client = client
-                self.instagram_initialized = True
+                self._activate_admin_session(username, client)
                 context.application.bot_data['instagram_initialized'] = True
                 context.application.bot_data['instagram_error'] = None
 
-                # Save to database
-                session_file = str(session_manager.get_session_file(username))
-                db.add_admin_instagram_account(username, session_file, is_primary=True)
-
                 await update.message.reply_text(
                     messages.SESSION_VALID.format(username=username),
                     reply_markup=keyboards.session_management(),
@@ -1446,18 +1753,13 @@ class MXBot:
             )
             return WAITING_SESSION_FILE
 
+    @admin_only
     async def check_session_status(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Check Instagram session status"""
         query = update.callback_query
         await query.answer()
 
-        user_id = update.effective_user.id
-
-        if user_id != config.admin_id:
-            await query.message.edit_text("❌ شما دسترسی به این بخش ندارید!")
-            return
-
-        status = session_manager.get_session_status()
+        status = await asyncio.to_thread(session_manager.get_session_status)
 
         if status['active']:
             status_text = "✅ فعال و معتبر"
@@ -1465,7 +1767,7 @@ class MXBot:
             status_text = f"❌ غیرفعال - {status['message']}"
 
         text = messages.SESSION_STATUS.format(
-            username=status['username'] or config.instagram_username or 'تنظیم نشده',
+            username=status['username'] or config.snapshot.instagram_username or 'تنظیم نشده',
             status=status_text,
             last_check=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         )
@@ -1480,18 +1782,13 @@ class MXBot:
             parse_mode=ParseMode.HTML
         )
 
+    @admin_only
     async def relogin_session(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Try to re-login with credentials"""
         query = update.callback_query
         await query.answer()
 
-        user_id = update.effective_user.id
-
-        if user_id != config.admin_id:
-            await query.message.edit_text("❌ شما دسترسی به این بخش ندارید!")
-            return
-
-        if not config.instagram_username or not config.instagram_password:
+        if not config.has_instagram_credentials():
             await query.message.edit_text(
                 "❌ نام کاربری یا رمز عبور اینستاگرام تنظیم نشده است!",
                 reply_markup=keyboards.session_management()
@@ -1501,9 +1798,10 @@ class MXBot:
         await query.message.edit_text("⏳ در حال تلاش برای ورود مجدد...")
 
         try:
-            success, message, client = session_manager.login(
-                config.instagram_username,
-                config.instagram_password
+            success, message, client = await asyncio.to_thread(
+                session_manager.login,
+                config.snapshot.instagram_username,
+                config.snapshot.instagram_password
             )
 
             if success:
@@ -1535,42 +1833,33 @@ class MXBot:
                 parse_mode=ParseMode.HTML
             )
 
+    async def instagram_link(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Download an Instagram link matched by the message filter"""
+        await self.download_handler(update, context, context.matches[0].group(0))
+
+    async def media_link(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Download any other link matched by the message filter"""
+        url = context.matches[0].group(0).rstrip('.,;:!?')
+        await self.ytdlp_download_handler(update, context, url)
+
     async def message_router(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Route text messages"""
-        text = update.message.text
-
-        if text == "📥 دانلود":
-            if await self.check_membership_middleware(update, context):
-                await update.message.reply_text(messages.SEND_LINK, parse_mode=ParseMode.HTML)
-        elif text == "📱 حساب‌های من":
-            await self.accounts_menu(update, context)
-        elif text == "📊 آمار":
-            await self.stats_command(update, context)
-        elif text == "❓ راهنما":
-            await self.help_command(update, context)
-        elif text == "👨‍💼 پنل مدیریت":
-            await self.admin_panel(update, context)
-        elif extract_instagram_url(text):
-            await self.download_handler(update, context)
-        elif is_ytdlp_supported_url(extract_media_url(text) or ''):
-            await self.ytdlp_download_handler(update, context)
-        else:
-            # Check if it's a URL that might be supported
-            url = extract_media_url(text)
-            if url:
-                await self.ytdlp_download_handler(update, context)
-            else:
-                await update.message.reply_text(
-                    "❌ دستور نامعتبر! از منو استفاده کنید یا لینک ارسال کنید.\n\n"
-                    "🔗 لینک‌های پشتیبانی شده:\n"
-                    "• اینستاگرام (نیاز به ثبت حساب)\n"
-                    "• یوتیوب، ساندکلود و... (بدون ثبت حساب)"
-                )
+        """Reply to text that is neither a menu button nor a link"""
+        await update.message.reply_text(
+            "❌ دستور نامعتبر! از منو استفاده کنید یا لینک ارسال کنید.\n\n"
+            "🔗 لینک‌های پشتیبانی شده:\n"
+            "• اینستاگرام (نیاز به ثبت حساب)\n"
+            "• یوتیوب، ساندکلود و... (بدون ثبت حساب)"
+        )
+
+    async def _download_button(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Ask for a link after the download menu button"""
+        if await self.check_membership_middleware(update, context):
+            await update.message.reply_text(messages.SEND_LINK, parse_mode=ParseMode.HTML)
 
     async def cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Cancel conversation"""
         user_id = update.effective_user.id
-        is_admin = user_id == config.admin_id
+        is_admin = user_id in self._admin_ids
 
         await update.message.reply_text(
             "❌ عملیات لغو شد.",
@@ -1578,9 +1867,69 @@ class MXBot:
         )
         return ConversationHandler.END
 
+    async def _post_init(self, application: Application):
+        """Size the thread pool used for blocking downloads, get bot info and start DM scanner"""
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=BLOCKING_IO_WORKERS)
+        )
+        # Application.initialize() has already called get_me() and cached the result
+        self.bot_username = application.bot.username
+        # Not application.create_task(): Application.stop() waits for those,
+        # and this loop never ends on its own; _post_shutdown cancels it
+        self._dm_scanner_task = asyncio.create_task(self._dm_scanner_loop())
+
+    async def _post_shutdown(self, application: Application):
+        """Stop the DM scanner before the event loop closes"""
+        task, self._dm_scanner_task = self._dm_scanner_task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    async def _scan_dm_codes(self):
+        """Scan Instagram DMs once for all pending verification codes"""
+        async with self._dm_scan_lock:
+            # Presses that queued behind a fresh scan reuse its result
+            now = time.monotonic()
+            if now - self._last_dm_scan < DM_SCAN_MIN_INTERVAL:
+                return
+
+            self._found_codes = {
+                code: expires for code, expires in self._found_codes.items() if expires > now
+            }
+            pending = await asyncio.to_thread(db.get_pending_verification_codes)
+            codes = [code for code in pending if code not in self._found_codes]
+            if codes:
+                found = await instagram_handler.find_codes_async(codes)
+                expires_at = time.monotonic() + FOUND_CODE_TTL
+                for code in found:
+                    self._found_codes[code] = expires_at
+
+            self._last_dm_scan = time.monotonic()
+
+    async def _dm_scanner_loop(self):
+        """Periodically look for verification codes in Instagram DMs"""
+        while True:
+            if self.instagram_initialized:
+                try:
+                    await self._scan_dm_codes()
+                except Exception as e:
+                    logger.error(f"DM scan failed: {e}")
+            await asyncio.sleep(DM_SCAN_INTERVAL)
+
     async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle errors"""
-        logger.error(f"Update {update} caused error {context.error}")
+        error = context.error
+        update_id = getattr(update, 'update_id', None)
+        logger.error(
+            f"Update {update_id} caused error {type(error).__name__}: {str(error)[:200]}",
+            exc_info=error
+        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Failed update: {update}")
 
     def run(self):
         """Run the bot"""
@@ -1590,6 +1939,7 @@ class MXBot:
             return
 
         config.load()
+        self._admin_ids = self._load_admin_ids()
 
         # Validate config
         valid, errors = config.validate()
@@ -1597,6 +1947,9 @@ class MXBot:
             logger.error(f"Invalid configuration: {errors}")
             return
 
+        # Warm known users so returning users skip the add_user upsert
+        self._known_users = dict.fromkeys(db.get_all_user_ids(), time.monotonic())
+
         # Create directories
         os.makedirs('downloads', exist_ok=True)
         os.makedirs('sessions', exist_ok=True)
@@ -1604,10 +1957,10 @@ class MXBot:
         # Initialize Instagram handler
         instagram_error = None
         try:
-            if config.instagram_username and config.instagram_password:
+            if config.has_instagram_credentials():
                 instagram_handler.initialize(
-                    config.instagram_username,
-                    config.instagram_password
+                    config.snapshot.instagram_username,
+                    config.snapshot.instagram_password
                 )
                 self.instagram_initialized = True
                 logger.info("Instagram handler initialized")
@@ -1620,114 +1973,107 @@ class MXBot:
             logger.info("Bot will continue without Instagram. Admin can upload session file.")
 
         # Create application
-        self.app = Application.builder().token(config.bot_token).build()
+        self.app = (
+            Application.builder()
+            .token(config.snapshot.bot_token)
+            .request(HTTPXRequest(
+                connection_pool_size=BOT_API_POOL_SIZE,
+                pool_timeout=BOT_API_POOL_TIMEOUT
+            ))
+            .get_updates_request(HTTPXRequest(connection_pool_size=1))
+            .post_init(self._post_init)
+            .post_shutdown(self._post_shutdown)
+            .build()
+        )
 
         # Store instagram error for admin notification
         self.app.bot_data['instagram_error'] = instagram_error
         self.app.bot_data['instagram_initialized'] = self.instagram_initialized
 
-        # Get bot username
-        async def get_bot_info():
-            bot = await self.app.bot.get_me()
-            self.bot_username = bot.username
-
-        asyncio.get_event_loop().run_until_complete(get_bot_info())
-
         # Add handlers
         self.app.add_handler(CommandHandler("start", self.start))
         self.app.add_handler(CommandHandler("help", self.help_command))
         self.app.add_handler(CommandHandler("stats", self.stats_command))
 
-        # Conversation handler for adding accounts
-        add_account_conv = ConversationHandler(
-            entry_points=[CallbackQueryHandler(self.add_account_start, pattern="^add_account$")],
-            states={
-                WAITING_USERNAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.receive_username)],
-            },
-            fallbacks=[CommandHandler("cancel", self.cancel)],
-        )
-        self.app.add_handler(add_account_conv)
-
-        # Broadcast conversation handler
-        broadcast_conv = ConversationHandler(
-            entry_points=[CallbackQueryHandler(self.admin_broadcast_start, pattern="^admin_broadcast$")],
-            states={
-                WAITING_BROADCAST: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.admin_broadcast_send)],
-            },
-            fallbacks=[CommandHandler("cancel", self.cancel)],
+        # Conversations: (entry callback pattern, entry handler, {state: (input, handler)})
+        text_input = filters.TEXT & ~filters.COMMAND
+        conversation_inputs = {"text": text_input, "document": filters.Document.ALL}
+        cancel_handler = CommandHandler("cancel", self.cancel)
+        conversations = (
+            (PAT_ADD_ACCOUNT, self.add_account_start, {
+                WAITING_USERNAME: ("text", self.receive_username),
+            }),
+            (PAT_ADMIN_BROADCAST, self.admin_broadcast_start, {
+                WAITING_BROADCAST: ("text", self.admin_broadcast_send),
+            }),
+            (PAT_UPLOAD_SESSION, self.upload_session_start, {
+                WAITING_SESSION_FILE: ("document", self.receive_session_file),
+            }),
+            (PAT_ADD_CHANNEL_LOCK, self.add_channel_lock_start, {
+                WAITING_CHANNEL_ID: ("text", self.receive_channel_id),
+            }),
+            (PAT_ADMIN_SEARCH_USER, self.admin_search_user_start, {
+                WAITING_USER_SEARCH: ("text", self.receive_user_search),
+            }),
+            (PAT_SEND_TO_USER, self.send_to_user_start, {
+                WAITING_MESSAGE_TO_USER: ("text", self.send_message_to_user),
+            }),
+            (PAT_ADD_ADMIN_IG_ACCOUNT, self.add_admin_ig_account_start, {
+                WAITING_IG_USERNAME: ("text", self.receive_ig_username),
+                WAITING_IG_PASSWORD: ("text", self.receive_ig_password),
+            }),
         )
-        self.app.add_handler(broadcast_conv)
-
-        # Session upload conversation handler
-        session_upload_conv = ConversationHandler(
-            entry_points=[CallbackQueryHandler(self.upload_session_start, pattern="^upload_session$")],
-            states={
-                WAITING_SESSION_FILE: [
-                    MessageHandler(filters.Document.ALL, self.receive_session_file),
-                ],
-            },
-            fallbacks=[CommandHandler("cancel", self.cancel)],
-        )
-        self.app.add_handler(session_upload_conv)
-
-        # Channel lock conversation handler
-        channel_lock_conv = ConversationHandler(
-            entry_points=[CallbackQueryHandler(self.add_channel_lock_start, pattern="^add_channel_lock$")],
-            states={
-                WAITING_CHANNEL_ID: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.receive_channel_id)],
-            },
-            fallbacks=[CommandHandler("cancel", self.cancel)],
-        )
-        self.app.add_handler(channel_lock_conv)
-
-        # User search conversation handler
-        user_search_conv = ConversationHandler(
-            entry_points=[CallbackQueryHandler(self.admin_search_user_start, pattern="^admin_search_user$")],
-            states={
-                WAITING_USER_SEARCH: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.receive_user_search)],
-            },
-            fallbacks=[CommandHandler("cancel", self.cancel)],
-        )
-        self.app.add_handler(user_search_conv)
-
-        # Send to user conversation handler
-        send_to_user_conv = ConversationHandler(
-            entry_points=[CallbackQueryHandler(self.send_to_user_start, pattern="^send_to_user:")],
-            states={
-                WAITING_MESSAGE_TO_USER: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.send_message_to_user)],
-            },
-            fallbacks=[CommandHandler("cancel", self.cancel)],
-        )
-        self.app.add_handler(send_to_user_conv)
-
-        # Admin Instagram account conversation handler
-        admin_ig_conv = ConversationHandler(
-            entry_points=[CallbackQueryHandler(self.add_admin_ig_account_start, pattern="^add_admin_ig_account$")],
-            states={
-                WAITING_IG_USERNAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.receive_ig_username)],
-                WAITING_IG_PASSWORD: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.receive_ig_password)],
-            },
-            fallbacks=[CommandHandler("cancel", self.cancel)],
-        )
-        self.app.add_handler(admin_ig_conv)
+        for pattern, entry, states in conversations:
+            self.app.add_handler(ConversationHandler(
+                entry_points=[CallbackQueryHandler(entry, pattern=pattern)],
+                states={
+                    state: [MessageHandler(conversation_inputs[kind], handler)]
+                    for state, (kind, handler) in states.items()
+                },
+                fallbacks=[cancel_handler],
+            ))
 
         # Callback handlers
-        self.app.add_handler(CallbackQueryHandler(self.check_verification, pattern="^check_verification:"))
-        self.app.add_handler(CallbackQueryHandler(self.check_membership_callback, pattern="^check_membership$"))
-        self.app.add_handler(CallbackQueryHandler(self.check_session_status, pattern="^check_session_status$"))
-        self.app.add_handler(CallbackQueryHandler(self.relogin_session, pattern="^relogin_session$"))
-        self.app.add_handler(CallbackQueryHandler(self.handle_quality_selection, pattern="^dl:"))
+        self.app.add_handler(CallbackQueryHandler(self.check_verification, pattern=PAT_CHECK_VERIFICATION))
+        self.app.add_handler(CallbackQueryHandler(self.check_membership_callback, pattern=PAT_CHECK_MEMBERSHIP))
+        self.app.add_handler(CallbackQueryHandler(self.check_session_status, pattern=PAT_CHECK_SESSION_STATUS))
+        self.app.add_handler(CallbackQueryHandler(self.relogin_session, pattern=PAT_RELOGIN_SESSION))
+        self.app.add_handler(CallbackQueryHandler(self.handle_quality_selection, pattern=PAT_QUALITY_SELECTION))
         self.app.add_handler(CallbackQueryHandler(self.button_callback))
 
-        # Message handler
-        self.app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.message_router))
+        # Message handlers: menu buttons and links are matched by filters,
+        # anything else falls through to message_router
+        for text, handler in self._menu_buttons.items():
+            self.app.add_handler(MessageHandler(filters.Text([text]), handler))
+        self.app.add_handler(MessageHandler(text_input & filters.Regex(INSTAGRAM_LINK_RE), self.instagram_link))
+        self.app.add_handler(MessageHandler(text_input & filters.Regex(MEDIA_LINK_RE), self.media_link))
+        self.app.add_handler(MessageHandler(text_input, self.message_router))
 
         # Error handler
         self.app.add_error_handler(self.error_handler)
 
-        # Start bot
-        logger.info("Bot started!")
-        self.app.run_polling(allowed_updates=Update.ALL_TYPES)
+        # Start bot: webhooks when configured, long polling otherwise
+        settings = config.snapshot
+        if settings.webhook_base:
+            url_path = settings.webhook_secret or 'telegram'
+            logger.info(f"Bot started with webhook on port {settings.webhook_port}!")
+            self.app.run_webhook(
+                listen="0.0.0.0",
+                port=settings.webhook_port,
+                url_path=url_path,
+                webhook_url=f"{settings.webhook_base.rstrip('/')}/{url_path}",
+                secret_token=settings.webhook_secret,
+                allowed_updates=ALLOWED_UPDATES
+            )
+        else:
+            logger.info("Bot started!")
+            # Long-poll: Telegram holds each getUpdates open until updates arrive
+            self.app.run_polling(
+                timeout=POLLING_TIMEOUT,
+                poll_interval=0.0,
+                allowed_updates=ALLOWED_UPDATES,
+                drop_pending_updates=True
+            )
 
 
 if __name__ == '__main__':
@@ -3,68 +3,196 @@ Configuration Management for MX-BOT
 Handles bot configuration and settings
 """
 import os
-import configparser
+import re
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Optional
+
+BASE_DIR = Path(__file__).parent.absolute()
+DEFAULT_WEBHOOK_PORT = 8443
+
+# Parsed sections of each config file, keyed by (path, mtime, size), so
+# reloading or re-instantiating Config for an unchanged file skips parsing
+_PARSE_CACHE = {}
+
+# The config file only uses [section] and "key = value" lines
+_SECTION_RE = re.compile(r'^\[([^\]]+)\]\s*$')
+_KV_RE = re.compile(r'^([^=\s][^=]*?)\s*=\s*(.*)$')
+
+def _optional_int(value: str):
+    """Empty value means unset"""
+    return int(value) if value else None
+
+def _optional_str(value: str):
+    """Empty value means unset"""
+    return value or None
+
+def _port(value: str) -> int:
+    """Empty value falls back to the default webhook port"""
+    return int(value) if value else DEFAULT_WEBHOOK_PORT
+
+# Attribute -> (section, key, converter, default); values are resolved from
+# the parsed file on first access and then stored on the instance
+_FIELDS = {
+    # Telegram
+    'bot_token': ('Telegram', 'bot_token', str, None),
+    'admin_id': ('Telegram', 'admin_id', _optional_int, None),
+    # Instagram
+    'instagram_username': ('Instagram', 'username', str, None),
+    'instagram_password': ('Instagram', 'password', str, None),
+    # Paths
+    'database_path': ('Paths', 'database', str, str(BASE_DIR / 'bot.db')),
+    'session_dir': ('Paths', 'sessions', str, str(BASE_DIR / 'sessions')),
+    'download_dir': ('Paths', 'downloads', str, str(BASE_DIR / 'downloads')),
+    # Webhook mode is used when webhook_base is set, otherwise long polling
+    'webhook_base': ('Webhook', 'base_url', _optional_str, None),
+    'webhook_port': ('Webhook', 'port', _port, DEFAULT_WEBHOOK_PORT),
+    'webhook_secret': ('Webhook', 'secret', _optional_str, None),
+}
+
+@dataclass(frozen=True, slots=True)
+class ConfigSnapshot:
+    """Immutable view of the resolved config fields for hot paths"""
+    bot_token: Optional[str]
+    admin_id: Optional[int]
+    instagram_username: Optional[str]
+    instagram_password: Optional[str]
+    database_path: str
+    session_dir: str
+    download_dir: str
+    webhook_base: Optional[str]
+    webhook_port: int
+    webhook_secret: Optional[str]
+
+def _parse_ini(text: str) -> dict:
+    """Parse INI text into {section: {key: value}}, skipping comments"""
+    sections = {}
+    current = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line[0] in '#;':
+            continue
+        match = _SECTION_RE.match(line)
+        if match:
+            current = sections.setdefault(match.group(1).strip(), {})
+            continue
+        match = _KV_RE.match(line)
+        if match and current is not None:
+            current[match.group(1).lower()] = match.group(2)
+    return sections
 
 class Config:
     def __init__(self, config_file='config.ini'):
         self.config_file = config_file
-        self.config = configparser.ConfigParser()
-        self.base_dir = Path(__file__).parent.absolute()
-        
-        # Default values
-        self.bot_token = None
-        self.admin_id = None
-        self.instagram_username = None
-        self.instagram_password = None
-        self.database_path = str(self.base_dir / 'bot.db')
-        self.session_dir = str(self.base_dir / 'sessions')
-        self.download_dir = str(self.base_dir / 'downloads')
+        self.base_dir = BASE_DIR
+        self._sections = {}
+        # Memoized validate() / has_instagram_credentials() results
+        self._checks = {}
         
         # Load config if exists
-        if os.path.exists(config_file):
-            self.load()
+        self.load()
     
-    def load(self):
-        """Load configuration from file"""
-        self.config.read(self.config_file)
+    def __getattr__(self, name):
+        """Resolve a config field (or the snapshot) on first access"""
+        if name == 'snapshot':
+            snapshot = ConfigSnapshot(**{field: getattr(self, field) for field in _FIELDS})
+            self.__dict__['snapshot'] = snapshot
+            return snapshot
         
-        if 'Telegram' in self.config:
-            self.bot_token = self.config['Telegram'].get('bot_token')
-            self.admin_id = self.config['Telegram'].getint('admin_id', None)
+        field = _FIELDS.get(name)
+        if field is None:
+            raise AttributeError(f"'Config' object has no attribute '{name}'")
+        
+        section, key, convert, default = field
+        raw = self.__dict__.get('_sections', {}).get(section, {}).get(key)
+        value = default if raw is None else convert(raw)
+        self.__dict__[name] = value
+        return value
+    
+    def __setattr__(self, name, value):
+        """Assigning a config field invalidates the memoized checks and snapshot"""
+        if name in _FIELDS:
+            self._checks = {}
+            self.__dict__.pop('snapshot', None)
+        object.__setattr__(self, name, value)
+    
+    def _cache_key(self):
+        """Identify the current version of the config file"""
+        try:
+            stat = os.stat(self.config_file)
+        except OSError:
+            return None
+        return (os.path.abspath(self.config_file), stat.st_mtime_ns, stat.st_size)
+    
+    def load(self):
+        """Load configuration from file (a missing file keeps the defaults)"""
+        key = self._cache_key()
+        if key is None:
+            return
         
-        if 'Instagram' in self.config:
-            self.instagram_username = self.config['Instagram'].get('username')
-            self.instagram_password = self.config['Instagram'].get('password')
+        sections = _PARSE_CACHE.get(key)
+        if sections is None:
+            # One stat for the cache key, then a single read of the whole file
+            try:
+                with open(self.config_file, encoding='utf-8') as f:
+                    sections = _parse_ini(f.read())
+            except FileNotFoundError:
+                return
+            _PARSE_CACHE[key] = sections
         
-        if 'Paths' in self.config:
-            self.database_path = self.config['Paths'].get('database', self.database_path)
-            self.session_dir = self.config['Paths'].get('sessions', self.session_dir)
-            self.download_dir = self.config['Paths'].get('downloads', self.download_dir)
+        # Drop resolved values so they are read again from the new sections
+        self._sections = sections
+        self._checks = {}
+        for name in (*_FIELDS, 'snapshot'):
+            self.__dict__.pop(name, None)
     
     def save(self):
         """Save configuration to file"""
-        if 'Telegram' not in self.config:
-            self.config['Telegram'] = {}
-        self.config['Telegram']['bot_token'] = self.bot_token or ''
-        self.config['Telegram']['admin_id'] = str(self.admin_id or '')
+        # Copy so cached sections are never modified in place
+        sections = {name: dict(values) for name, values in self._sections.items()}
+        sections.setdefault('Telegram', {}).update({
+            'bot_token': self.bot_token or '',
+            'admin_id': str(self.admin_id or ''),
+        })
+        sections.setdefault('Instagram', {}).update({
+            'username': self.instagram_username or '',
+            'password': self.instagram_password or '',
+        })
+        sections.setdefault('Paths', {}).update({
+            'database': self.database_path,
+            'sessions': self.session_dir,
+            'downloads': self.download_dir,
+        })
+        if self.webhook_base:
+            sections.setdefault('Webhook', {}).update({
+                'base_url': self.webhook_base,
+                'port': str(self.webhook_port),
+                'secret': self.webhook_secret or '',
+            })
         
-        if 'Instagram' not in self.config:
-            self.config['Instagram'] = {}
-        self.config['Instagram']['username'] = self.instagram_username or ''
-        self.config['Instagram']['password'] = self.instagram_password or ''
+        lines = []
+        for name, values in sections.items():
+            lines.append(f"[{name}]")
+            lines.extend(f"{key} = {value}" for key, value in values.items())
+            lines.append("")
         
-        if 'Paths' not in self.config:
-            self.config['Paths'] = {}
-        self.config['Paths']['database'] = self.database_path
-        self.config['Paths']['sessions'] = self.session_dir
-        self.config['Paths']['downloads'] = self.download_dir
+        with open(self.config_file, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines))
         
-        with open(self.config_file, 'w') as f:
-            self.config.write(f)
+        self._sections = sections
+        self._checks = {}
+        self.__dict__.pop('snapshot', None)
+        key = self._cache_key()
+        if key:
+            _PARSE_CACHE[key] = sections
     
     def validate(self):
         """Validate required configuration"""
+        cached = self._checks.get('validate')
+        if cached is not None:
+            valid, errors = cached
+            return valid, list(errors)
+        
         errors = []
         warnings = []
 
@@ -79,11 +207,15 @@ class Config:
         if not self.instagram_password:
             warnings.append("Instagram password not set (can be configured via admin panel)")
 
+        self._checks['validate'] = (len(errors) == 0, tuple(errors))
         return len(errors) == 0, errors
 
     def has_instagram_credentials(self) -> bool:
         """Check if Instagram credentials are configured"""
-        return bool(self.instagram_username and self.instagram_password)
+        cached = self._checks.get('has_ig')
+        if cached is None:
+            cached = self._checks['has_ig'] = bool(self.instagram_username and self.instagram_password)
+        return cached
 
 # Global config instance
 config = Config()
@@ -4,28 +4,151 @@ SQLite database management
 """
 import sqlite3
 import logging
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterator, NamedTuple
 
 logger = logging.getLogger(__name__)
 
+# Columns needed to render admin user lists (all served by idx_users_list)
+USER_LIST_COLUMNS = 'user_id, username, first_name, is_banned, download_count'
+
+# Bump when init_database() changes; databases already at this version skip
+# all schema statements on startup
+SCHEMA_VERSION = 1
+
+# Settings, locked channels, ban flags and the primary admin account are read
+# on every update but rarely change; writers drop their entries right away
+METADATA_CACHE_TTL = 30
+METADATA_CACHE_SIZE = 10_000
+
+class UserProfile(NamedTuple):
+    """User row plus verified account count, read on every update"""
+    user_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    is_banned: int
+    is_premium: int
+    download_count: int
+    created_at: str
+    verified_count: int
+
+USER_PROFILE_COLUMNS = ', '.join(UserProfile._fields)
+
+# Insert an admin account or refresh the existing row for that username
+ADMIN_ACCOUNT_UPSERT = '''
+    INSERT INTO admin_instagram_accounts (username, session_file, is_primary, is_active)
+    VALUES (?, ?, ?, 1)
+    ON CONFLICT(username) DO UPDATE SET
+        session_file = excluded.session_file,
+        is_primary = excluded.is_primary,
+        is_active = 1
+'''
+
 class Database:
     def __init__(self, db_path: str = 'bot.db'):
         self.db_path = db_path
-        self.init_database()
+        # One connection per thread (the event loop's is reused for the bot's
+        # lifetime); all of them are tracked so close() can release them
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        # Cache key -> (expiry, value) for read-mostly lookups
+        self._cache = {}
+        # Schema is created on first use, so importing this module (and the
+        # global db below) does not touch the database file
+        self._initialized = False
+        self._init_lock = threading.RLock()
     
     def get_connection(self):
-        """Get database connection"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        """Get this thread's database connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Only the owning thread uses it; close() may run elsewhere. The
+            # statement cache holds every query shape in this module
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256)
+            conn.execute('PRAGMA busy_timeout=5000')
+            conn.row_factory = sqlite3.Row
+            # WAL lets readers run alongside the writer; the rest keeps
+            # SQLite's page cache warm, reads memory-mapped and temp tables off disk
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA temp_store=MEMORY')
+            conn.execute('PRAGMA cache_size=-64000')
+            conn.execute('PRAGMA mmap_size=268435456')
+            # The schema's FOREIGN KEY clauses are documentation only: users are
+            # saved on /start, so downloads may precede their users row
+            conn.execute('PRAGMA foreign_keys=OFF')
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        
+        if not self._initialized:
+            # Other threads wait here; init_database() itself reenters
+            # get_connection() on this thread and must pass straight through
+            with self._init_lock:
+                if not self._initialized and not getattr(self._local, 'initializing', False):
+                    self._local.initializing = True
+                    try:
+                        self.init_database()
+                        self._initialized = True
+                    finally:
+                        self._local.initializing = False
         return conn
     
+    @contextmanager
+    def _writer(self):
+        """
+        Run writes in a BEGIN IMMEDIATE transaction, committed on success
+        Nested use joins the transaction that is already open
+        """
+        conn = self.get_connection()
+        if conn.in_transaction:
+            yield conn
+            return
+        
+        # Take the write lock up front so concurrent writers wait on the busy
+        # timeout instead of failing to upgrade a read transaction
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+    
+    def _cached(self, key, load):
+        """Return a cached lookup result, calling load() when missing or stale"""
+        entry = self._cache.get(key)
+        now = time.monotonic()
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        
+        value = load()
+        if len(self._cache) >= METADATA_CACHE_SIZE:
+            self._cache.clear()
+        self._cache[key] = (now + METADATA_CACHE_TTL, value)
+        return value
+    
+    def close(self):
+        """Close all database connections"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+    
     def init_database(self):
         """Initialize database tables"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
+        if cursor.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+            return
+        
         # Users table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS users (
@@ -92,26 +215,43 @@ class Database:
             )
         ''')
 
-        # Channel lock settings table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS channel_lock (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                channel_id TEXT UNIQUE,
-                channel_username TEXT,
-                channel_title TEXT,
-                is_active INTEGER DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # Bot settings table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS bot_settings (
-                key TEXT PRIMARY KEY,
-                value TEXT,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        # Channel lock and bot settings tables are keyed by text, so they are
+        # stored WITHOUT ROWID; tables from older versions are rebuilt once
+        legacy = {row[0] for row in cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "AND name IN ('channel_lock', 'bot_settings') AND sql NOT LIKE '%WITHOUT ROWID%'"
+        )}
+        with self._writer() as conn:
+            for name in legacy:
+                conn.execute(f'ALTER TABLE {name} RENAME TO {name}_old')
+            
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS channel_lock (
+                    channel_id TEXT PRIMARY KEY,
+                    channel_username TEXT,
+                    channel_title TEXT,
+                    is_active INTEGER DEFAULT 1,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS bot_settings (
+                    key TEXT PRIMARY KEY,
+                    value TEXT,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                ) WITHOUT ROWID
+            ''')
+            
+            if 'channel_lock' in legacy:
+                conn.execute('''
+                    INSERT INTO channel_lock
+                    SELECT channel_id, channel_username, channel_title, is_active, created_at
+                    FROM channel_lock_old WHERE channel_id IS NOT NULL
+                ''')
+                conn.execute('DROP TABLE channel_lock_old')
+            if 'bot_settings' in legacy:
+                conn.execute('INSERT INTO bot_settings SELECT key, value, updated_at FROM bot_settings_old')
+                conn.execute('DROP TABLE bot_settings_old')
 
         # Admin Instagram accounts table (for DM checking)
         cursor.execute('''
@@ -126,26 +266,135 @@ class Database:
             )
         ''')
         
+        # Per-update user profile: user row plus verified account count
+        cursor.execute('''
+            CREATE VIEW IF NOT EXISTS user_profile_v AS
+            SELECT u.*,
+                   (SELECT COUNT(*) FROM instagram_accounts a
+                    WHERE a.user_id = u.user_id AND a.is_verified = 1) AS verified_count
+            FROM users u
+        ''')
+        
+        # Admin lists only read these columns, so the indexes cover them and
+        # SQLite never has to visit the table rows (user_id is the rowid)
+        cursor.execute('DROP INDEX IF EXISTS idx_users_banned')
+        cursor.execute('DROP INDEX IF EXISTS idx_users_created_at')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_users_banned_list
+            ON users(is_banned, created_at, username, first_name) WHERE is_banned = 1
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_users_list
+            ON users(created_at, username, first_name, is_banned, download_count)
+        ''')
+        
+        # NOCASE so the default case-insensitive LIKE 'prefix%' can use it
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_users_username
+            ON users(username COLLATE NOCASE)
+        ''')
+        
+        # Trigram full-text index over users for substring search; filled from
+        # the existing rows when it is first created
+        fts_exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'users_fts'"
+        ).fetchone()
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+                user_id, username, first_name,
+                content='users', content_rowid='user_id', tokenize='trigram'
+            )
+        ''')
+        cursor.executescript('''
+            CREATE TRIGGER IF NOT EXISTS t_users_fts_ins AFTER INSERT ON users BEGIN
+                INSERT INTO users_fts (rowid, user_id, username, first_name)
+                VALUES (NEW.user_id, NEW.user_id, NEW.username, NEW.first_name);
+            END;
+            CREATE TRIGGER IF NOT EXISTS t_users_fts_del AFTER DELETE ON users BEGIN
+                INSERT INTO users_fts (users_fts, rowid, user_id, username, first_name)
+                VALUES ('delete', OLD.user_id, OLD.user_id, OLD.username, OLD.first_name);
+            END;
+            CREATE TRIGGER IF NOT EXISTS t_users_fts_upd AFTER UPDATE OF username, first_name ON users
+            WHEN OLD.username IS NOT NEW.username OR OLD.first_name IS NOT NEW.first_name BEGIN
+                INSERT INTO users_fts (users_fts, rowid, user_id, username, first_name)
+                VALUES ('delete', OLD.user_id, OLD.user_id, OLD.username, OLD.first_name);
+                INSERT INTO users_fts (rowid, user_id, username, first_name)
+                VALUES (NEW.user_id, NEW.user_id, NEW.username, NEW.first_name);
+            END;
+        ''')
+        if not fts_exists:
+            cursor.execute("INSERT INTO users_fts (users_fts) VALUES ('rebuild')")
+        
+        # Row counts kept up to date by triggers, so totals never scan tables
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.executescript('''
+            CREATE TRIGGER IF NOT EXISTS t_users_ins AFTER INSERT ON users BEGIN
+                UPDATE counters SET value = value + 1 WHERE name = 'users_total';
+                UPDATE counters SET value = value + 1
+                WHERE name = 'users_banned' AND NEW.is_banned = 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS t_users_del AFTER DELETE ON users BEGIN
+                UPDATE counters SET value = value - 1 WHERE name = 'users_total';
+                UPDATE counters SET value = value - 1
+                WHERE name = 'users_banned' AND OLD.is_banned = 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS t_users_ban AFTER UPDATE OF is_banned ON users
+            WHEN (IFNULL(NEW.is_banned, 0) = 1) != (IFNULL(OLD.is_banned, 0) = 1) BEGIN
+                UPDATE counters SET value = value + (CASE WHEN NEW.is_banned = 1 THEN 1 ELSE -1 END)
+                WHERE name = 'users_banned';
+            END;
+            CREATE TRIGGER IF NOT EXISTS t_dl_ins AFTER INSERT ON downloads BEGIN
+                UPDATE counters SET value = value + 1 WHERE name = 'downloads_total';
+            END;
+            CREATE TRIGGER IF NOT EXISTS t_dl_del AFTER DELETE ON downloads BEGIN
+                UPDATE counters SET value = value - 1 WHERE name = 'downloads_total';
+            END;
+        ''')
+        # Seed from the tables the first time only
+        cursor.execute('''
+            INSERT OR IGNORE INTO counters (name, value)
+            SELECT 'users_total', COUNT(*) FROM users
+            UNION ALL SELECT 'users_banned', COUNT(*) FROM users WHERE is_banned = 1
+            UNION ALL SELECT 'downloads_total', COUNT(*) FROM downloads
+        ''')
+        
+        # Per-user account/download lookups, pending code lookups and
+        # time-range filters used by stats and cleanup
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ig_user
+            ON instagram_accounts(user_id, is_verified)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ig_code
+            ON instagram_accounts(verification_code) WHERE is_verified = 0
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_dl_user
+            ON downloads(user_id, download_time DESC)
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_dl_date ON downloads(download_time)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_pv_expires ON pending_verifications(expires_at)')
+        
+        cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
         conn.commit()
-        conn.close()
         logger.info("Database initialized successfully")
     
     # User operations
     def add_user(self, user_id: int, username: str = None, first_name: str = None):
         """Add or update user"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO users (user_id, username, first_name)
-            VALUES (?, ?, ?)
-            ON CONFLICT(user_id) DO UPDATE SET
-                username = excluded.username,
-                first_name = excluded.first_name
-        ''', (user_id, username, first_name))
-        
-        conn.commit()
-        conn.close()
+        with self._writer() as conn:
+            conn.execute('''
+                INSERT INTO users (user_id, username, first_name)
+                VALUES (?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    username = excluded.username,
+                    first_name = excluded.first_name
+            ''', (user_id, username, first_name))
     
     def get_user(self, user_id: int) -> Optional[Dict]:
         """Get user by ID"""
@@ -154,88 +403,116 @@ class Database:
         
         cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
         row = cursor.fetchone()
-        conn.close()
         
         return dict(row) if row else None
     
+    def fetch_profile(self, user_id: int) -> Optional[UserProfile]:
+        """Get user row plus verified Instagram account count in one query"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        # Plain tuples straight into the named tuple, no Row or dict per call
+        cursor.row_factory = None
+        
+        cursor.execute(f'SELECT {USER_PROFILE_COLUMNS} FROM user_profile_v WHERE user_id = ?',
+                       (user_id,))
+        row = cursor.fetchone()
+        
+        return UserProfile._make(row) if row else None
+    
     def is_user_banned(self, user_id: int) -> bool:
         """Check if user is banned"""
-        user = self.get_user(user_id)
-        return user['is_banned'] == 1 if user else False
+        return self._cached(('banned', user_id), lambda: self._load_is_banned(user_id))
     
-    def ban_user(self, user_id: int):
-        """Ban user"""
+    def _load_is_banned(self, user_id: int) -> bool:
+        """Read ban flag from the users table"""
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('UPDATE users SET is_banned = 1 WHERE user_id = ?', (user_id,))
-        conn.commit()
-        conn.close()
+        row = conn.execute('SELECT is_banned FROM users WHERE user_id = ?', (user_id,)).fetchone()
+        return bool(row and row[0])
     
-    def unban_user(self, user_id: int):
-        """Unban user"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('UPDATE users SET is_banned = 0 WHERE user_id = ?', (user_id,))
-        conn.commit()
-        conn.close()
+    def set_ban(self, user_id: int, banned: bool):
+        """Ban or unban user"""
+        with self._writer() as conn:
+            conn.execute('UPDATE users SET is_banned = ? WHERE user_id = ?', (1 if banned else 0, user_id))
+        self._cache.pop(('banned', user_id), None)
     
     def increment_download_count(self, user_id: int):
         """Increment user download count"""
+        with self._writer() as conn:
+            conn.execute('UPDATE users SET download_count = download_count + 1 WHERE user_id = ?', (user_id,))
+    
+    def get_all_users(self) -> List[Dict]:
+        """Get all users (listing columns only)"""
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('UPDATE users SET download_count = download_count + 1 WHERE user_id = ?', (user_id,))
-        conn.commit()
-        conn.close()
+        cursor.execute(f'SELECT {USER_LIST_COLUMNS} FROM users ORDER BY created_at DESC')
+        rows = cursor.fetchall()
+        return [dict(row) for row in rows]
     
-    def get_all_users(self) -> List[Dict]:
-        """Get all users"""
+    def get_users_page(self, offset: int, limit: int) -> List[Dict]:
+        """Get one page of users, newest first"""
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users ORDER BY created_at DESC')
+        cursor.execute(f'SELECT {USER_LIST_COLUMNS} FROM users ORDER BY created_at DESC LIMIT ? OFFSET ?',
+                      (limit, offset))
         rows = cursor.fetchall()
-        conn.close()
         return [dict(row) for row in rows]
     
+    def get_all_user_ids(self) -> List[int]:
+        """Get IDs of all users"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT user_id FROM users')
+        return [row['user_id'] for row in cursor.fetchall()]
+    
+    def iter_user_ids(self, batch_size: int = 1000) -> Iterator[List[int]]:
+        """
+        Yield all user IDs in batches, fetching one batch per query
+        Keyset paging keeps no statement open between batches
+        """
+        conn = self.get_connection()
+        last_id = -(2 ** 63)
+        while True:
+            rows = conn.execute(
+                'SELECT user_id FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?',
+                (last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            batch = [row[0] for row in rows]
+            yield batch
+            last_id = batch[-1]
+    
     def get_total_users(self) -> int:
         """Get total users count"""
+        return self._counter('users_total')
+    
+    def _counter(self, name: str) -> int:
+        """Read a trigger-maintained row count"""
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) as count FROM users')
-        result = cursor.fetchone()
-        conn.close()
-        return result['count'] if result else 0
+        row = conn.execute('SELECT value FROM counters WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else 0
     
     # Instagram accounts operations
     def add_instagram_account(self, user_id: int, instagram_username: str, 
                               verification_code: str, expires_at: datetime) -> int:
         """Add Instagram account"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO instagram_accounts 
-            (user_id, instagram_username, verification_code, code_expires_at, is_verified)
-            VALUES (?, ?, ?, ?, 0)
-        ''', (user_id, instagram_username, verification_code, expires_at))
-        
-        account_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with self._writer() as conn:
+            account_id = conn.execute('''
+                INSERT INTO instagram_accounts 
+                (user_id, instagram_username, verification_code, code_expires_at, is_verified)
+                VALUES (?, ?, ?, ?, 0)
+                RETURNING id
+            ''', (user_id, instagram_username, verification_code, expires_at)).fetchone()[0]
         return account_id
     
     def verify_instagram_account(self, account_id: int, instagram_user_id: str = None):
         """Verify Instagram account"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE instagram_accounts 
-            SET is_verified = 1, instagram_user_id = ?
-            WHERE id = ?
-        ''', (instagram_user_id, account_id))
-        
-        conn.commit()
-        conn.close()
+        with self._writer() as conn:
+            conn.execute('''
+                UPDATE instagram_accounts 
+                SET is_verified = 1, instagram_user_id = ?
+                WHERE id = ?
+            ''', (instagram_user_id, account_id))
     
     def get_instagram_account(self, account_id: int) -> Optional[Dict]:
         """Get Instagram account by ID"""
@@ -244,7 +521,6 @@ class Database:
         
         cursor.execute('SELECT * FROM instagram_accounts WHERE id = ?', (account_id,))
         row = cursor.fetchone()
-        conn.close()
         
         return dict(row) if row else None
     
@@ -260,7 +536,6 @@ class Database:
         ''', (user_id,))
         
         rows = cursor.fetchall()
-        conn.close()
         
         return [dict(row) for row in rows]
     
@@ -270,22 +545,17 @@ class Database:
         cursor = conn.cursor()
         
         cursor.execute('''
-            SELECT COUNT(*) as count FROM instagram_accounts 
-            WHERE user_id = ? AND is_verified = 1
+            SELECT EXISTS(
+                SELECT 1 FROM instagram_accounts WHERE user_id = ? AND is_verified = 1
+            )
         ''', (user_id,))
         
-        result = cursor.fetchone()
-        conn.close()
-        
-        return result['count'] > 0 if result else False
+        return bool(cursor.fetchone()[0])
     
     def delete_instagram_account(self, account_id: int):
         """Delete Instagram account"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM instagram_accounts WHERE id = ?', (account_id,))
-        conn.commit()
-        conn.close()
+        with self._writer() as conn:
+            conn.execute('DELETE FROM instagram_accounts WHERE id = ?', (account_id,))
     
     def get_account_by_verification_code(self, code: str) -> Optional[Dict]:
         """Get account by verification code"""
@@ -294,11 +564,10 @@ class Database:
         
         cursor.execute('''
             SELECT * FROM instagram_accounts 
-            WHERE verification_code = ? AND is_verified = 0 AND code_expires_at > datetime('now')
-        ''', (code,))
+            WHERE verification_code = ? AND is_verified = 0 AND code_expires_at > ?
+        ''', (code, datetime.now()))
         
         row = cursor.fetchone()
-        conn.close()
         
         return dict(row) if row else None
     
@@ -308,23 +577,31 @@ class Database:
         cursor = conn.cursor()
         cursor.execute('SELECT COUNT(*) as count FROM instagram_accounts WHERE is_verified = 1')
         result = cursor.fetchone()
-        conn.close()
         return result['count'] if result else 0
     
     # Downloads operations
     def add_download(self, user_id: int, media_type: str, media_url: str, 
                      instagram_username: str = None, file_size: int = 0):
         """Add download record"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO downloads (user_id, media_type, media_url, instagram_username, file_size)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, media_type, media_url, instagram_username, file_size))
-        
-        conn.commit()
-        conn.close()
+        with self._writer() as conn:
+            conn.execute('''
+                INSERT INTO downloads (user_id, media_type, media_url, instagram_username, file_size)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (user_id, media_type, media_url, instagram_username, file_size))
+    
+    def record_downloads(self, user_id: int, downloads: List[Dict]):
+        """
+        Add download records and bump user download count in one transaction
+        Each item has media_type, media_url and optional instagram_username, file_size
+        """
+        with self._writer() as conn:
+            conn.executemany('''
+                INSERT INTO downloads (user_id, media_type, media_url, instagram_username, file_size)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(user_id, d['media_type'], d['media_url'],
+                   d.get('instagram_username'), d.get('file_size', 0)) for d in downloads])
+            conn.execute('UPDATE users SET download_count = download_count + 1 WHERE user_id = ?',
+                         (user_id,))
     
     def get_user_downloads(self, user_id: int) -> List[Dict]:
         """Get user downloads"""
@@ -338,35 +615,25 @@ class Database:
         ''', (user_id,))
         
         rows = cursor.fetchall()
-        conn.close()
         
         return [dict(row) for row in rows]
     
     def get_total_downloads(self) -> int:
         """Get total downloads count"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) as count FROM downloads')
-        result = cursor.fetchone()
-        conn.close()
-        return result['count'] if result else 0
+        return self._counter('downloads_total')
     
     # Bot sessions operations
-    def add_bot_session(self, username: str, session_file: str):
-        """Add bot session"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Deactivate other sessions
-        cursor.execute('UPDATE bot_sessions SET is_active = 0')
-        
-        cursor.execute('''
-            INSERT INTO bot_sessions (username, session_file, is_active)
-            VALUES (?, ?, 1)
-        ''', (username, session_file))
-        
-        conn.commit()
-        conn.close()
+    def add_bot_session(self, username: str, session_file: str) -> int:
+        """Add bot session as the only active one"""
+        # Deactivate other sessions in the same transaction so there is
+        # always exactly one active session
+        with self._writer() as conn:
+            conn.execute('UPDATE bot_sessions SET is_active = 0 WHERE is_active = 1')
+            return conn.execute('''
+                INSERT INTO bot_sessions (username, session_file, is_active)
+                VALUES (?, ?, 1)
+                RETURNING id
+            ''', (username, session_file)).fetchone()[0]
     
     def get_active_session(self) -> Optional[Dict]:
         """Get active bot session"""
@@ -375,7 +642,6 @@ class Database:
         
         cursor.execute('SELECT * FROM bot_sessions WHERE is_active = 1 ORDER BY created_at DESC LIMIT 1')
         row = cursor.fetchone()
-        conn.close()
         
         return dict(row) if row else None
     
@@ -385,24 +651,36 @@ class Database:
         cursor = conn.cursor()
         cursor.execute('SELECT COUNT(*) as count FROM bot_sessions WHERE is_active = 1')
         result = cursor.fetchone()
-        conn.close()
         return result['count'] if result else 0
     
     # Pending verifications operations
     def create_verification(self, user_id: int, instagram_username: str, 
                            verification_code: str, expires_at: datetime) -> int:
         """Create pending verification"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO pending_verifications (user_id, instagram_username, verification_code, expires_at)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, instagram_username, verification_code, expires_at))
+        with self._writer() as conn:
+            verification_id = conn.execute('''
+                INSERT INTO pending_verifications (user_id, instagram_username, verification_code, expires_at)
+                VALUES (?, ?, ?, ?)
+                RETURNING id
+            ''', (user_id, instagram_username, verification_code, expires_at)).fetchone()[0]
+        return verification_id
+    
+    def create_verification_with_account(self, user_id: int, instagram_username: str,
+                                         verification_code: str, expires_at: datetime) -> int:
+        """Create pending verification and its unverified account in one transaction"""
+        with self._writer() as conn:
+            verification_id = conn.execute('''
+                INSERT INTO pending_verifications (user_id, instagram_username, verification_code, expires_at)
+                VALUES (?, ?, ?, ?)
+                RETURNING id
+            ''', (user_id, instagram_username, verification_code, expires_at)).fetchone()[0]
+            
+            conn.execute('''
+                INSERT INTO instagram_accounts 
+                (user_id, instagram_username, verification_code, code_expires_at, is_verified)
+                VALUES (?, ?, ?, ?, 0)
+            ''', (user_id, instagram_username, verification_code, expires_at))
         
-        verification_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
         return verification_id
     
     def get_verification(self, verification_id: int) -> Optional[Dict]:
@@ -412,111 +690,120 @@ class Database:
         
         cursor.execute('SELECT * FROM pending_verifications WHERE id = ?', (verification_id,))
         row = cursor.fetchone()
-        conn.close()
         
         return dict(row) if row else None
     
-    def delete_verification(self, verification_id: int):
-        """Delete verification"""
+    def get_pending_verification_codes(self) -> List[str]:
+        """Get codes of verifications that have not expired yet"""
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('DELETE FROM pending_verifications WHERE id = ?', (verification_id,))
-        conn.commit()
-        conn.close()
+        cursor.execute('SELECT verification_code FROM pending_verifications WHERE expires_at > ?',
+                       (datetime.now(),))
+        return [row['verification_code'] for row in cursor.fetchall()]
+    
+    def delete_verification(self, verification_id: int):
+        """Delete verification"""
+        with self._writer() as conn:
+            conn.execute('DELETE FROM pending_verifications WHERE id = ?', (verification_id,))
     
     def cleanup_expired_verifications(self):
         """Clean up expired verifications"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM pending_verifications WHERE expires_at < datetime('now')")
-        conn.commit()
-        conn.close()
+        with self._writer() as conn:
+            conn.execute('DELETE FROM pending_verifications WHERE expires_at < ?', (datetime.now(),))
 
     # Channel lock operations
     def add_channel_lock(self, channel_id: str, channel_username: str = None,
                          channel_title: str = None) -> bool:
         """Add channel to lock list (max 2 channels)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-
-        # Check if already have 2 channels
-        cursor.execute('SELECT COUNT(*) as count FROM channel_lock WHERE is_active = 1')
-        result = cursor.fetchone()
-        if result and result['count'] >= 2:
-            conn.close()
-            return False
-
         try:
-            cursor.execute('''
-                INSERT INTO channel_lock (channel_id, channel_username, channel_title, is_active)
-                VALUES (?, ?, ?, 1)
-                ON CONFLICT(channel_id) DO UPDATE SET
-                    channel_username = excluded.channel_username,
-                    channel_title = excluded.channel_title,
-                    is_active = 1
-            ''', (channel_id, channel_username, channel_title))
-            conn.commit()
-            conn.close()
-            return True
+            with self._writer() as conn:
+                # Check if already have 2 channels
+                result = conn.execute(
+                    'SELECT COUNT(*) as count FROM channel_lock WHERE is_active = 1'
+                ).fetchone()
+                if result and result['count'] >= 2:
+                    return False
+
+                conn.execute('''
+                    INSERT INTO channel_lock (channel_id, channel_username, channel_title, is_active)
+                    VALUES (?, ?, ?, 1)
+                    ON CONFLICT(channel_id) DO UPDATE SET
+                        channel_username = excluded.channel_username,
+                        channel_title = excluded.channel_title,
+                        is_active = 1
+                ''', (channel_id, channel_username, channel_title))
         except Exception as e:
             logger.error(f"Error adding channel lock: {e}")
-            conn.close()
             return False
 
+        self._cache.pop('locked_channels', None)
+        return True
+
     def remove_channel_lock(self, channel_id: str):
         """Remove channel from lock list"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM channel_lock WHERE channel_id = ?', (channel_id,))
-        conn.commit()
-        conn.close()
+        with self._writer() as conn:
+            conn.execute('DELETE FROM channel_lock WHERE channel_id = ?', (channel_id,))
+        self._cache.pop('locked_channels', None)
 
     def get_locked_channels(self) -> List[Dict]:
         """Get all locked channels"""
+        return self._cached('locked_channels', self._load_locked_channels)
+
+    def _load_locked_channels(self) -> List[Dict]:
+        """Read active locked channels"""
         conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM channel_lock WHERE is_active = 1')
         rows = cursor.fetchall()
-        conn.close()
         return [dict(row) for row in rows]
 
+    def get_channel(self, channel_id: str) -> Optional[Dict]:
+        """Get channel lock entry by channel ID"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM channel_lock WHERE channel_id = ?', (channel_id,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
     def is_channel_lock_enabled(self) -> bool:
         """Check if channel lock is enabled"""
-        channels = self.get_locked_channels()
-        return len(channels) > 0
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT EXISTS(SELECT 1 FROM channel_lock WHERE is_active = 1)')
+        return bool(cursor.fetchone()[0])
 
     def toggle_channel_lock(self, channel_id: str, active: bool):
         """Toggle channel lock status"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('UPDATE channel_lock SET is_active = ? WHERE channel_id = ?',
-                      (1 if active else 0, channel_id))
-        conn.commit()
-        conn.close()
+        with self._writer() as conn:
+            conn.execute('UPDATE channel_lock SET is_active = ? WHERE channel_id = ?',
+                         (1 if active else 0, channel_id))
+        self._cache.pop('locked_channels', None)
 
     # Bot settings operations
     def get_setting(self, key: str, default: str = None) -> Optional[str]:
         """Get bot setting"""
+        value = self._cached(('setting', key), lambda: self._load_setting(key))
+        return default if value is None else value
+
+    def _load_setting(self, key: str) -> Optional[str]:
+        """Read bot setting value (None if unset)"""
         conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute('SELECT value FROM bot_settings WHERE key = ?', (key,))
         row = cursor.fetchone()
-        conn.close()
-        return row['value'] if row else default
+        return row['value'] if row else None
 
     def set_setting(self, key: str, value: str):
         """Set bot setting"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO bot_settings (key, value, updated_at)
-            VALUES (?, ?, datetime('now'))
-            ON CONFLICT(key) DO UPDATE SET
-                value = excluded.value,
-                updated_at = datetime('now')
-        ''', (key, value))
-        conn.commit()
-        conn.close()
+        with self._writer() as conn:
+            conn.execute('''
+                INSERT INTO bot_settings (key, value, updated_at)
+                VALUES (?, ?, datetime('now'))
+                ON CONFLICT(key) DO UPDATE SET
+                    value = excluded.value,
+                    updated_at = datetime('now')
+            ''', (key, value))
+        self._cache.pop(('setting', key), None)
 
     def get_all_settings(self) -> Dict[str, str]:
         """Get all bot settings"""
@@ -524,33 +811,25 @@ class Database:
         cursor = conn.cursor()
         cursor.execute('SELECT key, value FROM bot_settings')
         rows = cursor.fetchall()
-        conn.close()
         return {row['key']: row['value'] for row in rows}
 
     # Admin Instagram accounts operations
     def add_admin_instagram_account(self, username: str, session_file: str = None,
                                     is_primary: bool = False) -> int:
-        """Add admin Instagram account"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        """Add or update admin Instagram account"""
+        with self._writer() as conn:
+            # If setting as primary, unset the current primary account
+            if is_primary:
+                conn.execute(
+                    'UPDATE admin_instagram_accounts SET is_primary = 0 '
+                    'WHERE is_primary = 1 AND username != ?', (username,)
+                )
 
-        # If setting as primary, unset others
-        if is_primary:
-            cursor.execute('UPDATE admin_instagram_accounts SET is_primary = 0')
+            row = conn.execute(ADMIN_ACCOUNT_UPSERT + 'RETURNING id',
+                               (username, session_file, 1 if is_primary else 0)).fetchone()
 
-        cursor.execute('''
-            INSERT INTO admin_instagram_accounts (username, session_file, is_primary, is_active)
-            VALUES (?, ?, ?, 1)
-            ON CONFLICT(username) DO UPDATE SET
-                session_file = excluded.session_file,
-                is_primary = excluded.is_primary,
-                is_active = 1
-        ''', (username, session_file, 1 if is_primary else 0))
-
-        account_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return account_id
+        self._cache.pop('primary_admin', None)
+        return row['id']
 
     def get_admin_instagram_accounts(self) -> List[Dict]:
         """Get all admin Instagram accounts"""
@@ -558,37 +837,35 @@ class Database:
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM admin_instagram_accounts WHERE is_active = 1 ORDER BY is_primary DESC')
         rows = cursor.fetchall()
-        conn.close()
         return [dict(row) for row in rows]
 
     def get_primary_admin_instagram(self) -> Optional[Dict]:
         """Get primary admin Instagram account"""
+        return self._cached('primary_admin', self._load_primary_admin_instagram)
+
+    def _load_primary_admin_instagram(self) -> Optional[Dict]:
+        """Read primary admin Instagram account"""
         conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM admin_instagram_accounts WHERE is_primary = 1 AND is_active = 1')
         row = cursor.fetchone()
-        conn.close()
         return dict(row) if row else None
 
     def delete_admin_instagram_account(self, account_id: int):
         """Delete admin Instagram account"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM admin_instagram_accounts WHERE id = ?', (account_id,))
-        conn.commit()
-        conn.close()
+        with self._writer() as conn:
+            conn.execute('DELETE FROM admin_instagram_accounts WHERE id = ?', (account_id,))
+        self._cache.pop('primary_admin', None)
 
     def update_admin_instagram_session(self, username: str, session_file: str):
         """Update admin Instagram session file"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE admin_instagram_accounts
-            SET session_file = ?, last_check = datetime('now')
-            WHERE username = ?
-        ''', (session_file, username))
-        conn.commit()
-        conn.close()
+        with self._writer() as conn:
+            conn.execute('''
+                UPDATE admin_instagram_accounts
+                SET session_file = ?, last_check = datetime('now')
+                WHERE username = ?
+            ''', (session_file, username))
+        self._cache.pop('primary_admin', None)
 
     # Statistics operations
     def get_today_downloads(self) -> int:
@@ -597,10 +874,9 @@ class Database:
         cursor = conn.cursor()
         cursor.execute('''
             SELECT COUNT(*) as count FROM downloads
-            WHERE date(download_time) = date('now')
+            WHERE download_time >= date('now') AND download_time < date('now', '+1 day')
         ''')
         result = cursor.fetchone()
-        conn.close()
         return result['count'] if result else 0
 
     def get_today_users(self) -> int:
@@ -609,20 +885,23 @@ class Database:
         cursor = conn.cursor()
         cursor.execute('''
             SELECT COUNT(*) as count FROM users
-            WHERE date(created_at) = date('now')
+            WHERE created_at >= date('now') AND created_at < date('now', '+1 day')
         ''')
         result = cursor.fetchone()
-        conn.close()
         return result['count'] if result else 0
 
     def get_banned_users_count(self) -> int:
         """Get banned users count"""
+        return self._counter('users_banned')
+
+    def get_banned_users(self) -> List[Dict]:
+        """Get banned users"""
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) as count FROM users WHERE is_banned = 1')
-        result = cursor.fetchone()
-        conn.close()
-        return result['count'] if result else 0
+        cursor.execute('SELECT user_id, username, first_name, is_banned FROM users '
+                      'WHERE is_banned = 1 ORDER BY created_at DESC')
+        rows = cursor.fetchall()
+        return [dict(row) for row in rows]
 
     def get_downloads_by_type(self) -> Dict[str, int]:
         """Get download counts by media type"""
@@ -634,21 +913,83 @@ class Database:
             GROUP BY media_type
         ''')
         rows = cursor.fetchall()
-        conn.close()
         return {row['media_type']: row['count'] for row in rows}
 
-    def search_users(self, query: str) -> List[Dict]:
-        """Search users by username or user_id"""
+    def get_stats_summary(self) -> Dict[str, Any]:
+        """Get all admin statistics with one pass over downloads"""
         conn = self.get_connection()
         cursor = conn.cursor()
+        
+        cursor.execute('''
+            WITH today AS (SELECT date('now') AS start, date('now', '+1 day') AS stop)
+            SELECT
+                (SELECT value FROM counters WHERE name = 'users_total') AS total_users,
+                (SELECT COUNT(*) FROM users, today
+                 WHERE created_at >= today.start AND created_at < today.stop) AS today_users,
+                (SELECT value FROM counters WHERE name = 'users_banned') AS banned_users,
+                (SELECT value FROM counters WHERE name = 'downloads_total') AS total_downloads,
+                (SELECT COUNT(*) FROM instagram_accounts WHERE is_verified = 1) AS verified_accounts,
+                (SELECT COUNT(*) FROM bot_sessions WHERE is_active = 1) AS active_sessions
+        ''')
+        stats = dict(cursor.fetchone())
+        
+        # Per-type totals and today's downloads from the same scan
         cursor.execute('''
-            SELECT * FROM users
-            WHERE username LIKE ? OR CAST(user_id AS TEXT) LIKE ? OR first_name LIKE ?
-            LIMIT 20
-        ''', (f'%{query}%', f'%{query}%', f'%{query}%'))
+            WITH today AS (SELECT date('now') AS start, date('now', '+1 day') AS stop)
+            SELECT media_type, COUNT(*) AS count,
+                   SUM(download_time >= today.start AND download_time < today.stop) AS today
+            FROM downloads, today
+            GROUP BY media_type
+        ''')
         rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
+        stats['downloads_by_type'] = {row['media_type']: row['count'] for row in rows}
+        stats['today_downloads'] = sum(row['today'] for row in rows)
+        return stats
+
+    def search_users(self, query: str) -> List[Dict]:
+        """
+        Search users by user_id, username or first name (up to 20 results)
+        Exact ID matches come first, then username-prefix matches, then any
+        other substring match of the user_id, username or first name
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        query = query.lstrip('@')
+        results = {}  # user_id -> row, in ranking order
+        
+        def collect():
+            for row in cursor.fetchall():
+                if len(results) >= 20:
+                    break
+                results.setdefault(row['user_id'], dict(row))
+        
+        # Exact ID and username-prefix matches can use the primary key/index
+        if query.isdigit():
+            cursor.execute('SELECT * FROM users WHERE user_id = ?', (int(query),))
+            collect()
+        
+        cursor.execute('SELECT * FROM users WHERE username LIKE ? LIMIT 20', (f'{query}%',))
+        collect()
+        
+        # Substring matches include the rows above, so 20 of them always fill
+        # the remaining slots. The trigram index covers all three columns
+        # (user_id as text too) for 3+ characters; shorter ones scan
+        if len(results) < 20:
+            if len(query) >= 3:
+                cursor.execute('''
+                    SELECT u.* FROM users_fts f JOIN users u ON u.user_id = f.rowid
+                    WHERE users_fts MATCH ?
+                    LIMIT 20
+                ''', ('"' + query.replace('"', '""') + '"',))
+            else:
+                cursor.execute('''
+                    SELECT * FROM users
+                    WHERE username LIKE ? OR CAST(user_id AS TEXT) LIKE ? OR first_name LIKE ?
+                    LIMIT 20
+                ''', (f'%{query}%', f'%{query}%', f'%{query}%'))
+            collect()
+        
+        return list(results.values())
 
 # Global database instance
 db = Database()
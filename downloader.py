@@ -3,54 +3,215 @@ Download Manager for MX-BOT
 Handles media downloads with yt-dlp integration
 """
 import os
+import asyncio
+import functools
 import logging
 import subprocess
 import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional, List, Dict
-from datetime import datetime
+from typing import Optional, List, Dict, Callable, NamedTuple, Tuple
+from urllib.parse import urlparse
+import aiofiles
+import aiofiles.os
 import yt_dlp
+from yt_dlp.extractor import gen_extractor_classes
 
 logger = logging.getLogger(__name__)
 
+# Threads running blocking yt-dlp calls for the async wrappers
+DOWNLOAD_WORKERS = 8
+# Concurrent yt-dlp requests per host, so parallel users don't trigger throttling
+HOST_CONCURRENCY = 4
+
+# Extracted video info is reused for repeat URLs for this many seconds
+URL_INFO_TTL = 24 * 3600
+# Least recently used entries are evicted beyond this many URLs, and a full
+# cache only admits URLs requested more often than the entry they replace
+URL_CACHE_SIZE = 1024
+# Parsed quality menus kept per video ID
+FORMATS_CACHE_SIZE = 256
+# yt-dlp sorts info['formats'] worst to best by resolution, preferring mp4/m4a
+FORMAT_SORT = ['res', 'ext:mp4:m4a']
+# YoutubeDL instances kept per worker thread, one per distinct option set
+YDL_POOL_SIZE = 8
+
+class DownloadProgress(NamedTuple):
+    """One yt-dlp progress update; total and speed are None when unknown"""
+    downloaded_bytes: int
+    total_bytes: Optional[int]
+    speed: Optional[float]
+
+@functools.lru_cache(maxsize=4096)
+def _url_hash(url: str) -> str:
+    """Short BLAKE2b hash of a URL, memoized since each URL is hashed several times"""
+    return hashlib.blake2b(url.encode(), digest_size=6).hexdigest()
+
 class Downloader:
     def __init__(self, download_dir: str = 'downloads'):
         self.download_dir = Path(download_dir)
         self.download_dir.mkdir(exist_ok=True)
-        self.url_cache = {}  # Cache for URL info
+        self.url_cache = OrderedDict()  # url_hash -> URL info, in LRU order
+        self._formats_cache = OrderedDict()  # video ID -> parsed formats, in LRU order
+        self._local = threading.local()  # per-thread YoutubeDL pool
+        self._cache_lock = threading.Lock()  # url_cache and _formats_cache are used from worker threads
+        self._url_requests: Dict[str, int] = {}  # url_hash -> recent request count
+        self._requests_since_aging = 0
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._extractors = None  # yt-dlp extractor classes, loaded on first URL check
+        self._executor = ThreadPoolExecutor(
+            max_workers=DOWNLOAD_WORKERS, thread_name_prefix='yt-dlp'
+        )
+        # Single-flight downloads keyed by URL and format, and how many
+        # callers are still using each downloaded file
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+        self._file_users: Dict[str, int] = {}
+        # Progress callback per YoutubeDL in use, and the queues of each download's callers
+        self._progress_callbacks: Dict[yt_dlp.YoutubeDL, Callable] = {}
+        self._progress_queues: Dict[tuple, set] = {}
+        # ffmpeg is CPU-bound, so cap concurrent conversions at the core count
+        self._ffmpeg_semaphore = asyncio.Semaphore(os.cpu_count() or 1)
+
+    async def _run(self, func, *args, **kwargs):
+        """Run a blocking call in the download thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    def _cache_get(self, url_hash: str) -> Optional[Dict]:
+        """Return a live url_cache entry and mark it recently used"""
+        with self._cache_lock:
+            self._record_request(url_hash)
+            entry = self.url_cache.get(url_hash)
+            if entry is None:
+                return None
+            if entry['expires_at'] <= time.monotonic():
+                del self.url_cache[url_hash]
+                return None
+            self.url_cache.move_to_end(url_hash)
+            return entry
+
+    def _cache_put(self, url_hash: str, entry: Dict):
+        """Store a url_cache entry, evicting the least recently used beyond URL_CACHE_SIZE"""
+        with self._cache_lock:
+            if url_hash not in self.url_cache and len(self.url_cache) >= URL_CACHE_SIZE:
+                # TinyLFU-style admission: a full cache only takes a URL that has
+                # been requested more often than the entry it would evict
+                victim = next(iter(self.url_cache))
+                expired = self.url_cache[victim]['expires_at'] <= time.monotonic()
+                if not expired and self._url_requests.get(url_hash, 0) <= self._url_requests.get(victim, 0):
+                    return
+                del self.url_cache[victim]
+            self.url_cache[url_hash] = entry
+            self.url_cache.move_to_end(url_hash)
+
+    def _record_request(self, url_hash: str):
+        """Count a request for admission decisions, halving all counts periodically"""
+        self._url_requests[url_hash] = self._url_requests.get(url_hash, 0) + 1
+        self._requests_since_aging += 1
+        if self._requests_since_aging >= URL_CACHE_SIZE * 10:
+            # Aging keeps the counts recent and drops URLs not seen lately
+            self._url_requests = {
+                key: count // 2 for key, count in self._url_requests.items() if count > 1
+            }
+            self._requests_since_aging = 0
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        """Semaphore capping concurrent yt-dlp requests to the URL's host"""
+        host = (urlparse(url).hostname or '').removeprefix('www.')
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._host_semaphores[host] = asyncio.Semaphore(HOST_CONCURRENCY)
+        return semaphore
+
+    @contextmanager
+    def _ydl(self, ydl_opts: Dict):
+        """
+        Borrow this thread's YoutubeDL for these options, creating it on first use
+        Instances are reused across calls so extractors and the HTTP setup are
+        initialized once; one that failed unexpectedly is discarded
+        """
+        pool = getattr(self._local, 'ydl_pool', None)
+        if pool is None:
+            pool = self._local.ydl_pool = OrderedDict()
+
+        key = json.dumps(ydl_opts, sort_keys=True, default=str)
+        ydl = pool.pop(key, None)
+        if ydl is None:
+            ydl = yt_dlp.YoutubeDL(ydl_opts)
+            ydl.add_progress_hook(functools.partial(self._on_progress, ydl))
+        reusable = True
+        try:
+            yield ydl
+        except yt_dlp.utils.DownloadError:
+            # Ordinary extraction failure, the instance itself is fine
+            raise
+        except BaseException:
+            reusable = False
+            raise
+        finally:
+            if reusable:
+                pool[key] = ydl
+                while len(pool) > YDL_POOL_SIZE:
+                    _, evicted = pool.popitem(last=False)
+                    evicted.close()
+            else:
+                ydl.close()
+
+    def _on_progress(self, ydl, status: Dict):
+        """yt-dlp progress hook, forwarded to the callback of the download using ydl"""
+        callback = self._progress_callbacks.get(ydl)
+        if callback is None or status.get('status') != 'downloading':
+            return
+        callback(DownloadProgress(
+            status.get('downloaded_bytes') or 0,
+            status.get('total_bytes') or status.get('total_bytes_estimate'),
+            status.get('speed')
+        ))
 
     def get_url_hash(self, url: str) -> str:
-        """Generate a short hash for URL identification"""
-        return hashlib.md5(url.encode()).hexdigest()[:12]
+        """Generate a short hash for URL identification (12 hex chars)"""
+        return _url_hash(url)
 
     def get_video_info(self, url: str) -> Optional[Dict]:
         """
         Get video information without downloading
         Returns detailed info for quality selection
+        Repeat requests within URL_INFO_TTL are served from the cache
         """
+        entry = self._lookup(url) or self._extract_video_info(url)
+        return entry['info'] if entry else None
+
+    def _lookup(self, url: str) -> Optional[Dict]:
+        """Live url_cache entry for exactly this URL"""
+        entry = self._cache_get(self.get_url_hash(url))
+        return entry if entry and entry['url'] == url else None
+
+    def _extract_video_info(self, url: str) -> Optional[Dict]:
+        """Extract a URL with yt-dlp and return its url_cache entry (cached if admitted)"""
+        url_hash = self.get_url_hash(url)
         try:
             ydl_opts = {
                 'quiet': True,
                 'no_warnings': True,
                 'extract_flat': False,
+                'format_sort': FORMAT_SORT,
             }
 
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            with self._ydl(ydl_opts) as ydl:
                 info = ydl.extract_info(url, download=False)
 
                 if not info:
                     return None
 
-                # Cache the info
-                url_hash = self.get_url_hash(url)
-                self.url_cache[url_hash] = {
-                    'url': url,
-                    'info': info,
-                    'timestamp': datetime.now()
-                }
-
                 # Format the info
-                return {
+                summary = {
                     'title': info.get('title', 'Unknown'),
                     'uploader': info.get('uploader', info.get('channel', 'Unknown')),
                     'duration': info.get('duration', 0),
@@ -61,20 +222,44 @@ class Downloader:
                     'thumbnail': info.get('thumbnail', ''),
                     'webpage_url': info.get('webpage_url', url),
                     'id': info.get('id', ''),
-                    'formats': self._parse_formats(info.get('formats', [])),
+                    'formats': self._parse_formats(info.get('formats', []), info.get('id')),
                     'url_hash': url_hash,
                 }
 
+                # Cache the formatted info and format list only; the raw yt-dlp dict is large
+                entry = {
+                    'url': url,
+                    'info': summary,
+                    'formats': self._list_formats(info.get('formats', [])),
+                    'expires_at': time.monotonic() + URL_INFO_TTL
+                }
+                self._cache_put(url_hash, entry)
+                return entry
+
         except Exception as e:
             logger.error(f"Failed to get video info: {e}")
             return None
 
-    def _parse_formats(self, formats: List[Dict]) -> List[Dict]:
-        """Parse and filter available formats"""
+    def _parse_formats(self, formats: List[Dict], video_id: Optional[str] = None) -> Tuple[Dict, ...]:
+        """
+        Parse and filter available formats (memoized by video ID)
+        Expects yt-dlp's worst-to-best order from FORMAT_SORT
+        Returns a tuple, since memoized results are shared between callers
+        """
+        if video_id:
+            # Runs on executor threads; eviction must not race the LRU touch
+            with self._cache_lock:
+                cached = self._formats_cache.get(video_id)
+                if cached is not None:
+                    self._formats_cache.move_to_end(video_id)
+                    return cached
+
         parsed = []
         seen_qualities = set()
 
-        for fmt in formats:
+        # Walk best first so each quality label keeps its best variant and
+        # the loop can stop at the top 8 options
+        for fmt in reversed(formats):
             if not fmt.get('url'):
                 continue
 
@@ -116,18 +301,23 @@ class Downloader:
                 'has_video': vcodec != 'none',
                 'has_audio': acodec != 'none',
             })
-
-        # Sort by height (quality) descending
-        parsed.sort(key=lambda x: x.get('height', 0), reverse=True)
-
-        # Limit to top 8 quality options
-        return parsed[:8]
-
-    def download_with_ytdlp(self, url: str, extract_audio: bool = False,
-                           quality: str = 'best', format_id: str = None) -> Optional[Dict]:
+            if len(parsed) == 8:
+                break
+
+        parsed = tuple(parsed)
+        if video_id:
+            with self._cache_lock:
+                self._formats_cache[video_id] = parsed
+                if len(self._formats_cache) > FORMATS_CACHE_SIZE:
+                    self._formats_cache.popitem(last=False)
+        return parsed
+
+    def _download_raw(self, url: str, extract_audio: bool = False,
+                      quality: str = 'best', format_id: str = None,
+                      progress: Optional[Callable[[DownloadProgress], None]] = None) -> Optional[Dict]:
         """
-        Download media using yt-dlp with quality options
-        Returns dict with file path and info
+        Download media using yt-dlp without any postprocessing
+        Audio requests return the raw audio stream, converted to MP3 separately
         """
         try:
             output_template = str(self.download_dir / '%(title).100s.%(ext)s')
@@ -137,18 +327,21 @@ class Downloader:
                 'quiet': False,
                 'no_warnings': False,
                 'restrictfilenames': True,
+                'postprocessors': [],
+                # Resume partial files and retry transient failures with ranged
+                # chunk requests instead of restarting from byte 0
+                'continuedl': True,
+                'retries': 10,
+                'fragment_retries': 10,
+                'http_chunk_size': 10 * 1024 * 1024,
+                # Fetch HLS/DASH fragments in parallel
+                'concurrent_fragment_downloads': 4,
             }
 
             # Set format based on options
-            if extract_audio:
-                ydl_opts.update({
-                    'format': 'bestaudio/best',
-                    'postprocessors': [{
-                        'key': 'FFmpegExtractAudio',
-                        'preferredcodec': 'mp3',
-                        'preferredquality': '192',
-                    }],
-                })
+            if extract_audio or quality == 'audio':
+                ydl_opts['format'] = 'bestaudio/best'
+                extract_audio = True
             elif format_id and format_id != 'best':
                 ydl_opts['format'] = f'{format_id}+bestaudio/best'
             elif quality == 'best':
@@ -161,29 +354,18 @@ class Downloader:
                 ydl_opts['format'] = 'bestvideo[height<=360]+bestaudio/best[height<=360]'
             elif quality == '240':
                 ydl_opts['format'] = 'bestvideo[height<=240]+bestaudio/best[height<=240]'
-            elif quality == 'audio':
-                ydl_opts.update({
-                    'format': 'bestaudio/best',
-                    'postprocessors': [{
-                        'key': 'FFmpegExtractAudio',
-                        'preferredcodec': 'mp3',
-                        'preferredquality': '192',
-                    }],
-                })
-                extract_audio = True
             else:
                 ydl_opts['format'] = 'best[filesize<50M]/best'
 
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            with self._ydl(ydl_opts) as ydl:
                 # Get info and download
-                info = ydl.extract_info(url, download=True)
-
-                # Get the downloaded file path
-                if extract_audio or quality == 'audio':
-                    filename = ydl.prepare_filename(info)
-                    filepath = os.path.splitext(filename)[0] + '.mp3'
-                else:
-                    filepath = ydl.prepare_filename(info)
+                if progress:
+                    self._progress_callbacks[ydl] = progress
+                try:
+                    info = ydl.extract_info(url, download=True)
+                finally:
+                    self._progress_callbacks.pop(ydl, None)
+                filepath = ydl.prepare_filename(info)
 
                 # Format upload date
                 upload_date = info.get('upload_date', '')
@@ -205,13 +387,140 @@ class Downloader:
                     'upload_date': upload_date,
                     'video_id': info.get('id', ''),
                     'webpage_url': info.get('webpage_url', url),
-                    'is_audio': extract_audio or quality == 'audio',
+                    'is_audio': extract_audio,
                 }
 
         except Exception as e:
             logger.error(f"yt-dlp download failed: {e}")
             return None
 
+    def _mp3_command(self, source: Path, target: Path) -> List[str]:
+        """ffmpeg command converting any media file to MP3"""
+        return [
+            'ffmpeg',
+            '-i', str(source),
+            '-vn',  # No video
+            '-acodec', 'libmp3lame',
+            '-q:a', '2',  # Quality
+            str(target),
+            '-y'  # Overwrite
+        ]
+
+    def _postprocess_to_mp3(self, path: str) -> Optional[str]:
+        """Convert a raw download to MP3 and remove the source file"""
+        source = Path(path)
+        if source.suffix == '.mp3':
+            return path
+        audio_path = self.extract_audio_from_video(path)
+        if audio_path:
+            self.cleanup_file(path)
+        return audio_path
+
+    async def _postprocess_to_mp3_async(self, path: str) -> Optional[str]:
+        """Convert a raw download to MP3 without blocking the loop and remove the source file"""
+        if Path(path).suffix == '.mp3':
+            return path
+        audio_path = await self.extract_audio_from_video_async(path)
+        if audio_path:
+            await self.cleanup_file_async(path)
+        return audio_path
+
+    def download_with_ytdlp(self, url: str, extract_audio: bool = False,
+                           quality: str = 'best', format_id: str = None) -> Optional[Dict]:
+        """
+        Download media using yt-dlp with quality options
+        Returns dict with file path and info
+        """
+        result = self._download_raw(url, extract_audio, quality, format_id)
+        if result and result['is_audio']:
+            result['filepath'] = self._postprocess_to_mp3(result['filepath'])
+            if not result['filepath']:
+                return None
+        return result
+
+    async def get_video_info_async(self, url: str) -> Optional[Dict]:
+        """Async version of get_video_info, extractions are capped per host"""
+        entry = self._lookup(url)
+        if entry is None:
+            async with self._host_semaphore(url):
+                entry = await self._run(self._extract_video_info, url)
+        return entry['info'] if entry else None
+
+    async def download_with_ytdlp_async(self, url: str, extract_audio: bool = False,
+                                        quality: str = 'best', format_id: str = None,
+                                        progress_queue: Optional[asyncio.Queue] = None) -> Optional[Dict]:
+        """
+        Async version of download_with_ytdlp
+        Concurrent requests for the same URL and format share one download;
+        each caller must hand the file back with release_file_async.
+        DownloadProgress updates are put on progress_queue while downloading
+        """
+        key = (self.get_url_hash(url), url, extract_audio, quality, format_id)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(
+                self._download_async(url, extract_audio, quality, format_id, key)
+            )
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        if progress_queue is not None:
+            self._progress_queues.setdefault(key, set()).add(progress_queue)
+        try:
+            # Shield so one caller giving up doesn't cancel the download for the others
+            result = await asyncio.shield(task)
+        finally:
+            if progress_queue is not None:
+                queues = self._progress_queues.get(key)
+                if queues is not None:
+                    queues.discard(progress_queue)
+                    if not queues:
+                        del self._progress_queues[key]
+        if not result:
+            return None
+        path = result['filepath']
+        self._file_users[path] = self._file_users.get(path, 0) + 1
+        return dict(result)
+
+    async def _download_async(self, url: str, extract_audio: bool,
+                              quality: str, format_id: Optional[str], key: tuple) -> Optional[Dict]:
+        """
+        Download in the thread pool, then convert to MP3 outside it
+        The download thread is released before the MP3 conversion, so the next
+        download overlaps with ffmpeg instead of waiting behind it
+        """
+        loop = asyncio.get_running_loop()
+
+        def progress(update: DownloadProgress):
+            # Called from the download thread
+            loop.call_soon_threadsafe(self._publish_progress, key, update)
+
+        async with self._host_semaphore(url):
+            result = await self._run(
+                self._download_raw, url,
+                extract_audio=extract_audio, quality=quality, format_id=format_id,
+                progress=progress
+            )
+        if result and result['is_audio']:
+            result['filepath'] = await self._postprocess_to_mp3_async(result['filepath'])
+            if not result['filepath']:
+                return None
+        return result
+
+    def _publish_progress(self, key: tuple, update: DownloadProgress):
+        """Hand a progress update to every caller waiting on the download"""
+        for queue in self._progress_queues.get(key, ()):
+            queue.put_nowait(update)
+
+    async def release_file_async(self, filepath: str):
+        """Drop one caller's use of a shared download, deleting it after the last one"""
+        users = self._file_users.get(filepath, 1) - 1
+        if users > 0:
+            self._file_users[filepath] = users
+            return
+        self._file_users.pop(filepath, None)
+        await self.cleanup_file_async(filepath)
+
     def download_audio_only(self, url: str) -> Optional[Dict]:
         """Download only audio as MP3"""
         return self.download_with_ytdlp(url, extract_audio=True)
@@ -233,15 +542,7 @@ class Downloader:
             audio_path = video_path.with_suffix('.mp3')
 
             # Use ffmpeg to extract audio
-            command = [
-                'ffmpeg',
-                '-i', str(video_path),
-                '-vn',  # No video
-                '-acodec', 'libmp3lame',
-                '-q:a', '2',  # Quality
-                str(audio_path),
-                '-y'  # Overwrite
-            ]
+            command = self._mp3_command(video_path, audio_path)
 
             result = subprocess.run(
                 command,
@@ -264,6 +565,31 @@ class Downloader:
             logger.error(f"Audio extraction failed: {e}")
             return None
 
+    async def extract_audio_from_video_async(self, video_path: str) -> Optional[str]:
+        """Async version of extract_audio_from_video, at most one ffmpeg job per CPU"""
+        video_path = Path(video_path)
+        audio_path = video_path.with_suffix('.mp3')
+        try:
+            async with self._ffmpeg_semaphore:
+                proc = await asyncio.create_subprocess_exec(
+                    *self._mp3_command(video_path, audio_path),
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                _, stderr = await proc.communicate()
+            if proc.returncode != 0:
+                logger.error(f"FFmpeg error: {stderr.decode(errors='replace')}")
+                return None
+        except Exception as e:
+            logger.error(f"Audio extraction failed: {e}")
+            return None
+
+        if audio_path.exists():
+            logger.info(f"Audio extracted to {audio_path}")
+            return str(audio_path)
+        logger.error("Audio file not created")
+        return None
+
     def get_file_size(self, filepath: str) -> int:
         """Get file size in bytes"""
         try:
@@ -271,6 +597,22 @@ class Downloader:
         except:
             return 0
 
+    async def get_file_size_async(self, filepath: str) -> int:
+        """Async version of get_file_size"""
+        try:
+            return await aiofiles.os.path.getsize(filepath)
+        except OSError:
+            return 0
+
+    async def read_file_async(self, filepath: str) -> bytes:
+        """Read a downloaded file for upload without blocking the event loop"""
+        async with aiofiles.open(filepath, 'rb') as f:
+            return await f.read()
+
+    async def cleanup_file_async(self, filepath: str):
+        """Async version of cleanup_file"""
+        await self._run(self.cleanup_file, filepath)
+
     def cleanup_file(self, filepath: str):
         """Delete file"""
         try:
@@ -283,61 +625,66 @@ class Downloader:
     def cleanup_old_files(self, max_age_hours: int = 24):
         """Clean up old downloaded files"""
         try:
-            import time
-            current_time = time.time()
+            cutoff = time.time() - max_age_hours * 3600
 
-            for file_path in self.download_dir.iterdir():
-                if file_path.is_file():
-                    file_age = current_time - file_path.stat().st_mtime
-                    if file_age > (max_age_hours * 3600):
-                        file_path.unlink()
-                        logger.info(f"Cleaned up old file: {file_path}")
+            # scandir entries carry the file type from readdir, so only the
+            # mtime needs a stat call and no Path objects are built
+            with os.scandir(self.download_dir) as entries:
+                for entry in entries:
+                    if entry.is_file(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+                        os.unlink(entry.path)
+                        logger.info(f"Cleaned up old file: {entry.path}")
 
         except Exception as e:
             logger.error(f"Cleanup failed: {e}")
 
     def is_supported_url(self, url: str) -> bool:
-        """Check if URL is supported by yt-dlp"""
+        """Check if URL is supported by yt-dlp (local extractor regex match, no network)"""
+        if self._extractors is None:
+            self._extractors = gen_extractor_classes()
+        return any(ie.suitable(url) and ie.IE_NAME != 'generic' for ie in self._extractors)
+
+    async def is_supported_url_async(self, url: str) -> bool:
+        """Async version of is_supported_url"""
+        return await self._run(self.is_supported_url, url)
+
+    def verify_url(self, url: str) -> bool:
+        """Check that yt-dlp can actually extract the URL (network round-trip)"""
         try:
-            with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
+            with self._ydl({'quiet': True}) as ydl:
                 ydl.extract_info(url, download=False)
                 return True
         except:
             return False
 
-    def get_formats(self, url: str) -> Optional[List[Dict]]:
-        """Get available formats for URL"""
-        try:
-            ydl_opts = {
-                'quiet': True,
-                'no_warnings': True,
-            }
-
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                formats = info.get('formats', [])
-
-                # Filter and format info
-                available_formats = []
-                for fmt in formats:
-                    available_formats.append({
-                        'format_id': fmt.get('format_id'),
-                        'ext': fmt.get('ext'),
-                        'quality': fmt.get('format_note', 'unknown'),
-                        'filesize': fmt.get('filesize', 0),
-                    })
+    async def verify_url_async(self, url: str) -> bool:
+        """Async version of verify_url"""
+        return await self._run(self.verify_url, url)
 
-                return available_formats
-
-        except Exception as e:
-            logger.error(f"Failed to get formats: {e}")
+    def get_formats(self, url: str) -> Optional[List[Dict]]:
+        """Get available formats for URL (reuses get_video_info's extraction)"""
+        entry = self._lookup(url) or self._extract_video_info(url)
+        if not entry:
+            logger.error("Failed to get formats")
             return None
+        return list(entry['formats'])
+
+    def _list_formats(self, formats: List[Dict]) -> List[Dict]:
+        """Compact description of every format, as returned by get_formats"""
+        return [
+            {
+                'format_id': fmt.get('format_id'),
+                'ext': fmt.get('ext'),
+                'quality': fmt.get('format_note', 'unknown'),
+                'filesize': fmt.get('filesize', 0),
+            }
+            for fmt in formats
+        ]
 
     def get_cached_url(self, url_hash: str) -> Optional[str]:
         """Get original URL from cache by hash"""
-        if url_hash in self.url_cache:
-            return self.url_cache[url_hash].get('url')
-        return None
+        entry = self._cache_get(url_hash)
+        return entry['url'] if entry else None
 
     def clear_cache(self):
         """Clear URL cache"""
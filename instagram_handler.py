@@ -2,9 +2,12 @@
 Instagram Handler for MX-BOT
 Wrapper for Instagram API operations
 """
+import asyncio
+import functools
 import logging
 import time
-from typing import Optional, Dict, List, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, List, Any, Iterable, Set
 from instagrapi import Client
 from instagrapi.exceptions import (
     MediaNotFound,
@@ -16,9 +19,29 @@ from session_manager import session_manager
 
 logger = logging.getLogger(__name__)
 
+# Threads running blocking calls on the shared instagrapi client; instagrapi keeps
+# the last response in client.last_json, so calls on one client must not overlap
+INSTAGRAM_WORKERS = 1
+# Carousel items downloaded at once, kept low to stay under Instagram rate limits
+ALBUM_DOWNLOAD_CONCURRENCY = 4
+
 class InstagramHandler:
     def __init__(self):
         self.client = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=INSTAGRAM_WORKERS, thread_name_prefix='instagram'
+        )
+        # Media file downloads use plain HTTP requests and can run side by side
+        self._download_executor = ThreadPoolExecutor(
+            max_workers=ALBUM_DOWNLOAD_CONCURRENCY, thread_name_prefix='instagram-download'
+        )
+    
+    async def _run(self, func, *args, _executor=None, **kwargs):
+        """Run a blocking call in the Instagram thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _executor or self._executor, functools.partial(func, *args, **kwargs)
+        )
     
     def initialize(self, username: str, password: str = None):
         """Initialize Instagram client"""
@@ -45,49 +68,128 @@ class InstagramHandler:
         Also checks message requests (pending DMs) which is where new users' messages go
         Returns True if code found
         """
+        return verification_code in self.find_codes([verification_code], max_messages)
+    
+    async def check_direct_message_async(self, verification_code: str, max_messages: int = 50) -> bool:
+        """Async version of check_direct_message"""
+        return verification_code in await self.find_codes_async([verification_code], max_messages)
+    
+    async def find_codes_async(self, codes: Iterable[str], max_messages: int = 50) -> Set[str]:
+        """
+        Async version of find_codes
+        Threads are scanned one at a time since they share one client,
+        and the scan stops as soon as every code has been found
+        """
+        remaining = set(codes)
+        found = set()
+        if not remaining:
+            return found
+        
+        async def approve_thread(thread_id):
+            """Approve the thread so future messages appear in regular inbox"""
+            try:
+                await self._run(client.direct_thread_approve, thread_id)
+            except Exception as approve_error:
+                logger.warning(f"Could not approve thread: {approve_error}")
+        
+        async def scan_threads(threads, approve: bool = False):
+            """Scan threads until every code has been found"""
+            # The listing already carries each thread's latest messages, so codes
+            # found there need no per-thread request at all
+            for thread in threads:
+                if self._match_codes(thread.messages or [], remaining, found) and approve:
+                    await approve_thread(thread.id)
+            
+            for thread in threads:
+                if not remaining:
+                    return
+                messages = await self._run(client.direct_messages, thread.id, amount=max_messages)
+                if self._match_codes(messages, remaining, found) and approve:
+                    await approve_thread(thread.id)
+        
         try:
             client = self.get_client()
             if not client:
                 logger.error("No active Instagram client")
-                return False
+                return found
             
             # First check regular direct threads
-            threads = client.direct_threads(amount=20)
+            await scan_threads(await self._run(client.direct_threads, amount=20))
+            if not remaining:
+                return found
             
-            for thread in threads:
-                # Get messages from thread
-                messages = client.direct_messages(thread.id, amount=max_messages)
-                
-                for message in messages:
-                    if message.text and verification_code in message.text:
-                        logger.info(f"Verification code found in DM from user {message.user_id}")
-                        return True
+            # Also check message requests (pending DMs)
+            try:
+                await scan_threads(await self._run(client.direct_pending_inbox), approve=True)
+            except Exception as pending_error:
+                logger.warning(f"Could not check pending inbox: {pending_error}")
+            
+            return found
+            
+        except Exception as e:
+            logger.error(f"Error checking DMs: {e}")
+            return found
+    
+    def _match_codes(self, messages, remaining: Set[str], found: Set[str]) -> bool:
+        """Move codes seen in messages from remaining to found, True if any matched"""
+        matched = False
+        for message in messages:
+            if not message.text:
+                continue
+            for code in [c for c in remaining if c in message.text]:
+                logger.info(f"Verification code found in DM from user {message.user_id}")
+                remaining.discard(code)
+                found.add(code)
+                matched = True
+        return matched
+    
+    def find_codes(self, codes: Iterable[str], max_messages: int = 50) -> Set[str]:
+        """
+        Scan direct messages and message requests once for several codes
+        Returns the subset of codes that were found
+        """
+        remaining = set(codes)
+        found = set()
+        if not remaining:
+            return found
+        
+        def scan(thread_id) -> bool:
+            """Collect codes from one thread, True if any new code matched"""
+            messages = client.direct_messages(thread_id, amount=max_messages)
+            return self._match_codes(messages, remaining, found)
+        
+        try:
+            client = self.get_client()
+            if not client:
+                logger.error("No active Instagram client")
+                return found
+            
+            # First check regular direct threads
+            for thread in client.direct_threads(amount=20):
+                scan(thread.id)
+                if not remaining:
+                    return found
             
             # Also check message requests (pending DMs)
             # This is where messages from users who don't follow each other go
             try:
-                pending_threads = client.direct_pending_inbox()
-                for thread in pending_threads:
-                    # Get messages from pending thread
-                    messages = client.direct_messages(thread.id, amount=max_messages)
-                    
-                    for message in messages:
-                        if message.text and verification_code in message.text:
-                            logger.info(f"Verification code found in pending DM from user {message.user_id}")
-                            # Optionally approve the thread so future messages appear in regular inbox
-                            try:
-                                client.direct_thread_approve(thread.id)
-                            except Exception as approve_error:
-                                logger.warning(f"Could not approve thread: {approve_error}")
-                            return True
+                for thread in client.direct_pending_inbox():
+                    if scan(thread.id):
+                        # Approve the thread so future messages appear in regular inbox
+                        try:
+                            client.direct_thread_approve(thread.id)
+                        except Exception as approve_error:
+                            logger.warning(f"Could not approve thread: {approve_error}")
+                    if not remaining:
+                        return found
             except Exception as pending_error:
                 logger.warning(f"Could not check pending inbox: {pending_error}")
             
-            return False
+            return found
             
         except Exception as e:
             logger.error(f"Error checking DMs: {e}")
-            return False
+            return found
     
     def get_media_info(self, url: str) -> Optional[Dict]:
         """Get media information from URL"""
@@ -203,6 +305,70 @@ class InstagramHandler:
             logger.error(f"Error downloading media: {e}")
             return None
     
+    async def get_media_info_async(self, url: str) -> Optional[Dict]:
+        """Async version of get_media_info"""
+        return await self._run(self.get_media_info, url)
+    
+    async def download_media_async(self, url: str, folder: str = 'downloads') -> Optional[List[str]]:
+        """
+        Async version of download_media
+        Carousel items are downloaded concurrently instead of one by one
+        """
+        try:
+            client = self.get_client()
+            if not client:
+                logger.error("No active Instagram client")
+                return None
+            
+            media_pk = client.media_pk_from_url(url)
+            media = await self._run(client.media_info, media_pk)
+            
+            # Download from the URLs already in media_info so no item fetches it again
+            semaphore = asyncio.Semaphore(ALBUM_DOWNLOAD_CONCURRENCY)
+            
+            async def fetch(item, pk):
+                filename = f"{media.user.username}_{pk}"
+                async with semaphore:
+                    if item.media_type == 1:
+                        return await self._run(
+                            client.photo_download_by_url, item.thumbnail_url, filename, folder,
+                            _executor=self._download_executor
+                        )
+                    return await self._run(
+                        client.video_download_by_url, item.video_url, filename, folder,
+                        _executor=self._download_executor
+                    )
+            
+            if media.media_type == 8:  # Album/Carousel
+                items = [(resource, resource.pk) for resource in media.resources
+                         if resource.media_type in (1, 2)]
+            elif media.media_type in (1, 2):  # Photo / Video
+                items = [(media, media_pk)]
+            else:
+                items = []
+            
+            results = await asyncio.gather(
+                *(fetch(item, pk) for item, pk in items), return_exceptions=True
+            )
+            
+            downloaded_files = []
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error(f"Error downloading media item: {result}")
+                else:
+                    downloaded_files.append(result)
+            
+            logger.info(f"Downloaded {len(downloaded_files)} files")
+            return downloaded_files
+            
+        except Exception as e:
+            logger.error(f"Error downloading media: {e}")
+            return None
+    
+    async def get_user_info_async(self, username: str) -> Optional[Dict]:
+        """Async version of get_user_info"""
+        return await self._run(self.get_user_info, username)
+    
     def download_story(self, story_pk: int, folder: str = 'downloads') -> Optional[str]:
         """Download story"""
         try:
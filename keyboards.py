@@ -2,11 +2,99 @@
 Telegram Keyboards for MX-BOT
 Persian/Farsi keyboard layouts
 """
+import functools
+import hashlib
+import sys
+from itertools import islice
 from telegram import ReplyKeyboardMarkup, InlineKeyboardMarkup, InlineKeyboardButton, KeyboardButton
-from typing import List, Dict, Optional
+from typing import Iterable, List, Dict, Optional
+
+# Row status icons indexed by the flag, so list rows need no per-row branch
+_VERIFY_STATUS = ("⏳", "✅")
+_BAN_STATUS = ("✅", "🚫")
+_ACTIVE_STATUS = ("❌", "✅")
+_PRIMARY_STATUS = ("📱", "⭐")
+
+# download_options rows as (label, quality code) pairs
+_DL_VIDEO_ROWS = (
+    (("📹 بهترین کیفیت", "best"),),
+    (("📺 720p", "720"), ("📺 480p", "480")),
+    (("📺 360p", "360"), ("📺 240p", "240")),
+)
+_DL_AUDIO_ROWS = (
+    (("🎵 فقط صدا (MP3)", "audio"),),
+)
+
+# Callback prefixes repeated on every row of the list keyboards, interned once
+_CB_VIEW_ACCOUNT = sys.intern("view_account:")
+_CB_VIEW_CHANNEL = sys.intern("view_channel:")
+_CB_VIEW_USER = sys.intern("view_user:")
+_CB_ADMIN_IG_ACCOUNT = sys.intern("admin_ig_account:")
+_CB_FORMAT = sys.intern("fmt:")
+
+# Fixed two-button row of channel_lock_menu
+_TOGGLE_ALL_CHANNELS_ROW = (
+    InlineKeyboardButton("✅ فعال کردن همه", callback_data="enable_all_channels"),
+    InlineKeyboardButton("❌ غیرفعال کردن همه", callback_data="disable_all_channels"),
+)
+
+# Action keyboards as (label, callback prefix) rows completed with the item id,
+# one layout per flag value so building them needs no branching
+_CHANNEL_ACTIONS = (
+    (("✅ فعال کردن", "enable_channel:"), ("🗑 حذف کانال", "delete_channel:")),
+    (("❌ غیرفعال کردن", "disable_channel:"), ("🗑 حذف کانال", "delete_channel:")),
+)
+_USER_ACTIONS = (
+    (("🚫 مسدود کردن", "ban_user:"), ("📊 مشاهده آمار", "user_stats:"), ("💬 ارسال پیام", "send_to_user:")),
+    (("✅ رفع مسدودیت", "unban_user:"), ("📊 مشاهده آمار", "user_stats:"), ("💬 ارسال پیام", "send_to_user:")),
+)
+_ADMIN_IG_ACCOUNT_ACTIONS = (
+    (
+        ("⭐ تنظیم به عنوان اصلی", "set_primary_ig:"),
+        ("📤 آپلود سشن جدید", "upload_ig_session:"),
+        ("🔄 بررسی وضعیت", "check_ig_status:"),
+        ("🗑 حذف اکانت", "delete_admin_ig:"),
+    ),
+    (
+        ("📤 آپلود سشن جدید", "upload_ig_session:"),
+        ("🔄 بررسی وضعیت", "check_ig_status:"),
+        ("🗑 حذف اکانت", "delete_admin_ig:"),
+    ),
+)
+
+def _display_name(user: Dict) -> str:
+    """First name, username or id, whichever is set first"""
+    return user.get('first_name') or user.get('username') or str(user.get('user_id'))
+
+def _clip(text: str, limit: int) -> str:
+    """Shorten text to limit characters, leaving short names untouched"""
+    return text if len(text) <= limit else text[:limit]
+
+@functools.lru_cache(maxsize=None)
+def _static_row(text: str, callback_data: str) -> tuple:
+    """Single-button row with fixed text and callback, built once and shared"""
+    return (InlineKeyboardButton(text, callback_data=callback_data),)
+
+def _actions_keyboard(rows: tuple, item_id, back_callback: str) -> InlineKeyboardMarkup:
+    """One button per (label, prefix) row for item_id, then a back row"""
+    suffix = str(item_id)
+    keyboard = [[InlineKeyboardButton(label, callback_data=prefix + suffix)] for label, prefix in rows]
+    keyboard.append(_static_row("🔙 بازگشت", back_callback))
+    return InlineKeyboardMarkup(keyboard)
+
+def _size_label(size: int) -> str:
+    """' (NMB)' suffix for formats over 1MB"""
+    return f" ({size // (1024*1024)}MB)" if size and size > 1024*1024 else ""
 
 class Keyboards:
+    # Stateless: every builder is a staticmethod, so instances carry no __dict__
+    __slots__ = ()
+
+    # Keyboards without per-request data are built once and reused
+    # (markups are immutable in python-telegram-bot 20)
+
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def main_menu(is_admin=False):
         """Main menu keyboard"""
         keyboard = [
@@ -20,6 +108,7 @@ class Keyboards:
         return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def account_management():
         """Account management inline keyboard"""
         keyboard = [
@@ -42,17 +131,15 @@ class Keyboards:
     @staticmethod
     def accounts_list(accounts):
         """List of user accounts"""
-        keyboard = []
-        for acc in accounts:
-            status = "✅" if acc['is_verified'] else "⏳"
-            keyboard.append([
-                InlineKeyboardButton(
-                    f"{status} @{acc['instagram_username']}",
-                    callback_data=f"view_account:{acc['id']}"
-                )
-            ])
-        keyboard.append([InlineKeyboardButton("➕ افزودن حساب جدید", callback_data="add_account")])
-        keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_menu")])
+        keyboard = [
+            [InlineKeyboardButton(
+                f"{_VERIFY_STATUS[bool(acc['is_verified'])]} @{acc['instagram_username']}",
+                callback_data=_CB_VIEW_ACCOUNT + str(acc['id'])
+            )]
+            for acc in accounts
+        ]
+        keyboard.append(_static_row("➕ افزودن حساب جدید", "add_account"))
+        keyboard.append(_static_row("🔙 بازگشت", "back_to_menu"))
         return InlineKeyboardMarkup(keyboard)
 
     @staticmethod
@@ -73,60 +160,42 @@ class Keyboards:
         ]
         return InlineKeyboardMarkup(keyboard)
 
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def url_key(url: str) -> str:
+        """Short hash identifying a URL in callback data (full URLs exceed the 64-byte limit)"""
+        return hashlib.blake2b(url.encode(), digest_size=8).hexdigest()
+
     @staticmethod
     def download_options(url: str, has_audio: bool = True, has_video: bool = True):
         """Download options keyboard with quality selection"""
-        keyboard = []
-
-        if has_video:
-            keyboard.append([
-                InlineKeyboardButton("📹 بهترین کیفیت", callback_data=f"dl:best:{url[:50]}"),
-            ])
-            keyboard.append([
-                InlineKeyboardButton("📺 720p", callback_data=f"dl:720:{url[:50]}"),
-                InlineKeyboardButton("📺 480p", callback_data=f"dl:480:{url[:50]}"),
-            ])
-            keyboard.append([
-                InlineKeyboardButton("📺 360p", callback_data=f"dl:360:{url[:50]}"),
-                InlineKeyboardButton("📺 240p", callback_data=f"dl:240:{url[:50]}"),
-            ])
-
-        if has_audio:
-            keyboard.append([
-                InlineKeyboardButton("🎵 فقط صدا (MP3)", callback_data=f"dl:audio:{url[:50]}"),
-            ])
-
-        keyboard.append([InlineKeyboardButton("❌ انصراف", callback_data="cancel_download")])
+        url_key = Keyboards.url_key(url)
+        rows = (_DL_VIDEO_ROWS if has_video else ()) + (_DL_AUDIO_ROWS if has_audio else ())
+        keyboard = [
+            [InlineKeyboardButton(label, callback_data=f"dl:{code}:{url_key}") for label, code in row]
+            for row in rows
+        ]
+
+        keyboard.append(_static_row("❌ انصراف", "cancel_download"))
         return InlineKeyboardMarkup(keyboard)
 
     @staticmethod
     def quality_selection(formats: List[Dict], url_hash: str):
         """Quality selection from available formats"""
-        keyboard = []
-
-        for fmt in formats[:8]:  # Limit to 8 options
-            quality = fmt.get('quality', 'Unknown')
-            ext = fmt.get('ext', '')
-            format_id = fmt.get('format_id', '')
-            size = fmt.get('filesize', 0)
-
-            if size:
-                size_str = f" ({size // (1024*1024)}MB)" if size > 1024*1024 else ""
-            else:
-                size_str = ""
-
-            keyboard.append([
-                InlineKeyboardButton(
-                    f"📺 {quality} ({ext}){size_str}",
-                    callback_data=f"fmt:{format_id}:{url_hash}"
-                )
-            ])
+        keyboard = [
+            [InlineKeyboardButton(
+                f"📺 {fmt.get('quality', 'Unknown')} ({fmt.get('ext', '')}){_size_label(fmt.get('filesize', 0))}",
+                callback_data=_CB_FORMAT + f"{fmt.get('format_id', '')}:{url_hash}"
+            )]
+            for fmt in formats[:8]  # Limit to 8 options
+        ]
 
         keyboard.append([InlineKeyboardButton("🎵 فقط صدا", callback_data=f"fmt:audio:{url_hash}")])
-        keyboard.append([InlineKeyboardButton("❌ انصراف", callback_data="cancel_download")])
+        keyboard.append(_static_row("❌ انصراف", "cancel_download"))
         return InlineKeyboardMarkup(keyboard)
 
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def admin_panel():
         """Admin panel keyboard - Complete"""
         keyboard = [
@@ -147,65 +216,48 @@ class Keyboards:
     @staticmethod
     def channel_lock_menu(channels: List[Dict]):
         """Channel lock management menu"""
-        keyboard = []
-
         # Show current channels
-        for ch in channels:
-            status = "✅" if ch.get('is_active') else "❌"
-            title = ch.get('channel_title') or ch.get('channel_username') or ch.get('channel_id')
-            keyboard.append([
-                InlineKeyboardButton(
-                    f"{status} {title[:20]}",
-                    callback_data=f"view_channel:{ch['channel_id']}"
-                )
-            ])
+        keyboard = [
+            [InlineKeyboardButton(
+                f"{_ACTIVE_STATUS[bool(ch.get('is_active'))]} "
+                f"{_clip(ch.get('channel_title') or ch.get('channel_username') or ch.get('channel_id'), 20)}",
+                callback_data=_CB_VIEW_CHANNEL + str(ch['channel_id'])
+            )]
+            for ch in channels
+        ]
 
         # Add new channel button (max 2)
         if len(channels) < 2:
-            keyboard.append([InlineKeyboardButton("➕ افزودن کانال جدید", callback_data="add_channel_lock")])
+            keyboard.append(_static_row("➕ افزودن کانال جدید", "add_channel_lock"))
 
         # Toggle all
         if channels:
-            keyboard.append([
-                InlineKeyboardButton("✅ فعال کردن همه", callback_data="enable_all_channels"),
-                InlineKeyboardButton("❌ غیرفعال کردن همه", callback_data="disable_all_channels"),
-            ])
+            keyboard.append(_TOGGLE_ALL_CHANNELS_ROW)
 
-        keyboard.append([InlineKeyboardButton("🔙 بازگشت به پنل", callback_data="admin_panel")])
+        keyboard.append(_static_row("🔙 بازگشت به پنل", "admin_panel"))
         return InlineKeyboardMarkup(keyboard)
 
     @staticmethod
     def channel_actions(channel_id: str, is_active: bool):
         """Actions for specific channel"""
-        keyboard = []
-
-        if is_active:
-            keyboard.append([InlineKeyboardButton("❌ غیرفعال کردن", callback_data=f"disable_channel:{channel_id}")])
-        else:
-            keyboard.append([InlineKeyboardButton("✅ فعال کردن", callback_data=f"enable_channel:{channel_id}")])
-
-        keyboard.append([InlineKeyboardButton("🗑 حذف کانال", callback_data=f"delete_channel:{channel_id}")])
-        keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="admin_channel_lock")])
-        return InlineKeyboardMarkup(keyboard)
+        return _actions_keyboard(_CHANNEL_ACTIONS[bool(is_active)], channel_id, "admin_channel_lock")
 
     @staticmethod
     def join_channel_buttons(channels: List[Dict]):
         """Buttons for joining required channels"""
-        keyboard = []
-
-        for ch in channels:
-            username = ch.get('channel_username')
-            title = ch.get('channel_title') or username or "کانال"
-
-            if username:
-                keyboard.append([
-                    InlineKeyboardButton(f"📢 عضویت در {title}", url=f"https://t.me/{username}")
-                ])
+        keyboard = [
+            [InlineKeyboardButton(
+                f"📢 عضویت در {ch.get('channel_title') or ch['channel_username']}",
+                url=f"https://t.me/{ch['channel_username']}"
+            )]
+            for ch in channels if ch.get('channel_username')
+        ]
 
-        keyboard.append([InlineKeyboardButton("✅ عضو شدم", callback_data="check_membership")])
+        keyboard.append(_static_row("✅ عضو شدم", "check_membership"))
         return InlineKeyboardMarkup(keyboard)
 
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def user_management(users_page=0):
         """User management keyboard"""
         keyboard = [
@@ -216,105 +268,82 @@ class Keyboards:
         return InlineKeyboardMarkup(keyboard)
 
     @staticmethod
-    def users_list(users: List[Dict], page: int = 0, per_page: int = 10):
-        """Paginated users list"""
-        keyboard = []
-
+    def users_list(users: Iterable[Dict], page: int = 0, per_page: int = 10, total: Optional[int] = None):
+        """Paginated users list (pass total when users is already the page, which may be any iterable)"""
         start = page * per_page
         end = start + per_page
-        page_users = users[start:end]
-
-        for user in page_users:
-            status = "🚫" if user.get('is_banned') else "✅"
-            name = user.get('first_name') or user.get('username') or str(user.get('user_id'))
-            keyboard.append([
-                InlineKeyboardButton(
-                    f"{status} {name[:15]} ({user.get('download_count', 0)})",
-                    callback_data=f"view_user:{user['user_id']}"
-                )
-            ])
+        if total is None:
+            total = len(users)
+            page_users = islice(users, start, end)
+        else:
+            page_users = users
+
+        keyboard = [
+            [InlineKeyboardButton(
+                f"{_BAN_STATUS[bool(user.get('is_banned'))]} {_clip(_display_name(user), 15)} "
+                f"({user.get('download_count', 0)})",
+                callback_data=_CB_VIEW_USER + str(user['user_id'])
+            )]
+            for user in page_users
+        ]
 
         # Pagination buttons
         nav_buttons = []
         if page > 0:
             nav_buttons.append(InlineKeyboardButton("⬅️ قبلی", callback_data=f"admin_users_list:{page-1}"))
-        if end < len(users):
+        if end < total:
             nav_buttons.append(InlineKeyboardButton("➡️ بعدی", callback_data=f"admin_users_list:{page+1}"))
 
         if nav_buttons:
             keyboard.append(nav_buttons)
 
-        keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="admin_users")])
+        keyboard.append(_static_row("🔙 بازگشت", "admin_users"))
         return InlineKeyboardMarkup(keyboard)
 
     @staticmethod
     def user_actions(user_id: int, is_banned: bool):
         """Actions for specific user"""
-        keyboard = []
-
-        if is_banned:
-            keyboard.append([InlineKeyboardButton("✅ رفع مسدودیت", callback_data=f"unban_user:{user_id}")])
-        else:
-            keyboard.append([InlineKeyboardButton("🚫 مسدود کردن", callback_data=f"ban_user:{user_id}")])
-
-        keyboard.append([InlineKeyboardButton("📊 مشاهده آمار", callback_data=f"user_stats:{user_id}")])
-        keyboard.append([InlineKeyboardButton("💬 ارسال پیام", callback_data=f"send_to_user:{user_id}")])
-        keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="admin_users")])
-        return InlineKeyboardMarkup(keyboard)
+        return _actions_keyboard(_USER_ACTIONS[bool(is_banned)], user_id, "admin_users")
 
     @staticmethod
     def banned_users_list(users: List[Dict]):
         """List of banned users"""
-        keyboard = []
-
-        for user in users[:15]:  # Limit to 15
-            name = user.get('first_name') or user.get('username') or str(user.get('user_id'))
-            keyboard.append([
-                InlineKeyboardButton(
-                    f"🚫 {name[:20]}",
-                    callback_data=f"view_user:{user['user_id']}"
-                )
-            ])
+        keyboard = [
+            [InlineKeyboardButton(
+                f"🚫 {_clip(_display_name(user), 20)}",
+                callback_data=_CB_VIEW_USER + str(user['user_id'])
+            )]
+            for user in users[:15]  # Limit to 15
+        ]
 
         if not users:
-            keyboard.append([InlineKeyboardButton("✅ کاربر بن شده‌ای وجود ندارد", callback_data="admin_users")])
+            keyboard.append(_static_row("✅ کاربر بن شده‌ای وجود ندارد", "admin_users"))
 
-        keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="admin_panel")])
+        keyboard.append(_static_row("🔙 بازگشت", "admin_panel"))
         return InlineKeyboardMarkup(keyboard)
 
     @staticmethod
     def admin_instagram_accounts_menu(accounts: List[Dict]):
         """Admin Instagram accounts management"""
-        keyboard = []
-
-        for acc in accounts:
-            status = "⭐" if acc.get('is_primary') else "📱"
-            keyboard.append([
-                InlineKeyboardButton(
-                    f"{status} @{acc['username']}",
-                    callback_data=f"admin_ig_account:{acc['id']}"
-                )
-            ])
-
-        keyboard.append([InlineKeyboardButton("➕ افزودن اکانت جدید", callback_data="add_admin_ig_account")])
-        keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="admin_panel")])
+        keyboard = [
+            [InlineKeyboardButton(
+                f"{_PRIMARY_STATUS[bool(acc.get('is_primary'))]} @{acc['username']}",
+                callback_data=_CB_ADMIN_IG_ACCOUNT + str(acc['id'])
+            )]
+            for acc in accounts
+        ]
+
+        keyboard.append(_static_row("➕ افزودن اکانت جدید", "add_admin_ig_account"))
+        keyboard.append(_static_row("🔙 بازگشت", "admin_panel"))
         return InlineKeyboardMarkup(keyboard)
 
     @staticmethod
     def admin_ig_account_actions(account_id: int, is_primary: bool):
         """Actions for admin Instagram account"""
-        keyboard = []
-
-        if not is_primary:
-            keyboard.append([InlineKeyboardButton("⭐ تنظیم به عنوان اصلی", callback_data=f"set_primary_ig:{account_id}")])
-
-        keyboard.append([InlineKeyboardButton("📤 آپلود سشن جدید", callback_data=f"upload_ig_session:{account_id}")])
-        keyboard.append([InlineKeyboardButton("🔄 بررسی وضعیت", callback_data=f"check_ig_status:{account_id}")])
-        keyboard.append([InlineKeyboardButton("🗑 حذف اکانت", callback_data=f"delete_admin_ig:{account_id}")])
-        keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="admin_instagram_accounts")])
-        return InlineKeyboardMarkup(keyboard)
+        return _actions_keyboard(_ADMIN_IG_ACCOUNT_ACTIONS[bool(is_primary)], account_id, "admin_instagram_accounts")
 
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def session_management():
         """Session management keyboard"""
         keyboard = [
@@ -326,6 +355,7 @@ class Keyboards:
         return InlineKeyboardMarkup(keyboard)
 
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def bot_settings():
         """Bot settings menu"""
         keyboard = [
@@ -346,18 +376,21 @@ class Keyboards:
         return InlineKeyboardMarkup(keyboard)
 
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def back_button(callback_data="back_to_menu"):
         """Simple back button"""
         keyboard = [[InlineKeyboardButton("🔙 بازگشت", callback_data=callback_data)]]
         return InlineKeyboardMarkup(keyboard)
 
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def cancel_button():
         """Cancel keyboard"""
         keyboard = [[KeyboardButton("❌ انصراف")]]
         return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def waiting_session_options():
         """Options while waiting for session file"""
         keyboard = [
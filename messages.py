@@ -141,6 +141,10 @@ class Messages:
 💡 کافیست لینک را بفرستید!"""
 
     DOWNLOADING = "⬇️ در حال دانلود..."
+    DOWNLOAD_PROGRESS = """⬇️ در حال دانلود... {percent}
+
+📦 {downloaded} از {total}
+⚡️ سرعت: {speed}"""
     PROCESSING = "⚙️ در حال پردازش..."
     UPLOADING = "⬆️ در حال آپلود..."
     FETCHING_INFO = "🔍 در حال دریافت اطلاعات..."
@@ -319,6 +323,7 @@ class Messages:
     RATE_LIMIT = "⏳ لطفاً کمی صبر کنید و دوباره تلاش کنید."
     FILE_TOO_LARGE = "❌ حجم فایل بیش از حد مجاز است! (حداکثر 50MB)"
     USER_BANNED_MESSAGE = "🚫 شما از استفاده از ربات مسدود شده‌اید!"
+    ACCESS_DENIED = "❌ شما دسترسی به این بخش ندارید!"
 
     # Buttons
     BACK = "🔙 بازگشت"
@@ -5,37 +5,106 @@ Handles Instagram session creation and management
 import os
 import json
 import logging
+import time
 from pathlib import Path
-from typing import Optional
-from instagrapi import Client
-from instagrapi.exceptions import (
-    LoginRequired, 
-    ChallengeRequired, 
-    TwoFactorRequired,
-    BadPassword,
-    PleaseWaitFewMinutes
-)
+from typing import Optional, TYPE_CHECKING
+from requests.adapters import HTTPAdapter
+
+if TYPE_CHECKING:
+    # instagrapi is heavy to import; it is loaded on first use instead
+    from instagrapi import Client
+
+try:
+    # orjson is optional; its JSONDecodeError subclasses json.JSONDecodeError
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
 
 logger = logging.getLogger(__name__)
 
+# Keep-alive connections per host for Instagram API sessions
+INSTAGRAM_POOL_SIZE = 20
+
+# Clients kept per username for repeated session validation
+CLIENT_CACHE_SIZE = 8
+
+# Smaller session files are empty or truncated and cannot hold valid settings
+MIN_SESSION_FILE_SIZE = 64
+
+# (section, key) locations of the username in instagrapi session settings
+_USERNAME_PATHS = (('authorization_data', 'ds_user'), ('uuids', 'username'))
+_USERNAME_KEYS = ('username', 'ds_user')
+
+# Seconds a get_session_status() result is reused before asking Instagram again
+SESSION_STATUS_TTL = 30
+
+def _new_client() -> 'Client':
+    """Create a Client whose HTTP sessions keep a larger keep-alive pool"""
+    from instagrapi import Client
+    
+    client = Client()
+    for session in (client.private, client.public):
+        # Reuse instagrapi's own retry policy, only the pool size changes
+        retries = session.get_adapter('https://').max_retries
+        adapter = HTTPAdapter(
+            pool_connections=INSTAGRAM_POOL_SIZE,
+            pool_maxsize=INSTAGRAM_POOL_SIZE,
+            max_retries=retries
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+    return client
+
 class SessionManager:
+    # Session directories already created by this process
+    _created_dirs = set()
+    
     def __init__(self, session_dir: str = 'sessions'):
         self.session_dir = Path(session_dir)
-        self.session_dir.mkdir(exist_ok=True)
+        if self.session_dir not in SessionManager._created_dirs:
+            self.session_dir.mkdir(exist_ok=True)
+            SessionManager._created_dirs.add(self.session_dir)
         self.client = None
         self.username = None
+        self._session_files = {}  # username -> session file path
+        self._client_cache = {}  # username -> Client with its session loaded
+        self._status_cache = None  # (checked_at, client, status) of the last status check
     
     def get_session_file(self, username: str) -> Path:
         """Get session file path for username"""
-        return self.session_dir / f"{username}.json"
+        path = self._session_files.get(username)
+        if path is None:
+            path = self._session_files[username] = self.session_dir / f"{username}.json"
+        return path
+    
+    def _get_cached_client(self, username: str, session_file: Path) -> 'Client':
+        """Return the cached client for username, loading the session on a miss"""
+        client = self._client_cache.get(username)
+        if client is None:
+            client = _new_client()
+            client.load_settings(session_file)
+            if len(self._client_cache) >= CLIENT_CACHE_SIZE:
+                # Evict the oldest entry
+                self._client_cache.pop(next(iter(self._client_cache)))
+            self._client_cache[username] = client
+        return client
     
     def login(self, username: str, password: str, verification_code: str = None) -> tuple:
         """
         Login to Instagram
         Returns: (success: bool, message: str, client: Optional[Client])
         """
+        from instagrapi.exceptions import (
+            LoginRequired, 
+            ChallengeRequired, 
+            TwoFactorRequired,
+            BadPassword,
+            PleaseWaitFewMinutes
+        )
+        
         try:
-            self.client = Client()
+            self._status_cache = None
+            self.client = _new_client()
             self.username = username
             session_file = self.get_session_file(username)
             
@@ -93,21 +162,25 @@ class SessionManager:
         """Validate existing session"""
         try:
             session_file = self.get_session_file(username)
-            if not session_file.exists():
+            # One stat rejects missing and empty files before any Client is built
+            try:
+                if session_file.stat().st_size < MIN_SESSION_FILE_SIZE:
+                    return False
+            except OSError:
                 return False
             
-            client = Client()
-            client.load_settings(session_file)
+            client = self._get_cached_client(username, session_file)
             
             # Try to get account info to validate
             client.account_info()
             return True
             
         except Exception as e:
+            self._client_cache.pop(username, None)
             logger.error(f"Session validation failed: {e}")
             return False
     
-    def load_session(self, username: str) -> Optional[Client]:
+    def load_session(self, username: str) -> Optional['Client']:
         """Load existing session"""
         try:
             session_file = self.get_session_file(username)
@@ -115,7 +188,7 @@ class SessionManager:
                 logger.error(f"Session file not found: {session_file}")
                 return None
             
-            client = Client()
+            client = _new_client()
             client.load_settings(session_file)
             logger.info(f"Session loaded for {username}")
             
@@ -127,13 +200,15 @@ class SessionManager:
             logger.error(f"Failed to load session: {e}")
             return None
     
-    def get_client(self) -> Optional[Client]:
+    def get_client(self) -> Optional['Client']:
         """Get current client instance"""
         return self.client
     
     def logout(self):
         """Logout and clear session"""
+        self._status_cache = None
         if self.client:
+            self._client_cache.pop(self.username, None)
             try:
                 self.client.logout()
             except:
@@ -144,26 +219,21 @@ class SessionManager:
     def upload_session_file(self, username: str, session_data: bytes) -> tuple:
         """
         Upload session file and validate it
+        The file is stored under the username found in the session data,
+        falling back to the given username
         Returns: (success: bool, message: str, extracted_username: Optional[str])
         """
         try:
-            session_file = self.get_session_file(username)
-            
-            # Validate JSON
-            data = json.loads(session_data)
-            
-            # Try to extract username from session data if available
-            extracted_username = username
-            if 'authorization_data' in data and 'ds_user' in data.get('authorization_data', {}):
-                extracted_username = data['authorization_data'].get('ds_user', username)
-            elif 'uuids' in data and 'username' in data.get('uuids', {}):
-                extracted_username = data['uuids'].get('username', username)
+            # Validate JSON and extract the username in a single parse
+            _, found_username = self._parse_session_bytes(session_data)
+            extracted_username = found_username or username
+            session_file = self.get_session_file(extracted_username)
             
-            # Save to file
-            with open(session_file, 'wb') as f:
-                f.write(session_data)
+            self._write_session_file(session_file, session_data)
+            # A cached client still holds the previous session settings
+            self._client_cache.pop(extracted_username, None)
             
-            logger.info(f"Session file uploaded for {username}")
+            logger.info(f"Session file uploaded for {extracted_username}")
             return True, "Session uploaded successfully", extracted_username
             
         except json.JSONDecodeError:
@@ -173,6 +243,21 @@ class SessionManager:
             logger.error(f"Failed to upload session: {e}")
             return False, f"خطا در آپلود: {str(e)}", None
     
+    def _write_session_file(self, session_file: Path, session_data: bytes):
+        """Write session data to a private sibling tmp file, then swap it in atomically"""
+        tmp = session_file.with_suffix('.json.tmp')
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            view = memoryview(session_data)
+            while view:
+                view = view[os.write(fd, view):]
+        except BaseException:
+            os.close(fd)
+            tmp.unlink(missing_ok=True)
+            raise
+        os.close(fd)
+        os.replace(tmp, session_file)
+    
     def load_and_validate_session(self, username: str) -> tuple:
         """
         Load session from file and validate it
@@ -183,8 +268,7 @@ class SessionManager:
             if not session_file.exists():
                 return False, "فایل سشن یافت نشد", None
             
-            client = Client()
-            client.load_settings(session_file)
+            client = self._get_cached_client(username, session_file)
             
             # Try to validate by getting account info
             try:
@@ -194,6 +278,7 @@ class SessionManager:
                 logger.info(f"Session loaded and validated for {username}")
                 return True, "سشن معتبر است", client
             except Exception as e:
+                self._client_cache.pop(username, None)
                 logger.warning(f"Session validation failed: {e}")
                 return False, f"سشن نامعتبر است: {str(e)}", None
                 
@@ -207,35 +292,41 @@ class SessionManager:
     def get_username_from_session_file(self, session_data: bytes) -> Optional[str]:
         """Extract username from session file data"""
         try:
-            data = json.loads(session_data)
-            
-            # Try different possible locations for username
-            if 'authorization_data' in data:
-                auth_data = data['authorization_data']
-                if 'ds_user' in auth_data:
-                    return auth_data['ds_user']
-            
-            if 'uuids' in data:
-                uuids = data['uuids']
-                if 'username' in uuids:
-                    return uuids['username']
-            
-            # Try to find username in any nested dict
-            for key, value in data.items():
-                if isinstance(value, dict):
-                    if 'username' in value:
-                        return value['username']
-                    if 'ds_user' in value:
-                        return value['ds_user']
-            
-            return None
+            return self._parse_session_bytes(session_data)[1]
         except Exception:
             return None
     
+    def _parse_session_bytes(self, session_data: bytes) -> tuple:
+        """
+        Decode session JSON once
+        Returns: (data: dict, username: Optional[str])
+        """
+        data = _json_loads(session_data)
+        if not isinstance(data, dict):
+            return data, None
+        
+        # Known locations first
+        for section, key in _USERNAME_PATHS:
+            value = data.get(section)
+            if isinstance(value, dict) and value.get(key) is not None:
+                return data, value[key]
+        
+        # Fall back to a single scan of the nested dicts
+        for value in data.values():
+            if isinstance(value, dict):
+                for key in _USERNAME_KEYS:
+                    username = value.get(key)
+                    if username is not None:
+                        return data, username
+        
+        return data, None
+    
     def delete_session(self, username: str):
         """Delete session file"""
         try:
             session_file = self.get_session_file(username)
+            self._session_files.pop(username, None)
+            self._client_cache.pop(username, None)
             if session_file.exists():
                 session_file.unlink()
                 logger.info(f"Session deleted for {username}")
@@ -251,20 +342,28 @@ class SessionManager:
                 'message': 'No active session'
             }
         
+        # Reuse a recent check of the same client
+        cached = self._status_cache
+        if cached and cached[1] is self.client and time.monotonic() - cached[0] < SESSION_STATUS_TTL:
+            return dict(cached[2])
+        
         try:
             # Try to get account info
             self.client.account_info()
-            return {
+            status = {
                 'active': True,
                 'username': self.username,
                 'message': 'Session is active and valid'
             }
         except Exception as e:
-            return {
+            status = {
                 'active': False,
                 'username': self.username,
                 'message': f'Session invalid: {str(e)}'
             }
+        
+        self._status_cache = (time.monotonic(), self.client, status)
+        return dict(status)
 
 # Global session manager instance
 session_manager = SessionManager()
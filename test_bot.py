@@ -5,8 +5,18 @@ Validates basic functionality without external dependencies
 """
 import sys
 import os
+import tempfile
 
-def test_imports():
+try:
+    import pytest
+    parametrize = pytest.mark.parametrize
+except ImportError:
+    # Without pytest the cases are still run by main() below
+    pytest = None
+    def parametrize(names, cases):
+        return lambda func: func
+
+def check_imports():
     """Test that all modules can be imported"""
     print("Testing module imports...")
     
@@ -24,7 +34,7 @@ def test_imports():
     
     return True
 
-def test_utils():
+def check_utils():
     """Test utility functions"""
     print("\nTesting utility functions...")
     
@@ -32,11 +42,10 @@ def test_utils():
         generate_verification_code,
         extract_instagram_url,
         extract_media_url,
-        is_instagram_url,
-        is_ytdlp_supported_url,
+        INSTAGRAM_LINK_RE,
+        MEDIA_LINK_RE,
         is_valid_instagram_username,
-        format_number,
-        sanitize_filename
+        parse_instagram_shortcode
     )
     
     # Test verification code
@@ -54,6 +63,15 @@ def test_utils():
         return False
     print(f"  ✓ URL extraction: {extracted}")
     
+    # Test shortcode parsing for posts and stories
+    if parse_instagram_shortcode("https://instagram.com/reel/ABC123/") != "ABC123":
+        print("  ✗ Shortcode parsing failed for reel URL")
+        return False
+    if parse_instagram_shortcode("https://instagram.com/stories/user/987/") != "987":
+        print("  ✗ Shortcode parsing failed for story URL")
+        return False
+    print("  ✓ Shortcode parsing")
+    
     # Test media URL extraction
     youtube_test = "Check out https://www.youtube.com/watch?v=dQw4w9WgXcQ"
     youtube_url = extract_media_url(youtube_test)
@@ -62,38 +80,24 @@ def test_utils():
         return False
     print(f"  ✓ Media URL extraction: {youtube_url}")
     
-    # Test is_instagram_url
-    if not is_instagram_url("https://instagram.com/p/ABC123/"):
-        print("  ✗ is_instagram_url failed for Instagram URL")
+    # Test the message filters the bot routes links with
+    match = INSTAGRAM_LINK_RE.search("see https://www.instagram.com/reel/XyZ_1/ now")
+    if not match or match.group(0) != 'https://www.instagram.com/reel/XyZ_1':
+        print("  ✗ Instagram link filter failed")
         return False
-    if is_instagram_url("https://youtube.com/watch?v=abc"):
-        print("  ✗ is_instagram_url incorrectly accepted YouTube URL")
+    if INSTAGRAM_LINK_RE.search("song: https://soundcloud.com/a/b."):
+        print("  ✗ Instagram link filter matched a media URL")
         return False
-    # Security test: Malicious URL should not match
-    if is_instagram_url("https://malicious-instagram.com.evil.com/"):
-        print("  ✗ is_instagram_url security issue: accepted malicious URL")
+    if not MEDIA_LINK_RE.search("song: https://soundcloud.com/a/b."):
+        print("  ✗ Media link filter failed")
         return False
-    print("  ✓ is_instagram_url")
-    
-    # Test is_ytdlp_supported_url
-    if not is_ytdlp_supported_url("https://youtube.com/watch?v=abc"):
-        print("  ✗ is_ytdlp_supported_url failed for YouTube")
-        return False
-    if not is_ytdlp_supported_url("https://soundcloud.com/test/track"):
-        print("  ✗ is_ytdlp_supported_url failed for SoundCloud")
-        return False
-    if is_ytdlp_supported_url("https://instagram.com/p/ABC123/"):
-        print("  ✗ is_ytdlp_supported_url incorrectly accepted Instagram")
+    if extract_media_url("song: https://soundcloud.com/a/b.") != 'https://soundcloud.com/a/b':
+        print("  ✗ Media URL trailing punctuation not stripped")
         return False
-    # Security test: Malicious URL should not match
-    if is_ytdlp_supported_url("https://malicious-youtube.com.evil.com/"):
-        print("  ✗ is_ytdlp_supported_url security issue: accepted malicious URL")
+    if INSTAGRAM_LINK_RE.search("no links here") or MEDIA_LINK_RE.search("no links here"):
+        print("  ✗ Link filters matched plain text")
         return False
-    # Test subdomain support
-    if not is_ytdlp_supported_url("https://music.youtube.com/watch?v=abc"):
-        print("  ✗ is_ytdlp_supported_url failed for YouTube Music subdomain")
-        return False
-    print("  ✓ is_ytdlp_supported_url")
+    print("  ✓ Link filters")
     
     # Test username validation
     if not is_valid_instagram_username("valid_user"):
@@ -102,85 +106,233 @@ def test_utils():
     if is_valid_instagram_username("@invalid"):
         print("  ✗ Invalid username accepted")
         return False
-    print("  ✓ Username validation")
-    
-    # Test number formatting
-    if format_number(1500) != "1.5K":
-        print(f"  ✗ Number formatting: expected '1.5K', got '{format_number(1500)}'")
+    if is_valid_instagram_username("bad..user") or is_valid_instagram_username("baduser."):
+        print("  ✗ Username with consecutive/trailing dots accepted")
         return False
-    print("  ✓ Number formatting")
+    print("  ✓ Username validation")
     
-    # Test filename sanitization
-    dirty = "file<>name?.txt"
-    clean = sanitize_filename(dirty)
-    if '<' in clean or '>' in clean or '?' in clean:
-        print(f"  ✗ Filename sanitization failed: {clean}")
-        return False
-    print("  ✓ Filename sanitization")
     
     return True
 
-def test_database():
+# (input, expected) cases, one pytest case each
+INSTAGRAM_URL_CASES = [
+    ("https://instagram.com/p/ABC123/", True),
+    ("https://www.instagram.com/reel/ABC123/", True),
+    ("https://youtube.com/watch?v=abc", False),
+    # Security: lookalike hosts must not match
+    ("https://malicious-instagram.com.evil.com/", False),
+    ("", False),
+]
+YTDLP_URL_CASES = [
+    ("https://youtube.com/watch?v=abc", True),
+    ("https://soundcloud.com/test/track", True),
+    ("https://music.youtube.com/watch?v=abc", True),
+    ("https://instagram.com/p/ABC123/", False),
+    # Security: lookalike hosts must not match
+    ("https://malicious-youtube.com.evil.com/", False),
+    ("https://youtube.com@evil.com/", False),
+    ("https://evil.com/?u=https://youtube.com/", False),
+]
+FORMAT_NUMBER_CASES = [
+    (999, "999"),
+    (1500, "1.5K"),
+    # Truncated, never rounded up to the next tenth
+    (1999, "1.9K"),
+    (2_500_000, "2.5M"),
+]
+SANITIZE_FILENAME_CASES = [
+    ("file<>name?.txt", "filename.txt"),
+    ('a:b"c|d*e.mp4', "abcde.mp4"),
+    ("my video.mp4", "my_video.mp4"),
+]
+
+@parametrize("url,expected", INSTAGRAM_URL_CASES)
+def test_is_instagram_url(url, expected):
+    from utils import is_instagram_url
+    assert is_instagram_url(url) is expected
+
+@parametrize("url,expected", YTDLP_URL_CASES)
+def test_is_ytdlp_supported_url(url, expected):
+    from utils import is_ytdlp_supported_url
+    assert is_ytdlp_supported_url(url) is expected
+
+@parametrize("num,expected", FORMAT_NUMBER_CASES)
+def test_format_number(num, expected):
+    from utils import format_number
+    assert format_number(num) == expected
+
+@parametrize("filename,expected", SANITIZE_FILENAME_CASES)
+def test_sanitize_filename(filename, expected):
+    from utils import sanitize_filename
+    assert sanitize_filename(filename) == expected
+
+def run_case_tables():
+    """Run the parametrized cases when the script runs without pytest"""
+    print("\nTesting URL predicates and formatting...")
+    tables = [
+        (test_is_instagram_url, INSTAGRAM_URL_CASES),
+        (test_is_ytdlp_supported_url, YTDLP_URL_CASES),
+        (test_format_number, FORMAT_NUMBER_CASES),
+        (test_sanitize_filename, SANITIZE_FILENAME_CASES),
+    ]
+    for test_func, cases in tables:
+        for case in cases:
+            try:
+                test_func(*case)
+            except AssertionError:
+                print(f"  ✗ {test_func.__name__}{case}")
+                return False
+        print(f"  ✓ {test_func.__name__} ({len(cases)} cases)")
+    return True
+
+def _open_test_db():
+    """Open an in-memory test database"""
+    # Used from one thread, it keeps a single connection (and so the data) until close()
+    from database import Database
+    return Database(':memory:')
+
+if pytest is not None:
+    @pytest.fixture(scope="module")
+    def db():
+        """Database shared by every test in this module"""
+        database = _open_test_db()
+        yield database
+        database.close()
+
+def run_database_test():
+    """Run check_database on its own database when the script runs without pytest"""
+    db = _open_test_db()
+    try:
+        return check_database(db)
+    finally:
+        db.close()
+        print("  ✓ Cleanup completed")
+
+def check_database(db):
     """Test database operations"""
     print("\nTesting database operations...")
     
-    from database import Database
     from datetime import datetime, timedelta
     
-    # Create test database
-    test_db_path = 'test_validation.db'
-    db = Database(test_db_path)
+    # Test user operations
+    db.add_user(99999, 'testuser', 'Test User')
+    user = db.get_user(99999)
+    if not user or user['username'] != 'testuser':
+        print("  ✗ User add/get failed")
+        return False
+    print("  ✓ User operations")
+    
+    # Test banned users filter
+    db.add_user(99998, 'banned', 'Banned User')
+    db.set_ban(99998, True)
+    banned = db.get_banned_users()
+    if [u['user_id'] for u in banned] != [99998] or not db.is_user_banned(99998):
+        print("  ✗ Banned users lookup failed")
+        return False
+    db.set_ban(99998, False)
+    if db.is_user_banned(99998):
+        print("  ✗ Cached ban flag not invalidated on unban")
+        return False
+    db.set_ban(99998, True)
+    print("  ✓ Banned users lookup")
+    
+    # Test user search (ID, username prefix, partial name)
+    if ([u['user_id'] for u in db.search_users('99999')] != [99999]
+            or [u['user_id'] for u in db.search_users('@test')] != [99999]
+            or [u['user_id'] for u in db.search_users('anned Us')] != [99998]):
+        print("  ✗ User search failed")
+        return False
+    print("  ✓ User search")
     
-    try:
-        # Test user operations
-        db.add_user(99999, 'testuser', 'Test User')
-        user = db.get_user(99999)
-        if not user or user['username'] != 'testuser':
-            print("  ✗ User add/get failed")
-            return False
-        print("  ✓ User operations")
-        
-        # Test Instagram account
-        expires = datetime.now() + timedelta(hours=1)
-        acc_id = db.add_instagram_account(99999, 'ig_user', 'CODE123', expires)
-        if not acc_id:
-            print("  ✗ Instagram account creation failed")
-            return False
-        print("  ✓ Instagram account operations")
-        
-        # Test verification
-        db.verify_instagram_account(acc_id)
-        acc = db.get_instagram_account(acc_id)
-        if acc['is_verified'] != 1:
-            print("  ✗ Account verification failed")
-            return False
-        print("  ✓ Account verification")
-        
-        # Test download recording
-        db.add_download(99999, 'post', 'https://instagram.com/p/test', 'ig_user', 2048)
-        downloads = db.get_user_downloads(99999)
-        if len(downloads) != 1:
-            print("  ✗ Download recording failed")
-            return False
-        print("  ✓ Download recording")
-        
-        # Test statistics
-        stats = {
-            'users': db.get_total_users(),
-            'downloads': db.get_total_downloads(),
-            'verified': db.get_total_verified_accounts()
-        }
-        print(f"  ✓ Statistics: {stats}")
-        
-    finally:
-        # Cleanup
-        if os.path.exists(test_db_path):
-            os.remove(test_db_path)
-        print("  ✓ Cleanup completed")
+    # Test SQL pagination
+    if (len(db.get_users_page(0, 1)) != 1 or len(db.get_users_page(1, 10)) != 1
+            or list(db.iter_user_ids(1)) != [[99998], [99999]]):
+        print("  ✗ User pagination failed")
+        return False
+    print("  ✓ User pagination")
+    
+    # Test Instagram account
+    expires = datetime.now() + timedelta(hours=1)
+    acc_id = db.add_instagram_account(99999, 'ig_user', 'CODE123', expires)
+    if not acc_id:
+        print("  ✗ Instagram account creation failed")
+        return False
+    print("  ✓ Instagram account operations")
+    
+    # Test combined verification + account creation
+    ver_id = db.create_verification_with_account(99999, 'ig_other', 'CODE456', expires)
+    ver = db.get_verification(ver_id)
+    if not ver or ver['verification_code'] != 'CODE456' or len(db.get_user_instagram_accounts(99999)) != 2:
+        print("  ✗ Combined verification creation failed")
+        return False
+    print("  ✓ Verification creation")
+    
+    # Test verification
+    db.verify_instagram_account(acc_id)
+    acc = db.get_instagram_account(acc_id)
+    if acc['is_verified'] != 1:
+        print("  ✗ Account verification failed")
+        return False
+    print("  ✓ Account verification")
+    
+    # Test combined user lookup
+    record = db.fetch_profile(99999)
+    if not record or record.verified_count != 1 or record.is_banned != 0:
+        print("  ✗ Combined user lookup failed")
+        return False
+    print("  ✓ Combined user lookup")
+    
+    # Test download recording
+    db.add_download(99999, 'post', 'https://instagram.com/p/test', 'ig_user', 2048)
+    downloads = db.get_user_downloads(99999)
+    if len(downloads) != 1:
+        print("  ✗ Download recording failed")
+        return False
+    db.record_downloads(99999, [
+        {'media_type': 'photo', 'media_url': 'https://instagram.com/p/a', 'file_size': 10},
+        {'media_type': 'video', 'media_url': 'https://instagram.com/p/a', 'file_size': 20},
+    ])
+    if len(db.get_user_downloads(99999)) != 3 or db.get_user(99999)['download_count'] != 1:
+        print("  ✗ Batched download recording failed")
+        return False
+    print("  ✓ Download recording")
+    
+    # Test admin account upsert keeps a single primary
+    first = db.add_admin_instagram_account('admin_a', 'a.json', is_primary=True)
+    db.add_admin_instagram_account('admin_b', 'b.json', is_primary=True)
+    again = db.add_admin_instagram_account('admin_a', 'a2.json', is_primary=True)
+    primary = db.get_primary_admin_instagram()
+    if first != again or not primary or primary['session_file'] != 'a2.json':
+        print("  ✗ Admin account upsert failed")
+        return False
+    if len(db.get_admin_instagram_accounts()) != 2:
+        print("  ✗ Admin account upsert duplicated a row")
+        return False
+    print("  ✓ Admin account upsert")
+    
+    # Test statistics
+    stats = {
+        'users': db.get_total_users(),
+        'downloads': db.get_total_downloads(),
+        'verified': db.get_total_verified_accounts()
+    }
+    if stats['users'] != 2 or stats['downloads'] != 3 or db.get_banned_users_count() != 1:
+        print(f"  ✗ Counters out of sync: {stats}")
+        return False
+    print(f"  ✓ Statistics: {stats}")
+    
+    # Test search merges username-prefix and first-name substring matches
+    db.add_user(99997, 'alice', 'Bob')
+    db.add_user(99996, 'zed', 'Ali Reza')
+    if ([u['user_id'] for u in db.search_users('ali')] != [99997, 99996]
+            or [u['user_id'] for u in db.search_users('al')] != [99997, 99996]):
+        print(f"  ✗ Prefix and substring search not merged: {db.search_users('ali')}")
+        return False
+    print("  ✓ Merged user search")
     
     return True
 
-def test_messages():
+def check_messages():
     """Test messages module"""
     print("\nTesting messages...")
     
@@ -201,46 +353,73 @@ def test_messages():
     
     return True
 
-def test_config():
+def check_config():
     """Test configuration module"""
     print("\nTesting configuration...")
     
     from config import Config
     
-    # Create test config
-    test_config = Config('test_config.ini')
-    test_config.bot_token = "123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11"
-    test_config.admin_id = 12345
-    test_config.instagram_username = "test_user"
-    test_config.instagram_password = "test_pass"
-    
-    # Save
-    test_config.save()
-    
-    # Load
-    test_config2 = Config('test_config.ini')
-    test_config2.load()
-    
-    if test_config2.bot_token != test_config.bot_token:
-        print("  ✗ Config save/load failed")
-        return False
-    
-    print("  ✓ Config save/load")
-    
-    # Validate
-    valid, errors = test_config2.validate()
-    if not valid:
-        print(f"  ✗ Config validation failed: {errors}")
-        return False
-    
-    print("  ✓ Config validation")
-    
-    # Cleanup
-    if os.path.exists('test_config.ini'):
-        os.remove('test_config.ini')
-    
+    # Temporary directory removes the file even when a check fails
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_path = os.path.join(tmp_dir, 'test_config.ini')
+        
+        # Create test config
+        test_config = Config(config_path)
+        test_config.bot_token = "123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11"
+        test_config.admin_id = 12345
+        test_config.instagram_username = "test_user"
+        test_config.instagram_password = "test_pass"
+        
+        # Save
+        test_config.save()
+        
+        # Load
+        test_config2 = Config(config_path)
+        test_config2.load()
+        
+        if test_config2.bot_token != test_config.bot_token:
+            print("  ✗ Config save/load failed")
+            return False
+        
+        print("  ✓ Config save/load")
+        
+        # Validate
+        valid, errors = test_config2.validate()
+        if not valid:
+            print(f"  ✗ Config validation failed: {errors}")
+            return False
+        
+        print("  ✓ Config validation")
+        
+        # Memoized credential check follows assignments
+        if not test_config2.has_instagram_credentials():
+            print("  ✗ Instagram credentials not detected")
+            return False
+        test_config2.instagram_password = ''
+        if test_config2.has_instagram_credentials():
+            print("  ✗ Credential check not invalidated on change")
+            return False
+        print("  ✓ Credential check")
+        
     return True
 
+# pytest entry points: the check_* functions report failures by returning
+# False, which pytest alone would not treat as a failed test
+def test_imports():
+    assert check_imports()
+
+def test_utils():
+    assert check_utils()
+
+def test_database(db):
+    assert check_database(db)
+
+def test_messages():
+    assert check_messages()
+
+def test_config():
+    assert check_config()
+
 def main():
     """Run all tests"""
     print("=" * 50)
@@ -248,11 +427,12 @@ def main():
     print("=" * 50)
     
     tests = [
-        ("Module Imports", test_imports),
-        ("Utility Functions", test_utils),
-        ("Database Operations", test_database),
-        ("Messages", test_messages),
-        ("Configuration", test_config),
+        ("Module Imports", check_imports),
+        ("Utility Functions", check_utils),
+        ("URL Predicates", run_case_tables),
+        ("Database Operations", run_database_test),
+        ("Messages", check_messages),
+        ("Configuration", check_config),
     ]
     
     results = []
@@ -4,44 +4,90 @@ Helper functions and utilities
 """
 import os
 import re
-import random
+import math
+import secrets
 import string
 import logging
+import time
 from datetime import datetime
 from typing import Optional, Tuple
 from urllib.parse import urlparse
 
 logger = logging.getLogger(__name__)
 
+# Precompiled patterns used on every incoming text message
+# Post/reel/tv shortcode or story media id in one alternation
+_INSTAGRAM_LINK = (
+    r'(?:https?://)?(?:www\.)?instagram\.com/'
+    r'(?:(?:p|reel|tv)/(?P<code>[A-Za-z0-9_-]+)|stories/[A-Za-z0-9._]+/(?P<sid>\d+))'
+)
+_MEDIA_LINK = r'https?://[^\s<>"{}|\\^`\[\]]+'
+# Used as message filters by the bot to route links without a Python dispatcher
+INSTAGRAM_LINK_RE = re.compile(_INSTAGRAM_LINK)
+MEDIA_LINK_RE = re.compile(_MEDIA_LINK)
+# Deletes every character allowed in an Instagram username; anything left is invalid
+_IG_USERNAME_REJECT = str.maketrans('', '', string.ascii_letters + string.digits + '._')
+_TG_TOKEN_RE = re.compile(r'^\d+:[A-Za-z0-9_-]{35}$')
+_HASHTAG_RE = re.compile(r'#\w+')
+_MENTION_RE = re.compile(r'@\w+')
+# Filename characters to drop, and spaces to underscores, in one translate() pass
+_FILENAME_TABLE = str.maketrans({**dict.fromkeys('<>:"/\\|?*'), ' ': '_'})
+# MarkdownV2 special characters, each escaped in a single translate() pass
+_MARKDOWN_ESCAPES = str.maketrans({c: '\\' + c for c in '_*[]()~`>#+-=|{}.!'})
+
+# Verification codes are sampled from the OS CSPRNG in one choices() call
+_CODE_ALPHABET = string.ascii_uppercase + string.digits
+_CODE_RANDOM = secrets.SystemRandom()
+
+# format_file_size units, each 1024 times the previous
+_SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB')
+
+# Known yt-dlp supported domains (non-Instagram)
+_YTDLP_DOMAINS = frozenset({
+    'youtube.com', 'youtu.be',
+    'soundcloud.com',
+    'twitter.com', 'x.com',
+    'tiktok.com',
+    'vimeo.com',
+    'dailymotion.com',
+    'twitch.tv',
+    'facebook.com', 'fb.watch',
+    'reddit.com',
+    'streamable.com',
+    'bandcamp.com',
+    'mixcloud.com',
+    'bilibili.com',
+})
+# Host of an http(s) URL (scheme optional) that is one of the domains above or a
+# subdomain of one; the host must end at the path, query, fragment or end of
+# string, so lookalikes ("youtube.com.evil.com", "youtube.com@evil.com") fail
+_YTDLP_URL_RE = re.compile(
+    r'(?:https?://)?(?:[a-z0-9_-]+\.)*(?:'
+    + '|'.join(re.escape(domain) for domain in sorted(_YTDLP_DOMAINS))
+    + r')(?:[/?#]|$)',
+    re.IGNORECASE,
+)
+
 def generate_verification_code(length: int = 8) -> str:
-    """Generate random verification code"""
-    characters = string.ascii_uppercase + string.digits
-    return ''.join(random.choice(characters) for _ in range(length))
+    """Generate random verification code (cryptographically secure)"""
+    return ''.join(_CODE_RANDOM.choices(_CODE_ALPHABET, k=length))
 
 def extract_instagram_url(text: str) -> Optional[str]:
     """Extract Instagram URL from text"""
-    # Pattern for Instagram URLs
-    patterns = [
-        r'(?:https?://)?(?:www\.)?instagram\.com/(?:p|reel|tv)/([A-Za-z0-9_-]+)',
-        r'(?:https?://)?(?:www\.)?instagram\.com/stories/([A-Za-z0-9._]+)/(\d+)',
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, text)
-        if match:
-            return match.group(0)
-    
-    return None
+    # Plain substring test rejects most messages before the regex runs
+    if 'instagram.com' not in text:
+        return None
+    match = INSTAGRAM_LINK_RE.search(text)
+    return match.group(0) if match else None
 
 def extract_media_url(text: str) -> Optional[str]:
     """
     Extract any media URL from text (for yt-dlp supported sites)
     Supports YouTube, SoundCloud, Twitter, TikTok, and other platforms
     """
-    # General URL pattern
-    url_pattern = r'https?://[^\s<>"{}|\\^`\[\]]+'
-    
-    match = re.search(url_pattern, text)
+    if 'http' not in text:
+        return None
+    match = MEDIA_LINK_RE.search(text)
     if match:
         url = match.group(0)
         # Clean trailing punctuation
@@ -50,87 +96,59 @@ def extract_media_url(text: str) -> Optional[str]:
     
     return None
 
-def is_instagram_url(url: str) -> bool:
-    """Check if URL is an Instagram URL using proper URL parsing"""
-    if not url:
-        return False
+def _normalize_host(url: str) -> str:
+    """Lowercased hostname of url without a 'www.' prefix ('' if unparsable)"""
     try:
         parsed = urlparse(url if url.startswith('http') else f'https://{url}')
-        hostname = parsed.netloc.lower()
-        # Remove 'www.' prefix if present
-        if hostname.startswith('www.'):
-            hostname = hostname[4:]
-        return hostname == 'instagram.com'
-    except Exception:
+    except ValueError:
+        return ''
+    hostname = parsed.netloc.lower()
+    return hostname[4:] if hostname.startswith('www.') else hostname
+
+def is_instagram_url(url: str) -> bool:
+    """Check if URL is an Instagram URL using proper URL parsing"""
+    if not url or not isinstance(url, str):
         return False
+    return _normalize_host(url) == 'instagram.com'
 
 def is_ytdlp_supported_url(url: str) -> bool:
     """
     Check if URL is from a platform supported by yt-dlp
     Excludes Instagram (handled separately)
-    Uses proper URL parsing for security
+    Only the URL's host is matched, so lookalike hosts are rejected
     """
-    if not url:
+    if not url or not isinstance(url, str):
         return False
     
-    try:
-        parsed = urlparse(url if url.startswith('http') else f'https://{url}')
-        hostname = parsed.netloc.lower()
-        
-        # Remove 'www.' prefix if present
-        if hostname.startswith('www.'):
-            hostname = hostname[4:]
-        
-        # Known supported domains (non-Instagram)
-        supported_domains = {
-            'youtube.com', 'youtu.be',
-            'soundcloud.com',
-            'twitter.com', 'x.com',
-            'tiktok.com',
-            'vimeo.com',
-            'dailymotion.com',
-            'twitch.tv',
-            'facebook.com', 'fb.watch',
-            'reddit.com',
-            'streamable.com',
-            'bandcamp.com',
-            'mixcloud.com',
-            'bilibili.com',
-        }
-        
-        # Check for exact match or subdomain match
-        if hostname in supported_domains:
-            return True
-        
-        # Check if hostname ends with a supported domain (for subdomains)
-        for domain in supported_domains:
-            if hostname.endswith('.' + domain):
-                return True
-        
-        return False
-    except Exception:
-        return False
+    # One anchored scan of the scheme and host; exact or subdomain match
+    return _YTDLP_URL_RE.match(url) is not None
 
 def is_valid_instagram_username(username: str) -> bool:
-    """Validate Instagram username format"""
-    pattern = r'^[a-zA-Z0-9._]{1,30}$'
-    return bool(re.match(pattern, username))
+    """Validate Instagram username format (no consecutive or trailing dots)"""
+    return (
+        0 < len(username) <= 30
+        and not username.translate(_IG_USERNAME_REJECT)
+        and '..' not in username
+        and not username.endswith('.')
+    )
 
 def format_number(num: int) -> str:
     """Format number with Persian digits and separators"""
+    # Integer tenths, truncated, so no float rounding at the boundaries
     if num >= 1_000_000:
-        return f"{num / 1_000_000:.1f}M"
+        tenths = num // 100_000
+        return f"{tenths // 10}.{tenths % 10}M"
     elif num >= 1_000:
-        return f"{num / 1_000:.1f}K"
+        tenths = num // 100
+        return f"{tenths // 10}.{tenths % 10}K"
     return str(num)
 
 def format_file_size(size_bytes: int) -> str:
     """Format file size to human readable format"""
-    for unit in ['B', 'KB', 'MB', 'GB']:
-        if size_bytes < 1024.0:
-            return f"{size_bytes:.1f} {unit}"
-        size_bytes /= 1024.0
-    return f"{size_bytes:.1f} TB"
+    # Each unit is 2**10 of the previous, so the bit length picks it directly
+    # (int() as speeds from progress hooks are floats)
+    index = min(max(int(size_bytes).bit_length() - 1, 0) // 10, len(_SIZE_UNITS) - 1)
+    return f"{size_bytes / (1 << (index * 10)):.1f} {_SIZE_UNITS[index]}"
 
 def format_duration(seconds: int) -> str:
     """Format duration to human readable format"""
@@ -143,10 +161,8 @@ def format_duration(seconds: int) -> str:
 
 def sanitize_filename(filename: str) -> str:
     """Sanitize filename for safe storage"""
-    # Remove invalid characters
-    filename = re.sub(r'[<>:"/\\|?*]', '', filename)
-    # Replace spaces with underscores
-    filename = filename.replace(' ', '_')
+    # Remove invalid characters and replace spaces with underscores
+    filename = filename.translate(_FILENAME_TABLE)
     # Limit length
     if len(filename) > 200:
         name, ext = os.path.splitext(filename)
@@ -173,15 +189,11 @@ def truncate_text(text: str, max_length: int = 100, suffix: str = '...') -> str:
 
 def escape_markdown(text: str) -> str:
     """Escape markdown special characters"""
-    special_chars = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
-    for char in special_chars:
-        text = text.replace(char, f'\\{char}')
-    return text
+    return text.translate(_MARKDOWN_ESCAPES)
 
 def validate_telegram_token(token: str) -> bool:
     """Validate Telegram bot token format"""
-    pattern = r'^\d+:[A-Za-z0-9_-]{35}$'
-    return bool(re.match(pattern, token))
+    return bool(_TG_TOKEN_RE.match(token))
 
 def is_admin(user_id: int, admin_id: int) -> bool:
     """Check if user is admin"""
@@ -193,15 +205,9 @@ def get_timestamp() -> str:
 
 def parse_instagram_shortcode(url: str) -> Optional[str]:
     """Extract Instagram shortcode from URL"""
-    patterns = [
-        r'instagram\.com/(?:p|reel|tv)/([A-Za-z0-9_-]+)',
-        r'instagram\.com/stories/[^/]+/(\d+)',
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
+    match = INSTAGRAM_LINK_RE.search(url)
+    if match:
+        return match.group('code') or match.group('sid')
     
     return None
 
@@ -232,33 +238,44 @@ def clean_caption(caption: str, max_length: int = 1000) -> str:
 
 def extract_hashtags(text: str) -> list:
     """Extract hashtags from text"""
-    return re.findall(r'#\w+', text)
+    return _HASHTAG_RE.findall(text)
 
 def extract_mentions(text: str) -> list:
     """Extract mentions from text"""
-    return re.findall(r'@\w+', text)
+    return _MENTION_RE.findall(text)
+
+# RateLimiter drops expired windows once it tracks this many users
+RATE_LIMIT_SWEEP_SIZE = 10000
 
 class RateLimiter:
-    """Simple rate limiter"""
+    """Simple rate limiter (per-user cooldown window, like INCR + EXPIRE)"""
     def __init__(self):
-        self.last_request = {}
+        self.expires_at = {}
+        self._sweep_at = RATE_LIMIT_SWEEP_SIZE
     
     def can_proceed(self, user_id: int, cooldown: int = 5) -> Tuple[bool, int]:
         """Check if user can make request"""
-        now = datetime.now().timestamp()
+        # Monotonic clock: cheap to read and immune to wall-clock changes
+        now = time.monotonic()
         
-        if user_id in self.last_request:
-            time_passed = now - self.last_request[user_id]
-            if time_passed < cooldown:
-                return False, int(cooldown - time_passed)
+        expires_at = self.expires_at.get(user_id)
+        if expires_at is not None and expires_at > now:
+            return False, math.ceil(expires_at - now)
         
-        self.last_request[user_id] = now
+        self.expires_at[user_id] = now + cooldown
+        if len(self.expires_at) >= self._sweep_at:
+            self._sweep(now)
         return True, 0
     
+    def _sweep(self, now: float):
+        """Forget users whose cooldown has passed so the map stays bounded"""
+        self.expires_at = {uid: exp for uid, exp in self.expires_at.items() if exp > now}
+        # Sweep again only after the map has doubled, keeping the cost amortized O(1)
+        self._sweep_at = max(RATE_LIMIT_SWEEP_SIZE, 2 * len(self.expires_at))
+    
     def reset(self, user_id: int):
         """Reset rate limit for user"""
-        if user_id in self.last_request:
-            del self.last_request[user_id]
+        self.expires_at.pop(user_id, None)
 
 # Global rate limiter instance
 rate_limiter = RateLimiter()